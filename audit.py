@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+Журнал оценок сигнала в колоночном формате.
+
+Каждая оценка calculate_signal — индикаторы, вклад каждой составляющей,
+score и уверенность — дописывается строкой в сегменты по SEGMENT_ROWS
+строк. Колонка сегмента — отдельный .npy, открытый через memmap: запись
+строки — присваивание в память, а отчёт читает с диска только нужные
+колонки. Цена через горизонт рынка (outcome) дописывается позже, когда
+тик доходит до этого момента; строки, оставшиеся без неё после
+перезапуска, досчитываются по свечам.
+
+Отчёт — попадание по составляющим, калибровка уверенности и корреляции
+признаков с будущим изменением цены:
+
+    python audit.py audit --market BTCUSDT:15 --since 7d
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+SEGMENT_ROWS = 1 << 16       # Строк в сегменте
+FLUSH_EVERY = 60             # Строк между записями meta.json
+RESOLVE_GRACE = 90           # Секунд опоздания, после которых цена берётся по свечам
+
+# Составляющие сигнала (ключи signal['components'])
+COMPONENTS = ('rsi', 'macd', 'vwap', 'momentum', 'flow', 'micro', 'tf_5m', 'tf_15m', 'tf_1h')
+
+COLUMNS = (
+    ('ts', np.float64),              # Момент оценки, секунды Unix
+    ('market', np.int16),            # Индекс в meta['markets']
+    ('horizon', np.int16),           # Минут до outcome
+    ('price', np.float64),
+    ('rsi', np.float32),
+    ('macd', np.float32),
+    ('vwap', np.float64),
+    ('momentum', np.float32),
+    ('volatility', np.float32),
+    ('buy_pressure', np.float32),
+    ('score', np.float32),
+    ('confidence', np.float32),
+) + tuple((f'c_{name}', np.float32) for name in COMPONENTS) + (
+    ('outcome', np.float64),         # Цена через horizon минут (NaN — ещё нет)
+)
+COLUMN_TYPES = dict(COLUMNS)
+
+
+def _meta_path(path):
+    return os.path.join(path, 'meta.json')
+
+
+def _column_path(path, segment, name):
+    return os.path.join(path, f"seg-{segment:05d}", f"{name}.npy")
+
+
+def load_meta(path):
+    try:
+        with open(_meta_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# ═══════════════════════════════════════════════════════════════
+# ЗАПИСЬ
+# ═══════════════════════════════════════════════════════════════
+
+class AuditLog:
+    """Дописывание оценок и досчёт outcome; вызывается из потока планировщика."""
+
+    def __init__(self, path, segment_rows=SEGMENT_ROWS):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.meta = load_meta(path) or {
+            'columns': [name for name, _ in COLUMNS],
+            'segment_rows': segment_rows,
+            'markets': [],
+            'segments': [],
+        }
+        self.segment_rows = self.meta['segment_rows']
+        self._market_ids = {key: i for i, key in enumerate(self.meta['markets'])}
+        self._maps = {}              # Сегмент → {колонка: memmap}
+        self._pending = {}           # Рынок → deque[(момент outcome, сегмент, строка)]
+        self._unflushed = 0
+        self.rows = sum(self.meta['segments'])
+        self._recover_pending()
+
+    # ───────────────────────────────────────────────────────────
+    # Интерфейс
+    # ───────────────────────────────────────────────────────────
+
+    def append(self, market, horizon, ts, price, signal, volatility=0.0):
+        """Дописывает оценку рынка market (ключ) в момент ts."""
+        segments = self.meta['segments']
+        if not segments or segments[-1] >= self.segment_rows:
+            self._new_segment()
+        segment = len(segments) - 1
+        row = segments[-1]
+        cols = self._columns(segment)
+        components = signal.get('components') or {}
+
+        cols['ts'][row] = ts
+        cols['market'][row] = self._market_id(market)
+        cols['horizon'][row] = horizon
+        cols['price'][row] = price
+        cols['rsi'][row] = signal['rsi']
+        cols['macd'][row] = signal['macd']
+        cols['vwap'][row] = signal['vwap']
+        cols['momentum'][row] = signal['momentum']
+        cols['volatility'][row] = volatility
+        cols['buy_pressure'][row] = signal.get('buy_pressure', 50)
+        cols['score'][row] = signal['score']
+        cols['confidence'][row] = signal['confidence']
+        for name in COMPONENTS:
+            cols[f'c_{name}'][row] = components.get(name, 0)
+        cols['outcome'][row] = np.nan
+
+        segments[-1] = row + 1
+        self.rows += 1
+        self._pending.setdefault(market, deque()).append((ts + horizon * 60, segment, row))
+        self._touch()
+
+    def resolve(self, market, ts, price, price_at=None):
+        """
+        Записывает price как outcome оценок рынка, чей горизонт истёк к ts.
+        price_at(момент) — цена для оценок, чей момент пропущен (перезапуск).
+        """
+        pending = self._pending.get(market)
+        resolved = 0
+        while pending and pending[0][0] <= ts:
+            due, segment, row = pending.popleft()
+            value = price
+            if ts - due > RESOLVE_GRACE:
+                value = price_at(due) if price_at is not None else None
+            if value:
+                self._columns(segment)['outcome'][row] = value
+                resolved += 1
+        if resolved:
+            self._touch()
+        return resolved
+
+    def flush(self):
+        """Сбрасывает memmap на диск и записывает meta.json."""
+        for cols in self._maps.values():
+            for column in cols.values():
+                column.flush()
+        tmp = f"{_meta_path(self.path)}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, _meta_path(self.path))
+        self._unflushed = 0
+
+    def close(self):
+        self.flush()
+        self._maps.clear()
+
+    # ───────────────────────────────────────────────────────────
+    # Внутреннее
+    # ───────────────────────────────────────────────────────────
+
+    def _touch(self):
+        self._unflushed += 1
+        if self._unflushed >= FLUSH_EVERY:
+            self.flush()
+
+    def _market_id(self, market):
+        market_id = self._market_ids.get(market)
+        if market_id is None:
+            market_id = self._market_ids[market] = len(self.meta['markets'])
+            self.meta['markets'].append(market)
+        return market_id
+
+    def _new_segment(self):
+        segment = len(self.meta['segments'])
+        os.makedirs(os.path.dirname(_column_path(self.path, segment, 'ts')), exist_ok=True)
+        self._maps[segment] = {
+            name: np.lib.format.open_memmap(_column_path(self.path, segment, name), mode='w+',
+                                            dtype=dtype, shape=(self.segment_rows,))
+            for name, dtype in COLUMNS
+        }
+        self.meta['segments'].append(0)
+        # Старые сегменты нужны только пока в них есть строки без outcome
+        live = {segment} | {s for queue in self._pending.values() for _, s, _ in queue}
+        for old in [s for s in self._maps if s not in live]:
+            for column in self._maps.pop(old).values():
+                column.flush()
+        self.flush()
+
+    def _columns(self, segment):
+        cols = self._maps.get(segment)
+        if cols is None:
+            cols = self._maps[segment] = {
+                name: np.load(_column_path(self.path, segment, name), mmap_mode='r+')
+                for name, _ in COLUMNS
+            }
+        return cols
+
+    def _recover_pending(self):
+        """Строки без outcome в последних двух сегментах — снова в очередь."""
+        segments = self.meta['segments']
+        markets = self.meta['markets']
+        for segment in range(max(0, len(segments) - 2), len(segments)):
+            rows = segments[segment]
+            if not rows:
+                continue
+            cols = self._columns(segment)
+            for row in np.flatnonzero(np.isnan(cols['outcome'][:rows])):
+                due = float(cols['ts'][row]) + int(cols['horizon'][row]) * 60
+                market = markets[int(cols['market'][row])]
+                self._pending.setdefault(market, deque()).append((due, segment, int(row)))
+
+# ═══════════════════════════════════════════════════════════════
+# ЧТЕНИЕ И ОТЧЁТ
+# ═══════════════════════════════════════════════════════════════
+
+def load_columns(path, names, market=None, since=None):
+    """
+    Колонки names по всем сегментам (memmap, копируются только отобранные
+    строки). market — ключ рынка, since — секунды Unix.
+    """
+    meta = load_meta(path)
+    if meta is None:
+        raise FileNotFoundError(f"{path}: нет meta.json")
+    market_id = None
+    if market is not None:
+        if market not in meta['markets']:
+            return {name: np.empty(0, dtype=COLUMN_TYPES[name]) for name in names}
+        market_id = meta['markets'].index(market)
+
+    parts = {name: [] for name in names}
+    for segment, rows in enumerate(meta['segments']):
+        if not rows:
+            continue
+        ts = np.load(_column_path(path, segment, 'ts'), mmap_mode='r')[:rows]
+        if since is not None and ts[rows - 1] < since:
+            continue
+        mask = np.ones(rows, dtype=bool)
+        if since is not None:
+            mask &= ts >= since
+        if market_id is not None:
+            mask &= np.load(_column_path(path, segment, 'market'), mmap_mode='r')[:rows] == market_id
+        for name in names:
+            column = np.load(_column_path(path, segment, name), mmap_mode='r')[:rows]
+            parts[name].append(column[mask])
+    return {name: np.concatenate(chunks) if chunks else np.empty(0, dtype=COLUMN_TYPES[name])
+            for name, chunks in parts.items()}
+
+
+def _wins(up, change):
+    """Исход как у ставки: UP выигрывает при росте, DOWN — при падении."""
+    return np.where(up, change > 0, change < 0)
+
+
+def component_hit_rates(data):
+    """Составляющая → (сколько раз голосовала, доля угаданных направлений %)."""
+    change = data['outcome'] - data['price']
+    result = {}
+    for name in COMPONENTS:
+        vote = data[f'c_{name}']
+        active = vote != 0
+        count = int(active.sum())
+        hits = _wins(vote[active] > 0, change[active])
+        result[name] = (count, float(hits.mean() * 100) if count else None)
+    return result
+
+
+def calibration(data, bucket=10):
+    """Корзина уверенности → (оценок, фактический win rate %)."""
+    change = data['outcome'] - data['price']
+    won = _wins(data['score'] > 0, change)
+    buckets = (np.minimum(data['confidence'], 100) // bucket).astype(np.int64)
+    counts = np.bincount(buckets, minlength=100 // bucket + 1)
+    wins = np.bincount(buckets, weights=won, minlength=100 // bucket + 1)
+    return {int(b * bucket): (int(counts[b]), float(wins[b] / counts[b] * 100))
+            for b in np.flatnonzero(counts)}
+
+
+def correlations(data):
+    """Признак → корреляция Пирсона с изменением цены за горизонт (%)."""
+    price = data['price']
+    target = (data['outcome'] - price) / price * 100
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vwap_diff = np.where(data['vwap'] > 0, (price - data['vwap']) / data['vwap'] * 100, 0.0)
+    features = {
+        'rsi': data['rsi'], 'macd': data['macd'], 'vwap_diff': vwap_diff,
+        'momentum': data['momentum'], 'volatility': data['volatility'],
+        'buy_pressure': data['buy_pressure'], 'score': data['score'],
+    }
+    features.update((f'c_{name}', data[f'c_{name}']) for name in COMPONENTS)
+    result = {}
+    centered_target = target - target.mean()
+    target_norm = np.sqrt((centered_target ** 2).sum())
+    for name, values in features.items():
+        centered = values.astype(np.float64) - values.mean()
+        norm = np.sqrt((centered ** 2).sum())
+        result[name] = float(centered @ centered_target / (norm * target_norm)) if norm and target_norm else None
+    return result
+
+
+def report(path, market=None, since=None):
+    names = ['ts', 'price', 'outcome', 'score', 'confidence', 'rsi', 'macd', 'vwap', 'momentum',
+             'volatility', 'buy_pressure'] + [f'c_{name}' for name in COMPONENTS]
+    started = time.perf_counter()
+    data = load_columns(path, names, market, since)
+    total = len(data['ts'])
+    resolved = ~np.isnan(data['outcome'])
+    data = {name: column[resolved] for name, column in data.items()}
+    elapsed = time.perf_counter() - started
+
+    lines = [f"━━━ 🔎 ОЦЕНКИ СИГНАЛА ━━━",
+             f"Строк: {total}, с исходом: {len(data['ts'])} (чтение {elapsed:.2f} с)"]
+    if not len(data['ts']):
+        return "\n".join(lines)
+
+    lines.append("\nСоставляющие (голосов | угадано):")
+    for name, (count, rate) in component_hit_rates(data).items():
+        if count:
+            lines.append(f"  {name:<10} {count:>9} | {rate:5.1f}%")
+
+    lines.append("\nКалибровка (уверенность → оценок | win rate):")
+    for bucket, (count, rate) in calibration(data).items():
+        lines.append(f"  {bucket:>3}%+ {count:>9} | {rate:5.1f}%")
+
+    lines.append("\nКорреляция с изменением цены за горизонт:")
+    for name, corr in sorted(correlations(data).items(), key=lambda item: -abs(item[1] or 0)):
+        if corr is not None:
+            lines.append(f"  {name:<14} {corr:+.3f}")
+    return "\n".join(lines)
+
+
+def parse_since(value):
+    """'7d' / '12h' / '90m' → секунды Unix от текущего момента."""
+    units = {'m': 60, 'h': 3600, 'd': 86400}
+    if value[-1] not in units:
+        raise argparse.ArgumentTypeError("ожидается число с m, h или d, например 7d")
+    return time.time() - float(value[:-1]) * units[value[-1]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Отчёт по журналу оценок сигнала")
+    parser.add_argument('path', help="Каталог журнала (AUDIT_DIR)")
+    parser.add_argument('--market', help="Ключ рынка, например BTCUSDT:15")
+    parser.add_argument('--since', type=parse_since, help="Только последние N m/h/d")
+    args = parser.parse_args(argv)
+    print(report(args.path, args.market, args.since))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
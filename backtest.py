@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бэктест стратегии на исторических минутных свечах BTCUSDT.
+
+Индикаторы считаются сразу по всему ряду массивами NumPy — минутные
+и старших интервалов TIMEFRAMES (бары собираются из минутных свечей, как
+в BarAggregator), ставки симулируются с теми же MIN_CONFIDENCE, размером
+ставки (size_bet) и моделью выплат (payout.py), что и в боте. Стакана
+в истории нет: доля покупателей постоянна (50%), flow_depth и micro_*
+на результат не влияют.
+
+    python backtest.py data/BTCUSDT-1m-2024-*.csv --curve curve.csv
+    python backtest.py data/*.csv --odds odds.csv --fee 0.02 --slippage 100:0.002,1000:0.01
+"""
+
+import argparse
+import glob
+import time
+
+import numpy as np
+
+import btc_telegram_bot as bot
+from bet_history import BetHistory
+from indicators import IndicatorEngine, timeframe_label
+from payout import entry_minute
+from sizing import KellySizer
+
+MINUTE_MS = 60_000
+
+# ═══════════════════════════════════════════════════════════════
+# ЗАГРУЗКА ДАННЫХ
+# ═══════════════════════════════════════════════════════════════
+
+KLINE_FIELDS = ('open_time', 'open', 'high', 'low', 'close', 'volume')
+
+
+def _load_csv(path):
+    """CSV в формате выгрузки Binance (с заголовком или без)."""
+    with open(path) as f:
+        first = f.readline()
+    skip = 0 if first[:1].isdigit() else 1
+    data = np.loadtxt(path, delimiter=',', skiprows=skip, usecols=range(6), dtype=np.float64, ndmin=2)
+    return {name: data[:, i] for i, name in enumerate(KLINE_FIELDS)}
+
+
+def _load_parquet(path):
+    import pandas as pd  # нужен только для Parquet
+    df = pd.read_parquet(path)
+    if not set(KLINE_FIELDS) <= set(df.columns):
+        df = df.iloc[:, :6]
+        df.columns = KLINE_FIELDS
+    return {name: df[name].to_numpy(dtype=np.float64) for name in KLINE_FIELDS}
+
+
+def load_klines(paths):
+    """
+    Загружает и склеивает файлы свечей, сортирует по времени и убирает
+    дубликаты. Время открытия приводится к миллисекундам.
+    """
+    parts = []
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            parts.append(_load_parquet(path) if path.endswith('.parquet') else _load_csv(path))
+    if not parts:
+        raise ValueError("Нет файлов со свечами")
+
+    klines = {name: np.concatenate([p[name] for p in parts]) for name in KLINE_FIELDS}
+
+    # С 2025 года Binance отдаёт время в микросекундах
+    open_time = klines['open_time']
+    open_time = np.where(open_time > 1e14, open_time // 1000, open_time).astype(np.int64)
+    klines['open_time'] = open_time
+
+    order = np.argsort(open_time, kind='stable')
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = np.diff(open_time[order]) != 0
+    return {name: arr[order][keep] for name, arr in klines.items()}
+
+# ═══════════════════════════════════════════════════════════════
+# ИНДИКАТОРЫ
+# ═══════════════════════════════════════════════════════════════
+
+def _rolling_sum(values, window):
+    """Сумма за последние window элементов (короче в начале ряда)."""
+    csum = np.cumsum(values)
+    out = csum.copy()
+    out[window:] -= csum[:-window]
+    return out
+
+
+def _ema(values, k):
+    """EMA с затравкой первым значением, операции как в calculate_macd."""
+    out = np.empty(len(values))
+    if len(values) == 0:
+        return out
+    prev = float(values[0])
+    out[0] = prev
+    keep = 1 - k
+    for i, p in enumerate(values.tolist()[1:], 1):
+        prev = (p * k) + (prev * keep)
+        out[i] = prev
+    return out
+
+
+def compute_indicators(klines, engine=None, timeframes=None):
+    """
+    RSI / MACD / VWAP / моментум на каждом баре — то же, что вернул бы
+    IndicatorEngine, прошедший ряд с первого бара (текущий бар — live).
+    'timeframes' — те же индикаторы старших интервалов (compute_timeframe),
+    как в снимке MultiTimeframeEngine; timeframes=None — bot.TIMEFRAMES.
+    """
+    engine = engine or IndicatorEngine()
+    timeframes = bot.TIMEFRAMES if timeframes is None else timeframes
+    close = klines['close']
+    n = len(close)
+    idx = np.arange(n)
+
+    # RSI: простые средние приращений за rsi_period
+    period = engine.rsi_period
+    deltas = np.diff(close, prepend=close[:1])
+    deltas[0] = 0.0
+    gains = _rolling_sum(np.where(deltas > 0, deltas, 0.0), period) / period
+    losses = _rolling_sum(np.where(deltas < 0, -deltas, 0.0), period) / period
+    loss_count = _rolling_sum((deltas < 0).astype(np.int64), period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = np.round(100 - (100 / (1 + gains / losses)), 1)
+    rsi = np.where(loss_count == 0, 100.0, rsi)
+    rsi = np.where(idx < period, 50.0, rsi)
+
+    # MACD
+    ema_fast = _ema(close, engine._k_fast)
+    ema_slow = _ema(close, engine._k_slow)
+    macd_line = ema_fast - ema_slow
+    signal = _ema(macd_line, engine._k_signal)
+    macd = np.where(idx < engine.macd_min_len - 1, 0.0, np.round(macd_line - signal, 2))
+
+    # VWAP за окно свечей
+    tp = (klines['high'] + klines['low'] + close) / 3
+    tp_vol = _rolling_sum(tp * klines['volume'], engine.window)
+    vol = _rolling_sum(klines['volume'], engine.window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vwap = np.where(vol > 0, np.round(tp_vol / vol, 2), 0.0)
+
+    # Моментум: цена против momentum_period-й с конца
+    mp = engine.momentum_period
+    momentum = np.zeros(n)
+    if n >= mp:
+        base = close[:n - mp + 1]
+        momentum[mp - 1:] = (close[mp - 1:] - base) / base * 100
+
+    return {
+        'rsi': rsi, 'macd': macd, 'vwap': vwap, 'momentum': momentum,
+        'timeframes': {
+            timeframe_label(minutes): compute_timeframe(klines, minutes, engine)
+            for minutes in sorted(set(timeframes)) if minutes > 1
+        },
+    }
+
+
+def _group_cumulative(values, first, sizes, op):
+    """
+    Накопленное op внутри каждой группы подряд идущих баров — по одному шагу
+    на позицию в группе, в том же порядке сложения, что и merge_bar.
+    """
+    out = values.copy()
+    for k in range(1, int(sizes.max(initial=1))):
+        idx = first[sizes > k] + k
+        out[idx] = op(out[idx - 1], values[idx])
+    return out
+
+
+def compute_timeframe(klines, minutes, engine=None):
+    """
+    Индикаторы интервала в minutes минут на каждом минутном баре — снимок
+    BarAggregator: закрытые бары интервала плюс текущий, собранный из минут
+    до этой включительно. 'bars' — число закрытых баров интервала.
+    """
+    engine = engine or IndicatorEngine()
+    open_time = klines['open_time']
+    close = klines['close']
+    n = len(close)
+    empty = {name: np.zeros(n) for name in ('rsi', 'macd', 'vwap', 'momentum', 'bars')}
+    if n == 0:
+        return empty
+
+    # Группы минут одного бара интервала (в ряду они идут подряд)
+    bar_ms = minutes * MINUTE_MS
+    start = open_time - open_time % bar_ms
+    new_bar = np.ones(n, dtype=bool)
+    new_bar[1:] = start[1:] != start[:-1]
+    first = np.flatnonzero(new_bar)
+    last = np.append(first[1:] - 1, n - 1)
+    sizes = last - first + 1
+    group = np.cumsum(new_bar) - 1
+
+    # Текущий бар на каждой минуте и закрытые бары (состояние на последней минуте)
+    high = _group_cumulative(klines['high'], first, sizes, np.maximum)
+    low = _group_cumulative(klines['low'], first, sizes, np.minimum)
+    volume = _group_cumulative(klines['volume'], first, sizes, np.add)
+    bar_close = close[last]
+    bar_tp_vol = (high[last] + low[last] + bar_close) / 3 * volume[last]
+
+    # Закрытых баров к минуте: все группы до текущей. Бар, оборванный пропуском
+    # минут, закрывается только следующей закрытой минутой — на первой минуте
+    # новой группы его ещё нет
+    closed = group.copy()
+    cut = open_time[last] + MINUTE_MS < start[first] + bar_ms
+    at_first = first[1:][cut[:-1]]
+    closed[at_first] -= 1
+    prev = np.maximum(closed - 1, 0)
+    has_prev = closed > 0
+    prev_close = np.where(has_prev, bar_close[prev], close)
+
+    # RSI: period - 1 последних закрытых приращений плюс приращение текущего бара
+    period = engine.rsi_period
+    deltas = np.diff(bar_close, prepend=bar_close[:1])
+    gains = _rolling_sum(np.where(deltas > 0, deltas, 0.0), period - 1)[prev]
+    losses = _rolling_sum(np.where(deltas < 0, -deltas, 0.0), period - 1)[prev]
+    loss_count = _rolling_sum((deltas < 0).astype(np.int64), period - 1)[prev]
+    live_delta = close - prev_close
+    gains = (gains + np.where(live_delta > 0, live_delta, 0.0)) / period
+    losses = (losses + np.where(live_delta < 0, -live_delta, 0.0)) / period
+    loss_count = loss_count + (live_delta < 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = np.round(100 - (100 / (1 + gains / losses)), 1)
+    rsi = np.where(loss_count == 0, 100.0, rsi)
+    rsi = np.where(closed < period, 50.0, rsi)
+
+    # MACD: шаг EMA закрытых баров ценой текущего
+    ema_fast = _ema(bar_close, engine._k_fast)
+    ema_slow = _ema(bar_close, engine._k_slow)
+    ema_signal = _ema(ema_fast - ema_slow, engine._k_signal)
+    fast = (close * engine._k_fast) + (ema_fast[prev] * (1 - engine._k_fast))
+    slow = (close * engine._k_slow) + (ema_slow[prev] * (1 - engine._k_slow))
+    signal = ((fast - slow) * engine._k_signal) + (ema_signal[prev] * (1 - engine._k_signal))
+    macd = np.where(closed < engine.macd_min_len - 1, 0.0, np.round((fast - slow) - signal, 2))
+
+    # VWAP: window - 1 последних закрытых баров плюс текущий
+    tp_vol = np.where(has_prev, _rolling_sum(bar_tp_vol, engine.window - 1)[prev], 0.0)
+    vol = np.where(has_prev, _rolling_sum(volume[last], engine.window - 1)[prev], 0.0)
+    tp_vol = tp_vol + (high + low + close) / 3 * volume
+    vol = vol + volume
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vwap = np.where(vol > 0, np.round(tp_vol / vol, 2), 0.0)
+
+    # Моментум: текущая цена против (momentum_period - 1)-го закрытого бара с конца
+    back = engine.momentum_period - 1
+    base = bar_close[np.maximum(closed - back, 0)]
+    momentum = np.where(closed < back, 0.0, (close - base) / base * 100)
+
+    return {'rsi': rsi, 'macd': macd, 'vwap': vwap, 'momentum': momentum,
+            'bars': closed.astype(np.float64)}
+
+
+def compute_volatility(close, engine=None):
+    """IndicatorEngine.volatility на каждом баре: std минутных доходностей (%)."""
+    window = (engine or IndicatorEngine()).volatility_period
+    returns = np.zeros(len(close))
+    returns[1:] = np.diff(close) / close[:-1] * 100
+    valid = np.ones(len(close))
+    valid[:1] = 0.0
+    count = _rolling_sum(valid, window)
+    s1 = _rolling_sum(returns, window)
+    s2 = _rolling_sum(returns * returns, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        var = (s2 - s1 * s1 / count) / (count - 1)
+    return np.where(count >= 2, np.sqrt(np.maximum(var, 0.0)), 0.0)
+
+# ═══════════════════════════════════════════════════════════════
+# СИГНАЛ
+# ═══════════════════════════════════════════════════════════════
+
+def _indicator_score(price, rsi, macd, vwap, momentum, p, scale=1.0):
+    """Векторная версия _score_indicators."""
+    macd_strong = p['macd_strong'] * scale
+    vwap_band = p['vwap_band'] * scale
+    momentum_band = p['momentum_band'] * scale
+
+    score = np.select(
+        [rsi < p['rsi_oversold'], rsi > p['rsi_overbought'], rsi < p['rsi_low'], rsi > p['rsi_high']],
+        [p['rsi_weight'], -p['rsi_weight'], p['rsi_soft_weight'], -p['rsi_soft_weight']], 0)
+    score += np.select(
+        [macd > macd_strong, macd > 0, macd < -macd_strong, macd < 0],
+        [p['macd_weight'], p['macd_soft_weight'], -p['macd_weight'], -p['macd_soft_weight']], 0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vwap_diff = np.where(vwap > 0, (price - vwap) / vwap * 100, 0.0)
+    score += np.where(vwap > 0, np.select(
+        [vwap_diff > vwap_band, vwap_diff > 0, vwap_diff < -vwap_band],
+        [p['vwap_weight'], p['vwap_soft_weight'], -p['vwap_weight']], -p['vwap_soft_weight']), 0)
+
+    score += np.select(
+        [momentum > momentum_band, momentum < -momentum_band],
+        [p['momentum_weight'], -p['momentum_weight']], 0)
+    return score
+
+
+def score_signals(price, ind, buy_pressure=50.0, params=None):
+    """
+    Векторная версия оценки из calculate_signal. Старшие интервалы
+    (ind['timeframes']) усредняются с минутной оценкой с весами tf_<интервал>_weight.
+    """
+    p = params or bot.SIGNAL_PARAMS
+    buy_pressure = np.broadcast_to(buy_pressure, price.shape)
+    score = _indicator_score(price, ind['rsi'], ind['macd'], ind['vwap'], ind['momentum'], p)
+
+    timeframes = ind.get('timeframes')
+    if timeframes:
+        total, weights = score.astype(np.float64), np.ones(len(score))
+        for label, tf in timeframes.items():
+            weight = p.get(f'tf_{label}_weight', 0)
+            if not weight:
+                continue
+            used = tf['bars'] >= bot.TIMEFRAME_MIN_BARS
+            tf_score = _indicator_score(price, tf['rsi'], tf['macd'], tf['vwap'], tf['momentum'], p,
+                                        scale=bot.TIMEFRAME_SCALES.get(label, 1.0))
+            total += np.where(used, weight * tf_score, 0.0)
+            weights += np.where(used, weight, 0.0)
+        score = np.round(total / weights).astype(np.int64)
+
+    score += np.select(
+        [buy_pressure > p['flow_buy'], buy_pressure < p['flow_sell']],
+        [p['flow_weight'], -p['flow_weight']], 0)
+
+    confidence = np.minimum(np.abs(score), 100)
+    return {'score': score, 'up': score > 0, 'confidence': confidence}
+
+# ═══════════════════════════════════════════════════════════════
+# СИМУЛЯЦИЯ СТАВОК
+# ═══════════════════════════════════════════════════════════════
+
+def simulate_bets(klines, signals, starting_balance=bot.STARTING_BALANCE,
+                  min_confidence=bot.MIN_CONFIDENCE,
+                  duration_minutes=bot.BET_DURATION_MINUTES,
+                  min_percent=bot.MIN_BET_PERCENT, max_percent=bot.MAX_BET_PERCENT,
+                  payout=None, volatility=None, sizing=None):
+    """
+    Проигрывает ставки как главный цикл: одна активная ставка, закрытие
+    на первом баре не раньше close_time, новая ставка — на том же баре.
+    payout — модель выплат (по умолчанию bot.payout_model), volatility —
+    compute_volatility по барам (по умолчанию считается здесь),
+    sizing — 'kelly' или 'linear' (по умолчанию bot.BET_SIZING).
+    """
+    payout = payout or bot.payout_model
+    sizing = sizing or bot.BET_SIZING
+    open_time = klines['open_time']
+    close = klines['close']
+    n = len(close)
+
+    candidates = np.flatnonzero(signals['confidence'] >= min_confidence)
+    close_idx_all = np.searchsorted(open_time, open_time + duration_minutes * MINUTE_MS)
+
+    # Исходы и множители выигрыша — сразу для всех баров-кандидатов
+    cand_close = np.minimum(close_idx_all[candidates], n - 1)
+    up = signals['up'][candidates]
+    change = close[cand_close] - close[candidates]
+    won = np.where(up, change > 0, change < 0)
+    if volatility is None:
+        volatility = compute_volatility(close)
+    vol = volatility[candidates]
+    # Бот входит на первом тике после закрытия бара сигнала — минутой позже его open_time
+    entry = (open_time[candidates] + MINUTE_MS) / 1000
+    gross = payout.gross(up, entry_minute(entry, duration_minutes), vol)
+    # Множитель без проскальзывания (с ним — пересчёт от суммы ставки)
+    net = payout.net(gross, 0.0)
+
+    # Келли учится на закрытых ставках по ходу прогона, как в боте
+    sizer = KellySizer(BetHistory(1, base=starting_balance)) if sizing == 'kelly' else None
+
+    balance = starting_balance
+    trades = []
+    free_from = 0
+    while True:
+        pos = int(np.searchsorted(candidates, free_from, side='left'))
+        if pos >= len(candidates):
+            break
+        i = int(candidates[pos])
+        j = int(close_idx_all[i])
+        if j >= n:
+            break
+
+        conf = int(signals['confidence'][i])
+        amount = bot.size_bet(conf, balance, sizer, float(net[pos]), float(vol[pos]),
+                              min_confidence, min_percent, max_percent)
+        if amount <= 0:
+            # Преимущества нет — следующий бар
+            free_from = i + 1
+            continue
+        multiple = float(net[pos] if payout.slippage is None else payout.net(gross[pos], amount))
+        pnl = amount * multiple if won[pos] else -amount * payout.lose_multiplier
+        balance += pnl
+        direction = 'UP' if up[pos] else 'DOWN'
+        trades.append((i, j, direction, conf, amount, multiple, pnl, bool(won[pos]), balance))
+        if sizer is not None:
+            sizer.history.append({'won': bool(won[pos]), 'direction': direction,
+                                  'entry_price': close[i], 'exit_price': close[j],
+                                  'price_change': close[j] - close[i], 'amount': amount,
+                                  'pnl': pnl, 'confidence': conf})
+        free_from = j
+
+    return _build_result(trades, n, starting_balance)
+
+
+def _build_result(trades, n_bars, starting_balance):
+    dtype = [('open_idx', np.int64), ('close_idx', np.int64), ('direction', 'U4'),
+             ('confidence', np.int64), ('amount', np.float64), ('payout', np.float64),
+             ('pnl', np.float64), ('won', bool), ('balance', np.float64)]
+    trades = np.array(trades, dtype=dtype)
+
+    # Баланс на каждом баре: значение после последнего закрытия до этого бара
+    curve = np.full(n_bars, float(starting_balance))
+    if len(trades):
+        marks = np.zeros(n_bars, dtype=np.int64)
+        marks[trades['close_idx']] = np.arange(1, len(trades) + 1)
+        last = np.maximum.accumulate(marks)
+        values = np.concatenate([[starting_balance], trades['balance']])
+        curve = values[last]
+
+    peak = np.maximum.accumulate(curve)
+    drawdown = (peak - curve) / peak * 100
+
+    wins = int(trades['won'].sum()) if len(trades) else 0
+    total = len(trades)
+    return {
+        'trades': trades,
+        'curve': curve,
+        'starting_balance': starting_balance,
+        'balance': float(curve[-1]) if n_bars else float(starting_balance),
+        'total_bets': total,
+        'wins': wins,
+        'losses': total - wins,
+        'win_rate': wins / total * 100 if total else 0.0,
+        'max_drawdown': float(drawdown.max()) if n_bars else 0.0,
+    }
+
+
+def run_backtest(klines, starting_balance=bot.STARTING_BALANCE, payout=None, sizing=None):
+    ind = compute_indicators(klines)
+    signals = score_signals(klines['close'], ind)
+    return simulate_bets(klines, signals, starting_balance, payout=payout, sizing=sizing)
+
+# ═══════════════════════════════════════════════════════════════
+# СВЕРКА С ЖИВЫМИ ФУНКЦИЯМИ
+# ═══════════════════════════════════════════════════════════════
+
+def verify(klines, bars):
+    """
+    Прогоняет первые bars баров через движок бота (bot.new_engine: минуты
+    и старшие интервалы) и calculate_signal и сравнивает с векторными
+    массивами. Возвращает число расхождений.
+    """
+    bars = min(bars, len(klines['close']))
+    sub = {name: arr[:bars] for name, arr in klines.items()}
+    ind = compute_indicators(sub)
+    signals = score_signals(sub['close'], ind)
+
+    engine = bot.new_engine()
+    mismatches = 0
+    for i in range(bars):
+        candle = {name: float(sub[name][i]) for name in KLINE_FIELDS}
+        candle['open_time'] = int(sub['open_time'][i])
+        live = engine.snapshot(candle)
+        signal = bot.calculate_signal(candle['close'], None, 50, live)
+        if signal['score'] != int(signals['score'][i]):
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"  бар {i}: живой score {signal['score']}, бэктест {int(signals['score'][i])}")
+        engine.update(candle)
+    return mismatches
+
+# ═══════════════════════════════════════════════════════════════
+# MAIN
+# ═══════════════════════════════════════════════════════════════
+
+def payout_line(result):
+    multiples = result['trades']['payout']
+    if not len(multiples):
+        return "—"
+    return f"{multiples.mean():.3f} (от {multiples.min():.3f} до {multiples.max():.3f})"
+
+
+def format_report(result, elapsed):
+    pnl = result['balance'] - result['starting_balance']
+    return f"""━━━ 📊 БЭКТЕСТ ━━━
+Баров: {len(result['curve'])} ({elapsed:.2f} с)
+Ставок: {result['total_bets']} | Win: {result['wins']} | Loss: {result['losses']}
+Win Rate: {result['win_rate']:.1f}%
+Множитель выигрыша: {payout_line(result)}
+Баланс: ${result['starting_balance']:.2f} → ${result['balance']:.2f} ({'+' if pnl >= 0 else ''}{pnl:.2f})
+Макс. просадка: {result['max_drawdown']:.1f}%"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бэктест BTC-бота на минутных свечах")
+    parser.add_argument('paths', nargs='+', help="CSV/Parquet файлы или маски")
+    parser.add_argument('--balance', type=float, default=bot.STARTING_BALANCE)
+    parser.add_argument('--curve', help="Сохранить кривую баланса в CSV")
+    parser.add_argument('--verify', type=int, default=0, metavar='BARS',
+                        help="Сверить первые BARS баров с calculate_signal")
+    parser.add_argument('--odds', help="CSV цен долей (по умолчанию PAYOUT_TABLE)")
+    parser.add_argument('--fee', type=float, help="Комиссия, доля суммы ставки (по умолчанию PAYOUT_FEE)")
+    parser.add_argument('--slippage', help="Кривая проскальзывания '$:доля,...' (по умолчанию PAYOUT_SLIPPAGE)")
+    parser.add_argument('--sizing', choices=('kelly', 'linear'),
+                        help="Размер ставки (по умолчанию BET_SIZING)")
+    args = parser.parse_args()
+
+    payout = bot.build_payout_model(args.odds, args.fee, args.slippage)
+    started = time.perf_counter()
+    klines = load_klines(args.paths)
+    result = run_backtest(klines, args.balance, payout, args.sizing)
+    elapsed = time.perf_counter() - started
+    print(format_report(result, elapsed))
+
+    if args.curve:
+        np.savetxt(args.curve, np.column_stack([klines['open_time'], result['curve']]),
+                   delimiter=',', fmt=['%d', '%.2f'], header='open_time,balance', comments='')
+
+    if args.verify:
+        mismatches = verify(klines, args.verify)
+        print(f"Сверка {args.verify} баров: расхождений {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
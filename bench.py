@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарки конвейера сигнала и полной итерации цикла.
+
+Замеряет задержку вызова (медиана, p95) и память (пик и остаток на вызов)
+для индикаторов, IndicatorEngine, стакана, calculate_signal, форматтеров
+сообщений и run_tick с подменённым вводом-выводом. Данные — фиксированные
+синтетические свечи и стакан или последние ответы из журнала записи.
+Результаты пишутся в JSON; при сравнении с прошлым прогоном замедление
+медианы больше порога считается регрессией (код выхода 1).
+
+    python bench.py --out bench.json
+    python bench.py --compare bench.json --threshold 15
+    python bench.py --capture capture.bin --filter signal
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+import btc_telegram_bot as bot
+import clock
+import metrics
+from capture import ReplayResponse, read_frames
+from indicators import IndicatorEngine, MultiTimeframeEngine
+from order_book import OrderBook
+from scheduler import Scheduler
+from transport import transport
+
+SEED = 20240101
+CANDLES = 100
+START_MS = 1_704_067_200_000          # 2024-01-01 00:00 UTC
+
+# ═══════════════════════════════════════════════════════════════
+# ДАННЫЕ
+# ═══════════════════════════════════════════════════════════════
+
+
+def synthetic_klines(n=CANDLES * 10, seed=SEED):
+    """Свечи в формате ответа Binance (строки), случайное блуждание."""
+    rnd = random.Random(seed)
+    price = 42_000.0
+    rows = []
+    for i in range(n):
+        open_ = price
+        price *= 1 + rnd.gauss(0, 0.0008)
+        high = max(open_, price) * (1 + abs(rnd.gauss(0, 0.0003)))
+        low = min(open_, price) * (1 - abs(rnd.gauss(0, 0.0003)))
+        rows.append([START_MS + i * 60_000, f"{open_:.2f}", f"{high:.2f}", f"{low:.2f}",
+                     f"{price:.2f}", f"{rnd.uniform(5, 50):.4f}"])
+    return rows
+
+
+def synthetic_depth(mid, levels=100, seed=SEED):
+    """Снимок стакана в формате /api/v3/depth."""
+    rnd = random.Random(seed)
+    return {
+        'lastUpdateId': 1,
+        'bids': [[f"{mid - 0.01 - i * 0.5:.2f}", f"{rnd.uniform(0.01, 3):.5f}"] for i in range(levels)],
+        'asks': [[f"{mid + 0.01 + i * 0.5:.2f}", f"{rnd.uniform(0.01, 3):.5f}"] for i in range(levels)],
+    }
+
+
+def recorded_fixtures(path):
+    """Последние свечи и стакан BTCUSDT из журнала записи."""
+    klines = depth = None
+    for _, key, status, body in read_frames(path):
+        if status != 200:
+            continue
+        if key.endswith('/klines?BTCUSDT'):
+            rows = json.loads(body)
+            klines = (klines or []) + rows
+        elif key.endswith('/depth?BTCUSDT'):
+            depth = json.loads(body)
+    if not klines or depth is None:
+        raise SystemExit(f"{path}: нет свечей или стакана BTCUSDT")
+    unique = {row[0]: row for row in klines}
+    return [unique[t] for t in sorted(unique)], depth
+
+
+class Fixtures:
+    def __init__(self, kline_rows, depth):
+        self.kline_rows = kline_rows
+        self.depth = depth
+        self.all_candles = [{
+            'open_time': int(k[0]), 'open': float(k[1]), 'high': float(k[2]),
+            'low': float(k[3]), 'close': float(k[4]), 'volume': float(k[5]),
+        } for k in kline_rows]
+        self.candles = self.all_candles[-CANDLES:]
+        self.closes = [c['close'] for c in self.candles]
+        self.price = self.closes[-1]
+        book = OrderBook()
+        book.load_snapshot(depth)
+        self.book = book
+        self.flow = book.flow()
+        self.indicators = IndicatorEngine().sync(self.candles)
+        self.mtf_indicators = MultiTimeframeEngine().sync(self.all_candles)
+        self.signal = bot.calculate_signal(self.price, self.candles, self.flow['buy_pressure'],
+                                           self.indicators, flow=self.flow)
+        now = datetime.fromtimestamp(self.candles[-1]['open_time'] / 1000, timezone.utc)
+        self.bet = {
+            'direction': 'UP', 'entry_price': self.price * 0.999, 'amount': 40.0,
+            'confidence': 55, 'open_time': now, 'close_time': now + timedelta(minutes=15),
+        }
+        self.bet_info = {'amount': 40.0, 'percent': 4.0}
+        self.result = dict(self.bet, status='closed', exit_price=self.price,
+                           price_change=self.price - self.bet['entry_price'],
+                           won=True, pnl=34.0)
+
+# ═══════════════════════════════════════════════════════════════
+# ИТЕРАЦИЯ ЦИКЛА
+# ═══════════════════════════════════════════════════════════════
+
+
+class StubExchange:
+    """
+    Подмена ReplayLog. Свечи: первый ответ — всё окно, дальше — две
+    последние свечи (дозагрузка кэша), окно сдвигается на минуту за итерацию.
+    """
+
+    def __init__(self, fx):
+        self.fx = fx
+        self.minute = 0
+        self.warm = False
+
+    def respond(self, key):
+        if '/klines' in key:
+            rows = self.fx.kline_rows
+            end = CANDLES + self.minute
+            size = 2 if self.warm else CANDLES
+            self.warm = True
+            return ReplayResponse(200, json.dumps(rows[end - size:end]).encode())
+        if '/depth' in key:
+            return ReplayResponse(200, json.dumps(self.fx.depth).encode())
+        return ReplayResponse(200, json.dumps({'price': str(self.fx.price)}).encode())
+
+    def value(self, key):
+        return self.fx.price
+
+
+def make_loop_iteration(fx):
+    """
+    run_tick основного рынка с подменённой сетью: разбор свечей и стакана,
+    индикаторы, сигнал, открытие ставки и форматирование сообщения.
+    """
+    stub = StubExchange(fx)
+    market = bot.default_market
+    start = fx.candles[-1]['open_time'] / 1000 + 61
+
+    def iteration():
+        stub.minute += 1
+        if CANDLES + stub.minute > len(fx.kline_rows):
+            # Свечи кончились — начинаем окно заново с холодного кэша
+            stub.minute, stub.warm = 1, False
+            bot.candle_caches.clear()
+        now = start + stub.minute * 60
+        clock.install(clock.VirtualClock(now))
+        market.simulation['portfolio'].clear()
+        market.last_tick_at = None
+        market.last_signal_time = None
+        bot.scheduler = Scheduler()
+        bot.run_tick(datetime.fromtimestamp(now, timezone.utc))
+
+    def setup():
+        transport.replay = stub
+        bot.CANDLE_CACHE_DIR = ""
+        bot.candle_caches.clear()
+        bot.markets[:] = [market]
+        bot.send_telegram = lambda message, chat_id=None: True
+        bot.broadcast = lambda message: 1
+        bot.log = metrics.log = lambda *args, **kwargs: None
+
+    return setup, iteration
+
+# ═══════════════════════════════════════════════════════════════
+# ЗАМЕРЫ
+# ═══════════════════════════════════════════════════════════════
+
+
+def benchmarks(fx):
+    """{имя: функция без аргументов}."""
+    engine = IndicatorEngine()
+    engine.sync(fx.all_candles[:CANDLES])
+    mtf_engine = MultiTimeframeEngine()
+    mtf_engine.sync(fx.all_candles[:CANDLES])
+    window = {'i': CANDLES, 'mtf': CANDLES}
+
+    def step(engine, key):
+        # Окно сдвигается на одну закрытую свечу — инкрементальный путь
+        i = window[key] = window[key] + 1 if window[key] < len(fx.all_candles) else CANDLES + 1
+        engine.sync(fx.all_candles[i - CANDLES:i])
+
+    def book_diff():
+        fx.book.apply_diff({'U': fx.book.last_update_id + 1, 'u': fx.book.last_update_id + 1,
+                            'b': [[fx.depth['bids'][3][0], "1.5"]], 'a': [[fx.depth['asks'][3][0], "0"]]})
+
+    return {
+        'indicator.rsi': lambda: bot.calculate_rsi(fx.closes),
+        'indicator.macd': lambda: bot.calculate_macd(fx.closes),
+        'indicator.vwap': lambda: bot.calculate_vwap(fx.candles),
+        'indicator.momentum': lambda: bot.get_momentum(fx.closes),
+        'engine.sync_full': lambda: IndicatorEngine().sync(fx.candles),
+        'engine.sync_step': lambda: step(engine, 'i'),
+        'engine.mtf_step': lambda: step(mtf_engine, 'mtf'),
+        'book.snapshot_flow': lambda: _load_book(fx.depth).flow(),
+        'book.diff': book_diff,
+        'book.flow': fx.book.flow,
+        'signal.recompute': lambda: bot.calculate_signal(fx.price, fx.candles, 50),
+        'signal.indicators': lambda: bot.calculate_signal(fx.price, fx.candles, 50, fx.indicators,
+                                                          flow=fx.flow),
+        'signal.timeframes': lambda: bot.calculate_signal(fx.price, fx.candles, 50, fx.mtf_indicators,
+                                                          flow=fx.flow),
+        # format.* — данные и текст (как при отправке), format.*.build — только данные
+        'format.new_bet': lambda: str(bot.format_new_bet_message(fx.price, fx.signal, fx.bet_info)),
+        'format.close_bet': lambda: str(bot.format_close_bet_message(fx.result, fx.price)),
+        'format.status': lambda: str(bot.format_status_message(fx.price, fx.signal)),
+        'format.waiting': lambda: str(bot.format_waiting_message(fx.price, fx.bet, 7.5)),
+        'format.new_bet.build': lambda: bot.format_new_bet_message(fx.price, fx.signal, fx.bet_info),
+        'format.status.build': lambda: bot.format_status_message(fx.price, fx.signal),
+    }
+
+
+def _load_book(depth):
+    book = OrderBook()
+    book.load_snapshot(depth)
+    return book
+
+
+def measure(fn, repeat=7, min_time=0.2):
+    """Медиана, p95 и среднее времени вызова (мкс) плюс память на вызов."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    samples = [t / number * 1e6 for t in timer.repeat(repeat=repeat, number=number)]
+    samples.sort()
+
+    tracemalloc.start()
+    fn()
+    base, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    calls = min(number, 50)
+    for _ in range(calls):
+        fn()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'calls': number * repeat,
+        'median_us': statistics.median(samples),
+        'p95_us': samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))],
+        'mean_us': statistics.fmean(samples),
+        'peak_bytes': peak - base,
+        'retained_bytes_per_call': (current - base) / calls,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Регрессии: [(имя, было мкс, стало мкс, % изменения)] при росте медианы > threshold %."""
+    regressions = []
+    for name, now in results.items():
+        before = baseline.get('results', {}).get(name)
+        if not before or before['median_us'] <= 0:
+            continue
+        change = (now['median_us'] - before['median_us']) / before['median_us'] * 100
+        if change > threshold:
+            regressions.append((name, before['median_us'], now['median_us'], change))
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(fx, name_filter=None, repeat=7, min_time=0.2):
+    results = {}
+    selected = {name: fn for name, fn in benchmarks(fx).items()
+                if not name_filter or name_filter in name}
+    for name, fn in selected.items():
+        results[name] = measure(fn, repeat, min_time)
+        print(_format_row(name, results[name]))
+
+    if not name_filter or name_filter in 'loop.iteration':
+        setup, iteration = make_loop_iteration(fx)
+        setup()
+        results['loop.iteration'] = measure(iteration, repeat, min_time)
+        print(_format_row('loop.iteration', results['loop.iteration']))
+    return results
+
+
+def _format_row(name, r):
+    return (f"{name:<22} {r['median_us']:>10.1f} мкс  p95 {r['p95_us']:>10.1f}  "
+            f"пик {r['peak_bytes'] / 1024:>8.1f} КБ")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки сигнала и цикла BTC-бота")
+    parser.add_argument('--out', help="Сохранить результаты в JSON")
+    parser.add_argument('--compare', help="JSON прошлого прогона для сравнения")
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help="Допустимый рост медианы, %% (по умолчанию 10)")
+    parser.add_argument('--capture', help="Взять свечи и стакан из журнала записи")
+    parser.add_argument('--filter', help="Только замеры, в имени которых есть строка")
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help="Секунд на одну серию замера")
+    args = parser.parse_args(argv)
+
+    if args.capture:
+        kline_rows, depth = recorded_fixtures(args.capture)
+    else:
+        kline_rows = synthetic_klines()
+        depth = synthetic_depth(float(kline_rows[-1][4]))
+    fx = Fixtures(kline_rows, depth)
+
+    results = run(fx, args.filter, args.repeat, args.min_time)
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'fixtures': args.capture or f"synthetic seed={SEED}",
+        },
+        'results': results,
+    }
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, now, change in regressions:
+            print(f"⚠️ Регрессия {name}: {before:.1f} → {now:.1f} мкс (+{change:.0f}%)")
+        if regressions:
+            return 1
+        print(f"Регрессий больше {args.threshold:.0f}% нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+История ставок с ограниченным окном в памяти и статистикой за O(1).
+
+Последние window ставок хранятся компактными записями (__slots__),
+более старые при желании выгружаются в CSV. Агрегаты — win rate,
+средний P&L, максимальная просадка, отношение mean/std (аналог Sharpe)
+и серии — обновляются при каждой ставке, общие и по корзинам уверенности.
+"""
+
+import csv
+import math
+from collections import deque
+
+RECORD_FIELDS = ('won', 'direction', 'entry_price', 'exit_price', 'price_change',
+                 'amount', 'pnl', 'confidence')
+
+
+class BetRecord:
+    """Закрытая ставка."""
+
+    __slots__ = RECORD_FIELDS
+
+    def __init__(self, won, direction, entry_price, exit_price, price_change,
+                 amount, pnl, confidence):
+        self.won = won
+        self.direction = direction
+        self.entry_price = entry_price
+        self.exit_price = exit_price
+        self.price_change = price_change
+        self.amount = amount
+        self.pnl = pnl
+        self.confidence = confidence
+
+    @classmethod
+    def from_result(cls, result):
+        return cls(*(result[field] for field in RECORD_FIELDS))
+
+    def to_dict(self):
+        data = {'status': 'closed'}
+        data.update((field, getattr(self, field)) for field in RECORD_FIELDS)
+        return data
+
+
+class RunningStats:
+    """Инкрементальные агрегаты по потоку ставок."""
+
+    __slots__ = ('count', 'wins', 'pnl_sum', 'mean', 'm2', 'equity', 'peak',
+                 'max_drawdown', 'max_drawdown_pct', 'streak', 'best_streak',
+                 'worst_streak', 'base')
+
+    def __init__(self, base=0.0):
+        """base — начальный депозит, от которого считается просадка в %."""
+        self.base = base
+        self.count = 0
+        self.wins = 0
+        self.pnl_sum = 0.0
+        self.mean = 0.0              # Среднее P&L (Уэлфорд)
+        self.m2 = 0.0                # Сумма квадратов отклонений
+        self.equity = 0.0            # Накопленный P&L
+        self.peak = 0.0
+        self.max_drawdown = 0.0      # В долларах
+        self.max_drawdown_pct = 0.0  # От пикового депозита
+        self.streak = 0              # > 0 — серия побед, < 0 — поражений
+        self.best_streak = 0
+        self.worst_streak = 0
+
+    def add(self, won, pnl):
+        self.count += 1
+        if won:
+            self.wins += 1
+        self.pnl_sum += pnl
+
+        delta = pnl - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (pnl - self.mean)
+
+        self.equity += pnl
+        if self.equity > self.peak:
+            self.peak = self.equity
+        drawdown = self.peak - self.equity
+        if drawdown > self.max_drawdown:
+            self.max_drawdown = drawdown
+        if self.base + self.peak > 0:
+            self.max_drawdown_pct = max(self.max_drawdown_pct,
+                                        drawdown / (self.base + self.peak) * 100)
+
+        if won:
+            self.streak = self.streak + 1 if self.streak > 0 else 1
+            self.best_streak = max(self.best_streak, self.streak)
+        else:
+            self.streak = self.streak - 1 if self.streak < 0 else -1
+            self.worst_streak = max(self.worst_streak, -self.streak)
+
+    @property
+    def losses(self):
+        return self.count - self.wins
+
+    @property
+    def win_rate(self):
+        return (self.wins / self.count * 100) if self.count > 0 else 0
+
+    @property
+    def drawdown_pct(self):
+        """Текущая просадка от пикового депозита, %."""
+        top = self.base + self.peak
+        return (self.peak - self.equity) / top * 100 if top > 0 else 0.0
+
+    @property
+    def avg_pnl(self):
+        return self.mean if self.count > 0 else 0
+
+    @property
+    def std_pnl(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0
+
+    @property
+    def sharpe(self):
+        """Средний P&L на ставку, делённый на его стандартное отклонение."""
+        std = self.std_pnl
+        return self.mean / std if std > 0 else 0
+
+    def to_state(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_state(cls, state):
+        stats = cls()
+        for name, value in state.items():
+            if name in cls.__slots__:
+                setattr(stats, name, value)
+        return stats
+
+
+class BetHistory:
+    """Окно последних ставок плюс общие и корзинные агрегаты."""
+
+    def __init__(self, window=500, spill_path=None, bucket_size=10, base=0.0):
+        """
+        window — сколько ставок держать в памяти;
+        spill_path — CSV, куда дописываются вытесненные из окна ставки
+        (None — не сохранять, например когда архив уже ведёт StateStore);
+        bucket_size — ширина корзины уверенности в процентах.
+        """
+        self.window = window
+        self.spill_path = spill_path
+        self.bucket_size = bucket_size
+        self.base = base
+        self._records = deque()
+        self.stats = RunningStats(base)
+        self.buckets = {}
+
+    def append(self, result):
+        """Добавляет закрытую ставку (словарь из settle_due_bets)."""
+        record = BetRecord.from_result(result)
+        self._push(record)
+        self.stats.add(record.won, record.pnl)
+        bucket = self.bucket_of(record.confidence)
+        if bucket not in self.buckets:
+            self.buckets[bucket] = RunningStats(self.base)
+        self.buckets[bucket].add(record.won, record.pnl)
+
+    def load_recent(self, results):
+        """Заполняет окно ставками без пересчёта агрегатов (при восстановлении)."""
+        for result in results:
+            self._push(BetRecord.from_result(result))
+
+    def _push(self, record):
+        self._records.append(record)
+        if len(self._records) > self.window:
+            evicted = self._records.popleft()
+            if self.spill_path:
+                self._spill(evicted)
+
+    def _spill(self, record):
+        with open(self.spill_path, 'a', newline='') as f:
+            csv.writer(f).writerow(getattr(record, field) for field in RECORD_FIELDS)
+
+    def bucket_of(self, confidence):
+        return int(confidence // self.bucket_size * self.bucket_size)
+
+    def bucket_stats(self, confidence):
+        """Агрегаты корзины, в которую попадает уверенность (или None)."""
+        return self.buckets.get(self.bucket_of(confidence))
+
+    def recent(self, n):
+        """Последние n ставок словарями, от старых к новым."""
+        n = min(n, len(self._records))
+        return [self._records[i].to_dict() for i in range(len(self._records) - n, len(self._records))]
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return (record.to_dict() for record in self._records)
+
+    def __getitem__(self, index):
+        return self._records[index].to_dict()
+
+    def to_state(self):
+        """Агрегаты для снимка состояния (сами ставки хранятся отдельно)."""
+        return {
+            'stats': self.stats.to_state(),
+            'buckets': {str(k): v.to_state() for k, v in self.buckets.items()},
+        }
+
+    def restore(self, state):
+        self.stats = RunningStats.from_state(state['stats'])
+        self.buckets = {int(k): RunningStats.from_state(v) for k, v in state['buckets'].items()}
@@ -5,10 +5,39 @@ Bitcoin Up or Down — Telegram Bot v3
 Симуляция 15-минутных ставок в стиле Polymarket
 """
 
-import requests
+import atexit
+import itertools
+import json
 import time
 import os
+import statistics
+import threading
+from concurrent.futures import (
+    FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed, wait
+)
 from datetime import datetime, timezone, timedelta
+from functools import partial
+
+import clock
+import messages
+import metrics
+from audit import AuditLog
+from capture import CaptureWriter, ReplayLog
+from candle_cache import CandleCache
+from indicators import MultiTimeframeEngine, timeframe_label
+from market_feed import MarketFeed
+from markets import Market, build_markets, group_by_symbol, new_simulation
+from messages import Message, render_text, stats_snapshot
+from metrics import log, registry
+from order_book import FLOW_DEPTHS, OrderBook
+from payout import FlatOdds, OddsTable, PayoutModel, SlippageCurve, entry_minute
+from state_store import StateStore
+from subscribers import SubscriberRegistry
+from scheduler import PRIORITY_HIGH, PRIORITY_LOW, Scheduler
+from sizing import KellySizer
+from telegram_commands import CommandPoller
+from telegram_outbox import PRIORITY_LOW as OUTBOX_PRIORITY_LOW, TelegramOutbox
+from transport import http_get, http_post, transport
 
 # ═══════════════════════════════════════════════════════════════
 # НАСТРОЙКИ
@@ -17,8 +46,79 @@ from datetime import datetime, timezone, timedelta
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN", "8567469797:AAFKfSKciZBmL1TNvOzWwRKETaRWIxbvdqc")
 CHAT_ID = os.getenv("CHAT_ID", "440615055")
 
-# Интервал проверки (каждую минуту проверяем, не пора ли закрыть ставку)
-CHECK_INTERVAL = 60  # 1 минута
+# Интервал оценки сигнала: на закрытии каждой минутной свечи
+CHECK_INTERVAL = 60          # 1 минута
+SIGNAL_OFFSET_SECONDS = 1.0  # Через сколько секунд после закрытия свечи
+REMINDER_MINUTES = (10, 5, 1)  # Статус активной ставки за N минут до закрытия
+SETTLE_RETRY_SECONDS = 5     # Повтор закрытия, если цена недоступна
+
+# Склеивать сообщения в чат, пришедшие с разницей меньше N секунд (0 — не склеивать)
+OUTBOX_MERGE_SECONDS = float(os.getenv("OUTBOX_MERGE_SECONDS", "0"))
+# Потоков доставки сообщений (рассылка подписчикам идёт параллельно, в общих лимитах)
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "4"))
+# Чаты администраторов через запятую: им доступны все команды (/set, /pause, /sub ...)
+ADMIN_CHATS = [chat.strip() for chat in os.getenv("ADMIN_CHATS", CHAT_ID).split(",") if chat.strip()]
+# Подписка из любого чата командой /subscribe. По умолчанию закрыта: подписчиков
+# добавляют администраторы (/sub add), остальные чаты бот не слушает
+OPEN_SUBSCRIPTION = os.getenv("OPEN_SUBSCRIPTION", "0") == "1"
+
+# Потоковый режим: рыночные данные из WebSocket Binance, REST — запасной вариант
+STREAM_MODE = os.getenv("STREAM_MODE", "0") == "1"
+
+# Получение цены: все источники опрашиваются одновременно
+PRICE_MODE = os.getenv("PRICE_MODE", "fastest")            # fastest | median
+PRICE_QUORUM_MS = int(os.getenv("PRICE_QUORUM_MS", "1500"))  # Окно сбора котировок для median
+PRICE_MAX_DEVIATION = 1.0    # Котировка дальше этого (%) от эталона — выброс
+PRICE_TIMEOUT = 10           # Общий лимит ожидания цены (секунд)
+
+# Файл базы состояния (баланс, активная ставка, история переживают перезапуск)
+STATE_DB = os.getenv("STATE_DB", "bot_state.db")
+
+# История ставок: сколько последних держать в памяти и куда выгружать старые
+# (пусто — не выгружать: полный архив и так лежит в STATE_DB)
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", "500"))
+HISTORY_SPILL = os.getenv("HISTORY_SPILL", "")
+
+# Свечи: размер окна и каталог, где окно хранится между запусками (пусто — не хранить)
+CANDLE_LIMIT = int(os.getenv("CANDLE_LIMIT", "100"))
+CANDLE_CACHE_DIR = os.getenv("CANDLE_CACHE_DIR", "candle_cache")
+
+# Журнал оценок сигнала для python audit.py (пусто — не писать)
+AUDIT_DIR = os.getenv("AUDIT_DIR", "audit")
+
+# Старшие интервалы сигнала в минутах (бары собираются из минутных свечей; пусто — только 1m)
+TIMEFRAMES = [int(m) for m in os.getenv("TIMEFRAMES", "5,15,60").split(",") if m.strip()]
+TIMEFRAME_BARS = 35          # Баров истории на самом длинном интервале (хватает для MACD)
+TIMEFRAME_MIN_BARS = 15      # Меньше баров — интервал в сигнале не учитывается (RSI-период + 1)
+# Пороги MACD/VWAP/моментума на интервале — в √минут раз шире минутных
+TIMEFRAME_SCALES = {timeframe_label(m): m ** 0.5 for m in TIMEFRAMES}
+
+# Дополнительные рынки «символ:минуты» через запятую, например "ETHUSDT:15,SOLUSDT:5".
+# Основной рынок — BTCUSDT на BET_DURATION_MINUTES
+EXTRA_MARKETS = os.getenv("EXTRA_MARKETS", "")
+
+# Метрики Prometheus на http://METRICS_HOST:METRICS_PORT/metrics (порт 0 — выключено)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# Логи строками JSON вместо обычного текста
+JSON_LOGS = os.getenv("JSON_LOGS", "0") == "1"
+
+# Команды из чата (/status, /history, /pause, /resume, /set, /lang, /style, /subscribers, /sub) через getUpdates
+COMMANDS_ENABLED = os.getenv("COMMANDS_ENABLED", "1") == "1"
+
+# Вариант сообщений по умолчанию: язык ru|en, подробность verbose|compact
+# (в чате меняется командами /lang и /style)
+MESSAGE_LANG = os.getenv("MESSAGE_LANG", "ru")
+MESSAGE_STYLE = os.getenv("MESSAGE_STYLE", "verbose")
+messages.DEFAULT_VARIANT = (MESSAGE_LANG, MESSAGE_STYLE)
+
+# Запись рыночных данных в журнал (пусто — не записывать)
+CAPTURE_PATH = os.getenv("CAPTURE_PATH", "")
+# Воспроизведение журнала вместо сети; REPLAY_SPEED — во сколько раз быстрее
+# реального времени (0 — без ожидания)
+REPLAY_PATH = os.getenv("REPLAY_PATH", "")
+REPLAY_SPEED = float(os.getenv("REPLAY_SPEED", "0"))
 
 # Настройки ставок
 STARTING_BALANCE = 1000      # Начальный депозит
@@ -27,124 +127,534 @@ MIN_BET_PERCENT = 3          # Минимальный размер ставки
 MAX_BET_PERCENT = 5          # Максимальный размер ставки (% от депозита)
 BET_DURATION_MINUTES = 15    # Длительность ставки (минут)
 
+# Портфель: сколько ставок рынка может быть открыто одновременно (1 — по одной, как раньше)
+# и предел суммы открытых ставок в % от баланса
+MAX_OPEN_BETS = int(os.getenv("MAX_OPEN_BETS", "1"))
+MAX_EXPOSURE_PERCENT = float(os.getenv("MAX_EXPOSURE_PERCENT", "20"))
+
+# Размер ставки: 'kelly' — дробный Келли по win rate корзины уверенности (sizing.py),
+# пока в корзине мало закрытых ставок — линейно по уверенности; 'linear' — всегда линейно.
+# Ставка по Келли ограничена сверху MAX_BET_PERCENT, линейная — MIN_BET_PERCENT..MAX_BET_PERCENT
+BET_SIZING = os.getenv("BET_SIZING", "kelly")
+KELLY_FRACTION = float(os.getenv("KELLY_FRACTION", "0.25"))          # Доля полного Келли
+VOL_TARGET = float(os.getenv("VOL_TARGET", "0.1"))                   # % за минуту; выше — ставка меньше
+MAX_DRAWDOWN_PERCENT = float(os.getenv("MAX_DRAWDOWN_PERCENT", "30"))  # К этой просадке ставка вдвое меньше
+
+# Веса и пороги сигнала
+SIGNAL_PARAMS = {
+    'rsi_weight': 25,         # RSI за границами 30/70
+    'rsi_soft_weight': 15,    # RSI за границами 40/60
+    'rsi_oversold': 30,
+    'rsi_low': 40,
+    'rsi_high': 60,
+    'rsi_overbought': 70,
+    'macd_weight': 25,        # |MACD| больше macd_strong
+    'macd_soft_weight': 15,
+    'macd_strong': 100,
+    'vwap_weight': 20,        # Цена дальше vwap_band % от VWAP
+    'vwap_soft_weight': 10,
+    'vwap_band': 0.3,
+    'momentum_weight': 15,
+    'momentum_band': 0.3,     # Моментум, %
+    'flow_weight': 15,
+    'flow_buy': 55,           # Доля покупателей в стакане, %
+    'flow_sell': 45,
+    'flow_depth': 10,         # Глубина дисбаланса ликвидности (одна из order_book.FLOW_DEPTHS)
+    'micro_weight': 5,        # Microprice смещена от середины
+    'micro_tilt': 0.5,        # Смещение в долях полуспреда
+    # Вес индикаторов старших интервалов относительно минутных (1.0); 0 — не учитывать.
+    # Пороги MACD/VWAP/моментума на интервале масштабируются на √минут
+    'tf_5m_weight': 0.5,
+    'tf_15m_weight': 0.5,
+    'tf_1h_weight': 0.25,
+}
+
+# Глубина REST-снимка стакана (в потоковом режиме стакан ведётся по diff-потоку)
+ORDERBOOK_DEPTH = 100
+
 # Коэффициенты выплат Polymarket (примерные)
 WIN_MULTIPLIER = 0.85        # При выигрыше получаем +85% от ставки
 LOSE_MULTIPLIER = 1.0        # При проигрыше теряем 100% ставки
 
+# Модель выплат (payout.py): цена доли Up/Down по минуте входа в окно и режиму
+# волатильности из CSV-таблицы, комиссия и проскальзывание от размера ставки.
+# Без таблицы выигрыш считается по WIN_MULTIPLIER
+PAYOUT_TABLE = os.getenv("PAYOUT_TABLE", "")
+PAYOUT_FEE = float(os.getenv("PAYOUT_FEE", "0"))              # Доля суммы ставки
+PAYOUT_SLIPPAGE = os.getenv("PAYOUT_SLIPPAGE", "")           # '$ заявки:доля цены,...', напр. '100:0.002,1000:0.01'
+
 # ═══════════════════════════════════════════════════════════════
 # ГЛОБАЛЬНЫЕ ПЕРЕМЕННЫЕ
 # ═══════════════════════════════════════════════════════════════
 
-simulation = {
-    'balance': STARTING_BALANCE,
-    'total_bets': 0,
-    'wins': 0,
-    'losses': 0,
-    'active_bet': None,      # Текущая активная ставка
-    'history': [],           # История ставок
-    'total_profit': 0
-}
+simulation = new_simulation(STARTING_BALANCE, HISTORY_WINDOW, HISTORY_SPILL or None)
+
+
+def new_engine():
+    """Движок индикаторов символа: минуты и старшие интервалы TIMEFRAMES."""
+    return MultiTimeframeEngine(TIMEFRAMES)
+
+
+# Основной рынок работает с simulation; остальные — со своими симуляциями
+default_market = Market("BTCUSDT", BET_DURATION_MINUTES, simulation, engine=new_engine(),
+                        is_default=True)
+markets = build_markets(default_market, EXTRA_MARKETS, STARTING_BALANCE, HISTORY_WINDOW,
+                        HISTORY_SPILL or None, engine_factory=new_engine)
+
+# Окно минутных свечей: CANDLE_LIMIT, но не меньше истории для старших интервалов
+CANDLE_HISTORY = max(CANDLE_LIMIT, default_market.engine.history_minutes(TIMEFRAME_BARS))
 
-price_history = []
-last_signal_time = None
+
+def build_payout_model(table=None, fee=None, slippage=None):
+    """Модель выплат из настроек PAYOUT_* (аргументы переопределяют их, например в бэктесте)."""
+    table = PAYOUT_TABLE if table is None else table
+    fee = PAYOUT_FEE if fee is None else fee
+    slippage = PAYOUT_SLIPPAGE if slippage is None else slippage
+    odds = OddsTable.load(table) if table else FlatOdds(WIN_MULTIPLIER)
+    return PayoutModel(odds, fee, SlippageCurve.parse(slippage) if slippage else None,
+                       LOSE_MULTIPLIER)
+
+
+payout_model = build_payout_model()
+
+scheduler = Scheduler()
+market_feed = None
+state_store = None
+telegram_outbox = None
+command_poller = None
+audit_log = None             # AuditLog; None — оценки сигнала не записываются
+subscribers = None           # SubscriberRegistry; до запуска сообщения идут только в CHAT_ID
+sizers = {}                  # market.key → KellySizer
+process_started = time.monotonic()
+first_signal_seconds = None  # От запуска до первого сигнала (btcbot_time_to_first_signal_seconds)
+trading_paused = False       # /pause: новые ставки не открываются, открытые закрываются
+
+# ═══════════════════════════════════════════════════════════════
+# МЕТРИКИ
+# ═══════════════════════════════════════════════════════════════
+
+STAGE_SECONDS = registry.histogram(
+    "btcbot_stage_seconds", "Длительность этапов цикла (price, candles, orderbook, signal, telegram, tick, settle)")
+PRICE_SOURCE_SECONDS = registry.histogram(
+    "btcbot_price_source_seconds", "Задержка запроса цены к источнику")
+PRICE_SOURCE_ERRORS = registry.counter(
+    "btcbot_price_source_errors_total", "Ошибки и пустые ответы источника цены")
+PRICE_SOURCE_REJECTED = registry.counter(
+    "btcbot_price_source_rejected_total", "Котировки источника, отброшенные как выброс")
+DATA_FALLBACKS = registry.counter(
+    "btcbot_data_fallback_total", "Переходы на запасной способ получения данных")
+SETTLE_LAG_SECONDS = registry.histogram(
+    "btcbot_settle_lag_seconds", "Опоздание фактического закрытия ставки относительно close_time")
+BETS_CLOSED = registry.counter("btcbot_bets_closed_total", "Закрытые ставки")
+
+
+def _collect_balance():
+    return [({'market': m.key}, m.simulation['balance']) for m in markets]
+
+
+def _collect_bet_age():
+    now = clock.utcnow()
+    result = []
+    for m in markets:
+        ages = [(now - bet['open_time']).total_seconds() for bet in m.simulation['portfolio']]
+        result.append(({'market': m.key}, max(ages, default=0)))
+    return result
+
+
+def _collect_portfolio():
+    result = []
+    for m in markets:
+        portfolio = m.simulation['portfolio']
+        result.append(({'market': m.key, 'stat': 'open'}, len(portfolio)))
+        result.append(({'market': m.key, 'stat': 'exposure'}, portfolio.exposure))
+        result.append(({'market': m.key, 'stat': 'unrealized'},
+                       portfolio.unrealized(LOSE_MULTIPLIER)))
+    return result
+
+
+def _collect_scheduler_lag():
+    return [({'job': name}, lag) for name, lag in list(scheduler.lag.items())]
+
+
+def _collect_outbox():
+    if telegram_outbox is None:
+        return []
+    stats = telegram_outbox.snapshot()
+    return [({'stat': name}, value) for name, value in stats.items() if value is not None]
+
+
+def _collect_subscriber_lag():
+    if telegram_outbox is None:
+        return []
+    return [({'chat': chat_id}, lag) for chat_id, lag in telegram_outbox.lag_by_chat().items()]
+
+
+def _collect_subscribers():
+    return [({}, len(subscribers) if subscribers is not None else 1)]
+
+
+registry.gauge("btcbot_balance_dollars", "Баланс симуляции", _collect_balance)
+registry.gauge("btcbot_open_bet_age_seconds", "Возраст самой старой открытой ставки (0 — ставок нет)",
+               _collect_bet_age)
+registry.gauge("btcbot_portfolio", "Открытые ставки: open, exposure, unrealized", _collect_portfolio)
+SETTLE_LAG = registry.gauge("btcbot_last_settle_lag_seconds", "Опоздание последнего закрытия ставки")
+FIRST_SIGNAL = registry.gauge("btcbot_time_to_first_signal_seconds",
+                              "От запуска процесса до первого рассчитанного сигнала")
+registry.gauge("btcbot_scheduler_lag_seconds", "Опоздание последнего запуска задачи", _collect_scheduler_lag)
+registry.gauge("btcbot_telegram_outbox", "Очередь Telegram: depth, sent, failed, latency", _collect_outbox)
+registry.gauge("btcbot_subscriber_lag_seconds", "Сглаженная задержка доставки по чатам", _collect_subscriber_lag)
+registry.gauge("btcbot_subscribers", "Подписчиков рассылки", _collect_subscribers)
 
 # ═══════════════════════════════════════════════════════════════
 # TELEGRAM
 # ═══════════════════════════════════════════════════════════════
 
-def send_telegram(message):
+def send_telegram(message, chat_id=None, priority=None):
+    """Отправляет сообщение через очередь; до её запуска — сразу."""
+    with STAGE_SECONDS.time(stage='telegram'):
+        if telegram_outbox is not None:
+            return telegram_outbox.send(message, chat_id, priority)
+        return send_telegram_now(message, chat_id)
+
+
+def broadcast(message):
+    """
+    Рассылает сообщение о ставке (messages.Message) подписчикам, которым оно
+    подходит по настройкам. Каждый вариант текста рисуется один раз.
+    """
+    with STAGE_SECONDS.time(stage='telegram'):
+        if subscribers is None:
+            chats = [CHAT_ID]
+        else:
+            chats = subscribers.recipients(message.kind, message.values.get('confidence'))
+        if telegram_outbox is not None:
+            return telegram_outbox.send_many(message, chats)
+        for chat_id in chats:
+            send_telegram_now(message, chat_id)
+        return len(chats)
+
+
+def send_telegram_now(message, chat_id=None):
     url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-    data = {"chat_id": CHAT_ID, "text": message, "parse_mode": "HTML"}
+    chat_id = chat_id or CHAT_ID
+    data = {"chat_id": chat_id, "text": render_text(message, chat_id), "parse_mode": "HTML"}
     try:
-        response = requests.post(url, data=data, timeout=10)
+        response = http_post(url, data=data, timeout=10)
         return response.json().get('ok', False)
     except Exception as e:
-        print(f"Telegram error: {e}")
+        log('telegram_error', f"Telegram error: {e}", error=str(e))
         return False
 
 # ═══════════════════════════════════════════════════════════════
 # ПОЛУЧЕНИЕ ДАННЫХ
 # ═══════════════════════════════════════════════════════════════
 
+def _price_binance():
+    response = http_get(
+        "https://api.binance.com/api/v3/ticker/price",
+        params={"symbol": "BTCUSDT"},
+        timeout=5
+    )
+    if response.status_code == 200:
+        return float(response.json()['price'])
+    return 0
+
+
+def _price_coingecko():
+    response = http_get(
+        "https://api.coingecko.com/api/v3/simple/price",
+        params={"ids": "bitcoin", "vs_currencies": "usd"},
+        timeout=10
+    )
+    if response.status_code == 200:
+        return float(response.json()['bitcoin']['usd'])
+    return 0
+
+
+def _price_coinbase():
+    response = http_get(
+        "https://api.coinbase.com/v2/prices/BTC-USD/spot",
+        timeout=10
+    )
+    if response.status_code == 200:
+        return float(response.json()['data']['amount'])
+    return 0
+
+
+PRICE_SOURCES = {
+    'binance': _price_binance,
+    'coingecko': _price_coingecko,
+    'coinbase': _price_coinbase,
+}
+
+price_source_stats = {
+    name: {'requests': 0, 'errors': 0, 'rejected': 0, 'last_latency_ms': None, 'avg_latency_ms': None}
+    for name in PRICE_SOURCES
+}
+_price_stats_lock = threading.Lock()
+_price_pool = ThreadPoolExecutor(max_workers=len(PRICE_SOURCES) * 2, thread_name_prefix="price")
+last_good_price = None
+
+
+def _fetch_price_source(name):
+    """Запрос к одному источнику с замером задержки."""
+    started = time.monotonic()
+    try:
+        price = PRICE_SOURCES[name]()
+    except Exception:
+        price = 0
+    latency_ms = (time.monotonic() - started) * 1000
+    PRICE_SOURCE_SECONDS.observe(latency_ms / 1000, source=name)
+    if price <= 0:
+        PRICE_SOURCE_ERRORS.inc(source=name)
+    
+    with _price_stats_lock:
+        stats = price_source_stats[name]
+        stats['requests'] += 1
+        if price <= 0:
+            stats['errors'] += 1
+        stats['last_latency_ms'] = latency_ms
+        if stats['avg_latency_ms'] is None:
+            stats['avg_latency_ms'] = latency_ms
+        else:
+            stats['avg_latency_ms'] += 0.2 * (latency_ms - stats['avg_latency_ms'])
+    return name, price
+
+
+def _is_outlier(price, reference):
+    return abs(price - reference) / reference * 100 > PRICE_MAX_DEVIATION
+
+
+def _reject(name):
+    PRICE_SOURCE_REJECTED.inc(source=name)
+    with _price_stats_lock:
+        price_source_stats[name]['rejected'] += 1
+
+
+def _collect_quotes(futures, quorum_seconds):
+    """Котировки, пришедшие за окно кворума; если за окно ничего — первая пришедшая."""
+    quotes = {}
+    pending = set(futures)
+    started = time.monotonic()
+    quorum_deadline = started + quorum_seconds
+    hard_deadline = started + PRICE_TIMEOUT
+    
+    while pending:
+        now = time.monotonic()
+        if quotes and now >= quorum_deadline:
+            break
+        timeout = (quorum_deadline if now < quorum_deadline else hard_deadline) - now
+        if timeout <= 0:
+            break
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            name, price = future.result()
+            if price > 0:
+                quotes[name] = price
+    return quotes
+
+
+PRICE_CAPTURE_KEY = "price:BTCUSDT"
+
+
 def get_btc_price():
-    """Получает цену BTC из 3 источников."""
+    """
+    Получает цену BTC, опрашивая все источники одновременно.
+    PRICE_MODE = fastest — первая правдоподобная котировка;
+    PRICE_MODE = median  — медиана котировок, пришедших за PRICE_QUORUM_MS.
+    Котировки, отклонившиеся от эталона больше PRICE_MAX_DEVIATION %, отбрасываются.
+    """
+    if transport.replay is not None:
+        # Какой источник ответил первым, решает гонка потоков — берём записанный итог
+        return transport.replay.value(PRICE_CAPTURE_KEY) or 0
     
-    # Источник 1: Binance
-    try:
-        response = requests.get(
-            "https://api.binance.com/api/v3/ticker/price",
-            params={"symbol": "BTCUSDT"},
-            timeout=5
-        )
-        if response.status_code == 200:
-            return float(response.json()['price'])
-    except:
-        pass
+    price = _consensus_price()
+    if transport.capture is not None:
+        transport.capture.record_value(PRICE_CAPTURE_KEY, price)
+    return price
+
+
+def _consensus_price():
+    global last_good_price
     
-    # Источник 2: CoinGecko
+    futures = [_price_pool.submit(_fetch_price_source, name) for name in PRICE_SOURCES]
+    
+    if PRICE_MODE == 'median':
+        quotes = _collect_quotes(futures, PRICE_QUORUM_MS / 1000)
+        if not quotes:
+            return 0
+        
+        consensus = statistics.median(quotes.values())
+        accepted = []
+        for name, price in quotes.items():
+            if _is_outlier(price, consensus):
+                _reject(name)
+            else:
+                accepted.append(price)
+        if accepted:
+            price = statistics.median(accepted)
+        elif last_good_price is not None:
+            # Две котировки, далёкие друг от друга, — верим ближайшей к прошлой цене
+            DATA_FALLBACKS.inc(reason='price_nearest_last')
+            price = min(quotes.values(), key=lambda p: abs(p - last_good_price))
+        else:
+            price = consensus
+        last_good_price = price
+        return price
+    
+    # fastest: первая котировка, не отклонившаяся от последней принятой цены
+    rejected = []
     try:
-        response = requests.get(
-            "https://api.coingecko.com/api/v3/simple/price",
-            params={"ids": "bitcoin", "vs_currencies": "usd"},
-            timeout=10
-        )
-        if response.status_code == 200:
-            return float(response.json()['bitcoin']['usd'])
-    except:
+        for future in as_completed(futures, timeout=PRICE_TIMEOUT):
+            name, price = future.result()
+            if price <= 0:
+                continue
+            if last_good_price is not None and _is_outlier(price, last_good_price):
+                _reject(name)
+                rejected.append(price)
+                continue
+            last_good_price = price
+            return price
+    except FuturesTimeout:
         pass
     
-    # Источник 3: Coinbase
+    # Все источники далеко от прошлой цены — значит, сдвинулся рынок, а не источник
+    if rejected:
+        DATA_FALLBACKS.inc(reason='price_rejected_median')
+        last_good_price = statistics.median(rejected)
+        return last_good_price
+    return 0
+
+
+def get_binance_prices(symbols):
+    """Цены нескольких символов Binance одним запросом."""
     try:
-        response = requests.get(
-            "https://api.coinbase.com/v2/prices/BTC-USD/spot",
-            timeout=10
+        response = http_get(
+            "https://api.binance.com/api/v3/ticker/price",
+            params={"symbols": json.dumps(list(symbols), separators=(',', ':'))},
+            timeout=5
         )
         if response.status_code == 200:
-            return float(response.json()['data']['amount'])
+            return {item['symbol']: float(item['price']) for item in response.json()}
     except:
         pass
-    
-    return 0
+    return {}
+
+
+candle_caches = {}
+
 
+def get_candle_cache(symbol):
+    cache = candle_caches.get(symbol)
+    if cache is None:
+        path = None
+        # При записи и воспроизведении окно начинается пустым (см. capture.py)
+        if CANDLE_CACHE_DIR and transport.capture is None and transport.replay is None:
+            os.makedirs(CANDLE_CACHE_DIR, exist_ok=True)
+            path = os.path.join(CANDLE_CACHE_DIR, f"{symbol}_1m.json")
+        cache = candle_caches.setdefault(symbol, CandleCache(symbol, "1m", CANDLE_HISTORY, path))
+    return cache
 
-def get_candles():
-    """Получает свечи с Binance."""
+
+def get_candles(symbol="BTCUSDT", since=None):
+    """
+    Свечи с Binance: из локального кэша, дозапрашиваются только новые.
+    since — вернуть только хвост окна с этого open_time.
+    """
+    return get_candle_cache(symbol).get(since)
+
+
+def get_depth_snapshot(symbol="BTCUSDT", limit=ORDERBOOK_DEPTH):
+    """REST-снимок стакана с lastUpdateId."""
     try:
-        response = requests.get(
-            "https://api.binance.com/api/v3/klines",
-            params={"symbol": "BTCUSDT", "interval": "1m", "limit": 100},
-            timeout=10
+        response = http_get(
+            "https://api.binance.com/api/v3/depth",
+            params={"symbol": symbol, "limit": limit},
+            timeout=5
         )
         if response.status_code == 200:
-            return [{
-                'open': float(k[1]),
-                'high': float(k[2]),
-                'low': float(k[3]),
-                'close': float(k[4]),
-                'volume': float(k[5])
-            } for k in response.json()]
+            return response.json()
     except:
         pass
     return None
 
 
-def get_orderbook():
-    """Получает данные стакана."""
+def get_orderbook(symbol="BTCUSDT"):
+    """Метрики стакана (OrderBook.flow) по REST-снимку или None."""
+    snapshot = get_depth_snapshot(symbol)
+    if snapshot is None:
+        return None
+    book = OrderBook(symbol)
+    book.load_snapshot(snapshot)
+    return book.flow()
+
+
+def get_price_at(moment, symbol="BTCUSDT"):
+    """
+    Цена на заданный момент: open минутной свечи, начинающейся не раньше него.
+    Из окна свечей, если оно покрывает момент, иначе запросом к Binance.
+    """
+    cache = candle_caches.get(symbol)
+    if cache is not None:
+        price = cache.open_at(int(moment.timestamp() * 1000))
+        if price:
+            return price
     try:
-        response = requests.get(
-            "https://api.binance.com/api/v3/depth",
-            params={"symbol": "BTCUSDT", "limit": 20},
-            timeout=5
+        response = http_get(
+            "https://api.binance.com/api/v3/klines",
+            params={"symbol": symbol, "interval": "1m",
+                    "startTime": int(moment.timestamp() * 1000), "limit": 1},
+            timeout=10
         )
         if response.status_code == 200:
             data = response.json()
-            bid_vol = sum(float(b[1]) for b in data['bids'])
-            ask_vol = sum(float(a[1]) for a in data['asks'])
-            total = bid_vol + ask_vol
-            return (bid_vol / total * 100) if total > 0 else 50
+            if data:
+                return float(data[0][1])
     except:
         pass
-    return 50
+    return 0
+
+
+def get_current_price(symbol="BTCUSDT"):
+    """Только цена: из потока, если он свежий, иначе REST."""
+    if symbol == "BTCUSDT" and market_feed is not None:
+        price = market_feed.get_price() if market_feed.is_fresh() else None
+        if price:
+            return price
+        DATA_FALLBACKS.inc(reason='stream_stale')
+    with STAGE_SECONDS.time(stage='price'):
+        if symbol != "BTCUSDT":
+            return get_binance_prices([symbol]).get(symbol, 0)
+        return get_btc_price()
+
+
+def fetch_market_data(symbol="BTCUSDT", price=None, since=None):
+    """
+    Цена, свечи и метрики стакана (OrderBook.flow или None).
+    В потоковом режиме берутся из памяти, если поток свежий, иначе — REST.
+    price — уже известная цена (например, из общего запроса по всем символам).
+    since — нужны только свечи с этого open_time (см. IndicatorEngine.sync).
+    """
+    if symbol == "BTCUSDT" and market_feed is not None and market_feed.is_fresh():
+        feed_price = market_feed.get_price()
+        candles = market_feed.get_candles(since)
+        flow = market_feed.get_flow()
+        if feed_price and candles:
+            if flow is None:
+                DATA_FALLBACKS.inc(reason='book_unsynced')
+                with STAGE_SECONDS.time(stage='orderbook'):
+                    flow = get_orderbook(symbol)
+            return feed_price, candles, flow
+    
+    if price is None:
+        price = get_current_price(symbol)
+    if price == 0:
+        return 0, None, None
+    with STAGE_SECONDS.time(stage='candles'):
+        candles = get_candles(symbol, since)
+    with STAGE_SECONDS.time(stage='orderbook'):
+        flow = get_orderbook(symbol)
+    return price, candles, flow
 
 # ═══════════════════════════════════════════════════════════════
 # ИНДИКАТОРЫ
@@ -197,90 +707,85 @@ def get_momentum(prices, period=10):
 # РАСЧЁТ СИГНАЛА
 # ═══════════════════════════════════════════════════════════════
 
-def calculate_signal(price, candles, buy_pressure):
-    """Рассчитывает сигнал и уверенность."""
+def calculate_signal(price, candles, buy_pressure, indicators=None, params=None, history=None,
+                     flow=None):
+    """
+    Рассчитывает сигнал и уверенность.
+    indicators — готовый снимок IndicatorEngine; без него индикаторы
+    пересчитываются по свечам целиком. Снимок MultiTimeframeEngine добавляет
+    оценки старших интервалов с весами tf_<интервал>_weight.
+    params — веса и пороги (по умолчанию SIGNAL_PARAMS).
+    history — последние цены рынка на случай, если свечей нет.
+    flow — метрики стакана (OrderBook.flow): вместо buy_pressure берётся
+    дисбаланс ликвидности, плюс смещение microprice.
+    """
     
-    if candles:
-        closes = [c['close'] for c in candles]
-    elif len(price_history) > 20:
-        closes = price_history
+    if indicators is not None:
+        rsi = indicators['rsi']
+        macd = indicators['macd']
+        vwap = indicators['vwap']
+        momentum = indicators['momentum']
     else:
-        closes = [price] * 50
-    
-    rsi = calculate_rsi(closes)
-    macd = calculate_macd(closes)
-    vwap = calculate_vwap(candles) if candles else price
-    momentum = get_momentum(closes)
+        if candles:
+            closes = [c['close'] for c in candles]
+        elif history and len(history) > 20:
+            closes = history
+        else:
+            closes = [price] * 50
+        
+        rsi = calculate_rsi(closes)
+        macd = calculate_macd(closes)
+        vwap = calculate_vwap(candles) if candles else price
+        momentum = get_momentum(closes)
     
-    score = 0
+    p = params or SIGNAL_PARAMS
     reasons = []
+    components = {}            # Вклад каждой составляющей (для журнала оценок)
+    score = _score_indicators(price, rsi, macd, vwap, momentum, p, reasons, parts=components)
     
-    # RSI (вес 25)
-    if rsi < 30:
-        score += 25
-        reasons.append(f"🟢 RSI перепродан ({rsi})")
-    elif rsi > 70:
-        score -= 25
-        reasons.append(f"🔴 RSI перекуплен ({rsi})")
-    elif rsi < 40:
-        score += 15
-        reasons.append(f"🟢 RSI низкий ({rsi})")
-    elif rsi > 60:
-        score -= 15
-        reasons.append(f"🔴 RSI высокий ({rsi})")
-    else:
-        reasons.append(f"⚪ RSI нейтрален ({rsi})")
-    
-    # MACD (вес 25)
-    if macd > 100:
-        score += 25
-        reasons.append("🟢 MACD сильный бычий")
-    elif macd > 0:
-        score += 15
-        reasons.append("🟢 MACD бычий")
-    elif macd < -100:
-        score -= 25
-        reasons.append("🔴 MACD сильный медвежий")
-    elif macd < 0:
-        score -= 15
-        reasons.append("🔴 MACD медвежий")
-    
-    # VWAP (вес 20)
-    if vwap > 0:
-        vwap_diff = ((price - vwap) / vwap) * 100
-        if vwap_diff > 0.3:
-            score += 20
-            reasons.append(f"🟢 Выше VWAP (+{vwap_diff:.2f}%)")
-        elif vwap_diff > 0:
-            score += 10
-            reasons.append(f"🟢 Чуть выше VWAP")
-        elif vwap_diff < -0.3:
-            score -= 20
-            reasons.append(f"🔴 Ниже VWAP ({vwap_diff:.2f}%)")
-        else:
-            score -= 10
-            reasons.append(f"🔴 Чуть ниже VWAP")
-    
-    # Momentum (вес 15)
-    if momentum > 0.3:
-        score += 15
-        reasons.append(f"🟢 Моментум вверх (+{momentum:.2f}%)")
-    elif momentum < -0.3:
-        score -= 15
-        reasons.append(f"🔴 Моментум вниз ({momentum:.2f}%)")
-    else:
-        reasons.append("⚪ Моментум нейтрален")
+    # Старшие интервалы: взвешенное среднее с минутной оценкой
+    timeframes = indicators.get('timeframes') if indicators is not None else None
+    if timeframes:
+        total, weights = score, 1.0
+        for label, tf in timeframes.items():
+            weight = p.get(f'tf_{label}_weight', 0)
+            if not weight or tf['bars'] < TIMEFRAME_MIN_BARS:
+                continue
+            tf_score = _score_indicators(price, tf['rsi'], tf['macd'], tf['vwap'], tf['momentum'], p,
+                                         scale=TIMEFRAME_SCALES.get(label, 1.0))
+            total += weight * tf_score
+            weights += weight
+            components[f'tf_{label}'] = tf_score
+            mark = "🟢" if tf_score > 0 else "🔴" if tf_score < 0 else "⚪"
+            reasons.append(f"{mark} {label}: RSI {tf['rsi']}, MACD {tf['macd']} ({tf_score:+d})")
+        score = round(total / weights)
     
-    # Order Flow (вес 15)
-    if buy_pressure > 55:
-        score += 15
+    # Order Flow: дисбаланс ликвидности в шкале доли покупателей
+    if flow is not None:
+        buy_pressure = 50 + 50 * flow['imbalance'][p['flow_depth']]
+    if buy_pressure > p['flow_buy']:
+        score += p['flow_weight']
+        components['flow'] = p['flow_weight']
         reasons.append(f"🟢 Покупатели ({buy_pressure:.0f}%)")
-    elif buy_pressure < 45:
-        score -= 15
+    elif buy_pressure < p['flow_sell']:
+        score -= p['flow_weight']
+        components['flow'] = -p['flow_weight']
         reasons.append(f"🔴 Продавцы ({100-buy_pressure:.0f}%)")
     else:
         reasons.append("⚪ Баланс ордеров")
     
+    # Microprice: куда тянет объём лучших уровней
+    if flow is not None and flow['spread'] > 0:
+        tilt = (flow['microprice'] - flow['mid']) / (flow['spread'] / 2)
+        if tilt > p['micro_tilt']:
+            score += p['micro_weight']
+            components['micro'] = p['micro_weight']
+            reasons.append(f"🟢 Microprice выше середины (спред {flow['spread_bps']:.1f} б.п.)")
+        elif tilt < -p['micro_tilt']:
+            score -= p['micro_weight']
+            components['micro'] = -p['micro_weight']
+            reasons.append(f"🔴 Microprice ниже середины (спред {flow['spread_bps']:.1f} б.п.)")
+    
     # Направление и уверенность
     direction = 'UP' if score > 0 else 'DOWN'
     confidence = min(abs(score), 100)
@@ -290,97 +795,329 @@ def calculate_signal(price, candles, buy_pressure):
         'confidence': confidence,
         'score': score,
         'reasons': reasons,
+        'components': components,
         'rsi': rsi,
         'macd': macd,
         'vwap': vwap,
-        'momentum': momentum
+        'momentum': momentum,
+        'buy_pressure': buy_pressure
     }
 
+def _score_indicators(price, rsi, macd, vwap, momentum, p, reasons=None, scale=1.0, parts=None):
+    """
+    Оценка RSI / MACD / VWAP / моментума. reasons — список для пояснений
+    (None — без них); scale — множитель порогов в цене и процентах;
+    parts — словарь, куда записывается вклад каждого индикатора.
+    """
+    note = reasons.append if reasons is not None else (lambda reason: None)
+    macd_strong = p['macd_strong'] * scale
+    vwap_band = p['vwap_band'] * scale
+    momentum_band = p['momentum_band'] * scale
+    
+    # RSI
+    rsi_score = 0
+    if rsi < p['rsi_oversold']:
+        rsi_score = p['rsi_weight']
+        note(f"🟢 RSI перепродан ({rsi})")
+    elif rsi > p['rsi_overbought']:
+        rsi_score = -p['rsi_weight']
+        note(f"🔴 RSI перекуплен ({rsi})")
+    elif rsi < p['rsi_low']:
+        rsi_score = p['rsi_soft_weight']
+        note(f"🟢 RSI низкий ({rsi})")
+    elif rsi > p['rsi_high']:
+        rsi_score = -p['rsi_soft_weight']
+        note(f"🔴 RSI высокий ({rsi})")
+    else:
+        note(f"⚪ RSI нейтрален ({rsi})")
+    
+    # MACD
+    macd_score = 0
+    if macd > macd_strong:
+        macd_score = p['macd_weight']
+        note("🟢 MACD сильный бычий")
+    elif macd > 0:
+        macd_score = p['macd_soft_weight']
+        note("🟢 MACD бычий")
+    elif macd < -macd_strong:
+        macd_score = -p['macd_weight']
+        note("🔴 MACD сильный медвежий")
+    elif macd < 0:
+        macd_score = -p['macd_soft_weight']
+        note("🔴 MACD медвежий")
+    
+    # VWAP
+    vwap_score = 0
+    if vwap > 0:
+        vwap_diff = ((price - vwap) / vwap) * 100
+        if vwap_diff > vwap_band:
+            vwap_score = p['vwap_weight']
+            note(f"🟢 Выше VWAP (+{vwap_diff:.2f}%)")
+        elif vwap_diff > 0:
+            vwap_score = p['vwap_soft_weight']
+            note(f"🟢 Чуть выше VWAP")
+        elif vwap_diff < -vwap_band:
+            vwap_score = -p['vwap_weight']
+            note(f"🔴 Ниже VWAP ({vwap_diff:.2f}%)")
+        else:
+            vwap_score = -p['vwap_soft_weight']
+            note(f"🔴 Чуть ниже VWAP")
+    
+    # Momentum
+    momentum_score = 0
+    if momentum > momentum_band:
+        momentum_score = p['momentum_weight']
+        note(f"🟢 Моментум вверх (+{momentum:.2f}%)")
+    elif momentum < -momentum_band:
+        momentum_score = -p['momentum_weight']
+        note(f"🔴 Моментум вниз ({momentum:.2f}%)")
+    else:
+        note("⚪ Моментум нейтрален")
+    
+    if parts is not None:
+        parts['rsi'] = rsi_score
+        parts['macd'] = macd_score
+        parts['vwap'] = vwap_score
+        parts['momentum'] = momentum_score
+    return rsi_score + macd_score + vwap_score + momentum_score
+
 # ═══════════════════════════════════════════════════════════════
 # СТАВКИ
 # ═══════════════════════════════════════════════════════════════
 
-def calculate_bet_size(confidence):
+def calculate_bet_size(confidence, balance=None, min_confidence=None,
+                       min_percent=None, max_percent=None):
     """
     Рассчитывает размер ставки в зависимости от уверенности.
     40% уверенность → 3% от депозита
     80%+ уверенность → 5% от депозита
+    balance — депозит (по умолчанию текущий баланс симуляции).
+    Остальные аргументы по умолчанию берутся из настроек.
     """
-    if confidence < MIN_CONFIDENCE:
+    min_confidence = MIN_CONFIDENCE if min_confidence is None else min_confidence
+    min_percent = MIN_BET_PERCENT if min_percent is None else min_percent
+    max_percent = MAX_BET_PERCENT if max_percent is None else max_percent
+    
+    if confidence < min_confidence:
         return 0
     
     # Линейная интерполяция между MIN и MAX
-    confidence_range = 80 - MIN_CONFIDENCE  # 40 пунктов
-    bet_range = MAX_BET_PERCENT - MIN_BET_PERCENT  # 2%
+    confidence_range = 80 - min_confidence  # 40 пунктов
+    bet_range = max_percent - min_percent  # 2%
+    
+    if confidence_range > 0:
+        normalized = min(confidence - min_confidence, confidence_range) / confidence_range
+    else:
+        normalized = 1
+    bet_percent = min_percent + (normalized * bet_range)
     
-    normalized = min(confidence - MIN_CONFIDENCE, confidence_range) / confidence_range
-    bet_percent = MIN_BET_PERCENT + (normalized * bet_range)
+    if balance is None:
+        balance = simulation['balance']
+    return balance * (bet_percent / 100)
+
+
+def sizer_for(market):
+    """KellySizer рынка (новый, если симуляцию рынка заменили)."""
+    history = market.simulation['history']
+    sizer = sizers.get(market.key)
+    if sizer is None or sizer.history is not history:
+        sizer = sizers[market.key] = KellySizer(history)
+    return sizer
+
+
+def size_bet(confidence, balance, sizer=None, win_multiple=WIN_MULTIPLIER, volatility=0.0,
+             min_confidence=None, min_percent=None, max_percent=None):
+    """
+    Размер ставки. При BET_SIZING='kelly' — KELLY_FRACTION от доли Келли по
+    оценкам sizer и множителю выигрыша win_multiple, не больше max_percent
+    (без нижней границы: иначе поправки на волатильность и просадку терялись
+    бы в минимуме); 0 — преимущества нет. Пока истории корзины мало
+    (и при 'linear') — calculate_bet_size в пределах min_percent..max_percent.
+    """
+    min_confidence = MIN_CONFIDENCE if min_confidence is None else min_confidence
+    min_percent = MIN_BET_PERCENT if min_percent is None else min_percent
+    max_percent = MAX_BET_PERCENT if max_percent is None else max_percent
     
-    return simulation['balance'] * (bet_percent / 100)
+    if BET_SIZING == 'kelly' and sizer is not None and confidence >= min_confidence:
+        percent = sizer.percent(confidence, win_multiple, LOSE_MULTIPLIER, volatility,
+                                KELLY_FRACTION, VOL_TARGET, MAX_DRAWDOWN_PERCENT)
+        if percent is not None:
+            if percent <= 0:
+                return 0
+            return balance * (min(percent, max_percent) / 100)
+    return calculate_bet_size(confidence, balance, min_confidence, min_percent, max_percent)
 
 
-def open_bet(direction, confidence, entry_price):
-    """Открывает новую ставку."""
-    global simulation
+def settle_pnl(direction, amount, entry_price, exit_price, payout=None):
+    """
+    Исход ставки и P&L по цене входа и выхода. payout — чистый множитель
+    выигрыша, зафиксированный при входе (None — WIN_MULTIPLIER).
+    """
+    price_change = exit_price - entry_price
     
-    if simulation['active_bet'] is not None:
-        return None  # Уже есть активная ставка
+    if direction == 'UP':
+        won = price_change > 0
+    else:
+        won = price_change < 0
+    
+    if won:
+        return True, amount * (WIN_MULTIPLIER if payout is None else payout)
+    return False, -amount * LOSE_MULTIPLIER
+
+
+def persist_state(event, payload, market=None):
+    """Записывает переход ставки в хранилище (в фоне)."""
+    market = market or default_market
+    if state_store is not None:
+        state_store.record(event, payload, market.simulation,
+                           None if market.is_default else market.key)
+
+
+def restore_state():
+    """
+    Открывает хранилище и восстанавливает симуляции всех рынков.
+    Возвращает [(рынок, результат)] для ставок, срок которых истёк, пока бот стоял.
+    """
+    global state_store
+    
+    state_store = StateStore(STATE_DB)
+    atexit.register(state_store.close)
+    
+    recovered = []
+    for market in markets:
+        recovered.extend((market, result) for result in restore_market(market))
+    return recovered
+
+
+def restore_market(market):
+    """Восстанавливает симуляцию одного рынка и закрывает просроченные ставки."""
+    key = None if market.is_default else market.key
+    state = state_store.load(history_limit=HISTORY_WINDOW, market=key)
+    if state is None:
+        return []
+    
+    sim = market.simulation
+    history = sim['history']
+    history_state = state.pop('history', None)
+    recent_bets = state.pop('recent_bets')
+    if history_state:
+        history.restore(history_state)
+        history.load_recent(recent_bets)
+    else:
+        # Снимок без агрегатов — пересчитываем их по всему архиву
+        for result in state_store.iter_bets(key):
+            history.append(result)
+    open_bets = state.pop('portfolio')
+    legacy_bet = state.pop('active_bet', None)
+    if legacy_bet is not None:
+        open_bets.append(legacy_bet)
+    for bet in open_bets:
+        # Ставки из снимков до модели выплат — по прежнему множителю
+        bet.setdefault('payout', WIN_MULTIPLIER)
+    sim.update(state)
+    portfolio = sim['portfolio']
+    portfolio.restore(open_bets)
+    
+    log('restore', f"💾 {market.key}: баланс ${sim['balance']:.2f}, "
+                   f"ставок {sim['total_bets']}, открытых: {len(portfolio)}",
+        market=market.key, balance=sim['balance'], total_bets=sim['total_bets'],
+        open_bets=len(portfolio))
+    
+    results = []
+    while portfolio and portfolio.peek()['close_time'] <= clock.utcnow():
+        # Ставка должна была закрыться, пока бот не работал — берём цену на close_time
+        close_time = portfolio.peek()['close_time']
+        exit_price = get_price_at(close_time, market.symbol)
+        if not exit_price:
+            DATA_FALLBACKS.inc(reason='price_at_missing')
+            exit_price = get_current_price(market.symbol)
+        if exit_price == 0:
+            break
+        results.extend(settle_due_bets(exit_price, close_time, market))
+    return results
+
+
+def open_bet(direction, confidence, entry_price, now=None, market=None, volatility=0.0):
+    """
+    Открывает новую ставку. now — момент открытия (по умолчанию текущий),
+    market — рынок (по умолчанию основной), volatility — реализованная
+    волатильность для цены доли и размера. None — ставка не открыта: портфель
+    полон, слабый сигнал, нет преимущества по Келли или не осталось места
+    под MAX_EXPOSURE_PERCENT.
+    """
+    market = market or default_market
+    sim = market.simulation
+    portfolio = sim['portfolio']
+    
+    if len(portfolio) >= MAX_OPEN_BETS:
+        return None  # Открыто максимум ставок
     
     if confidence < MIN_CONFIDENCE:
         return None
     
-    bet_amount = calculate_bet_size(confidence)
-    bet_percent = (bet_amount / simulation['balance']) * 100
+    now = now or clock.utcnow()
+    up = direction == 'UP'
+    minute = entry_minute(now, market.horizon)
+    # Преимущество — по множителю без проскальзывания: оно зависит от самой суммы
+    win_multiple = float(payout_model.quote(up, 0.0, minute, volatility))
+    bet_amount = size_bet(confidence, sim['balance'], sizer_for(market), win_multiple, volatility)
+    if bet_amount <= 0:
+        return None
+    if MAX_OPEN_BETS > 1:
+        room = sim['balance'] * MAX_EXPOSURE_PERCENT / 100 - portfolio.exposure
+        if room <= 0:
+            return None
+        bet_amount = min(bet_amount, room)
+    bet_percent = (bet_amount / sim['balance']) * 100
+    # Множитель выигрыша фиксируется при входе, как цена купленных долей
+    payout = float(payout_model.quote(up, bet_amount, minute, volatility))
     
-    simulation['active_bet'] = {
+    bet = {
         'direction': direction,
         'entry_price': entry_price,
         'amount': bet_amount,
         'confidence': confidence,
-        'open_time': datetime.now(timezone.utc),
-        'close_time': datetime.now(timezone.utc) + timedelta(minutes=BET_DURATION_MINUTES)
+        'open_time': now,
+        'close_time': now + timedelta(minutes=market.horizon),
+        'payout': payout
     }
+    portfolio.add(bet)
+    persist_state('open', bet, market)
     
     return {
         'amount': bet_amount,
-        'percent': bet_percent
+        'percent': bet_percent,
+        'payout': payout,
+        'bet': bet
     }
 
 
-def check_and_close_bet(current_price):
-    """Проверяет и закрывает ставку если прошло 15 минут."""
-    global simulation
-    
-    if simulation['active_bet'] is None:
-        return None
-    
-    bet = simulation['active_bet']
-    now = datetime.now(timezone.utc)
-    
-    # Проверяем, прошло ли 15 минут
-    if now < bet['close_time']:
-        remaining = (bet['close_time'] - now).total_seconds() / 60
-        return {'status': 'active', 'remaining_minutes': remaining}
-    
-    # Закрываем ставку
+def settle_due_bets(current_price, now=None, market=None):
+    """
+    Закрывает ставки рынка, срок которых наступил к now (по умолчанию — сейчас),
+    по цене current_price. Возвращает результаты в порядке закрытия.
+    """
+    market = market or default_market
+    now = now or clock.utcnow()
+    return [close_bet(bet, current_price, market)
+            for bet in market.simulation['portfolio'].pop_due(now)]
+
+
+def close_bet(bet, current_price, market):
+    """Рассчитывает снятую с портфеля ставку и записывает результат."""
+    sim = market.simulation
     price_change = current_price - bet['entry_price']
+    won, pnl = settle_pnl(bet['direction'], bet['amount'], bet['entry_price'], current_price,
+                          bet.get('payout'))
     
-    if bet['direction'] == 'UP':
-        won = price_change > 0
-    else:
-        won = price_change < 0
-    
-    # Расчёт P&L
     if won:
-        pnl = bet['amount'] * WIN_MULTIPLIER
-        simulation['wins'] += 1
+        sim['wins'] += 1
     else:
-        pnl = -bet['amount'] * LOSE_MULTIPLIER
-        simulation['losses'] += 1
+        sim['losses'] += 1
     
-    simulation['balance'] += pnl
-    simulation['total_bets'] += 1
-    simulation['total_profit'] += pnl
+    sim['balance'] += pnl
+    sim['total_bets'] += 1
+    sim['total_profit'] += pnl
     
     result = {
         'status': 'closed',
@@ -394,8 +1131,9 @@ def check_and_close_bet(current_price):
         'confidence': bet['confidence']
     }
     
-    simulation['history'].append(result)
-    simulation['active_bet'] = None
+    sim['history'].append(result)
+    persist_state('close', result, market)
+    BETS_CLOSED.inc(market=market.key, outcome='win' if won else 'loss')
     
     return result
 
@@ -403,238 +1141,723 @@ def check_and_close_bet(current_price):
 # СООБЩЕНИЯ
 # ═══════════════════════════════════════════════════════════════
 
-def format_new_bet_message(price, signal, bet_info):
+def _message(kind, market, **values):
+    """Данные сообщения рынка; текст строится при отправке (messages.Message)."""
+    values['title'] = "" if market.is_default else market.title
+    values['label'] = market.label
+    values['now'] = clock.utcnow()
+    values['stats'] = stats_snapshot(market, STARTING_BALANCE)
+    return Message(kind, values)
+
+
+def format_new_bet_message(price, signal, bet_info, market=None):
     """Сообщение при открытии новой ставки."""
     
-    now = datetime.now(timezone.utc)
-    close_time = now + timedelta(minutes=BET_DURATION_MINUTES)
-    
-    emoji = "🟢" if signal['direction'] == 'UP' else "🔴"
-    arrow = "📈" if signal['direction'] == 'UP' else "📉"
+    market = market or default_market
+    message = _message(
+        'new_bet', market, price=price, horizon=market.horizon,
+        direction=signal['direction'], confidence=signal['confidence'],
+        reasons_list=signal['reasons'], rsi=signal['rsi'], macd=signal['macd'],
+        vwap=signal['vwap'], momentum=signal['momentum'],
+        amount=bet_info['amount'], percent=bet_info['percent']
+    )
+    message.values['close_time'] = message.values['now'] + timedelta(minutes=market.horizon)
+    return message
+
+
+def format_close_bet_message(result, current_price, market=None):
+    """Сообщение при закрытии ставки."""
     
-    msg = f"""
-<b>━━━ 🎯 НОВАЯ СТАВКА ━━━</b>
-🕐 {now.strftime('%H:%M:%S UTC')}
+    market = market or default_market
+    return _message(
+        'close_bet', market, won=result['won'], pnl=result['pnl'],
+        direction=result['direction'], confidence=result['confidence'],
+        entry_price=result['entry_price'], exit_price=result['exit_price']
+    )
 
-<b>💰 BTC: ${price:,.2f}</b>
 
-<b>{emoji} СТАВКА: {signal['direction']} {arrow}</b>
-📊 Уверенность: {signal['confidence']}%
-💵 Сумма: ${bet_info['amount']:.2f} ({bet_info['percent']:.1f}%)
+def format_status_message(price, signal, market=None):
+    """Статус когда нет активной ставки и сигнал слабый."""
+    
+    market = market or default_market
+    return _message(
+        'status', market, price=price, direction=signal['direction'],
+        confidence=signal['confidence'], min_confidence=MIN_CONFIDENCE
+    )
 
-<b>⏱ Закрытие в: {close_time.strftime('%H:%M:%S UTC')}</b>
-<i>(через 15 минут)</i>
 
-<b>📈 Анализ:</b>
-"""
-    for reason in signal['reasons']:
-        msg += f"{reason}\n"
+def format_waiting_message(price, bet, remaining, market=None):
+    """Статус ожидания закрытия ставки."""
+    
+    market = market or default_market
+    current_pnl = price - bet['entry_price']
+    if bet['direction'] == 'DOWN':
+        current_pnl = -current_pnl
     
-    win_rate = (simulation['wins'] / simulation['total_bets'] * 100) if simulation['total_bets'] > 0 else 0
+    return _message(
+        'waiting', market, price=price, direction=bet['direction'],
+        confidence=bet['confidence'], amount=bet['amount'],
+        entry_price=bet['entry_price'], current_pnl=current_pnl, remaining=remaining
+    )
+
+def format_command_status():
+    """Ответ на /status: баланс, статистика и активные ставки всех рынков."""
     
-    msg += f"""
-<b>💼 Баланс: ${simulation['balance']:.2f}</b>
-📊 Ставок: {simulation['total_bets']} | Win: {simulation['wins']} | Loss: {simulation['losses']}
-🎯 Win Rate: {win_rate:.1f}%
-<b>━━━━━━━━━━━━━━━━━━━━━</b>
+    now = clock.utcnow()
+    msg = f"<b>━━━ 📊 СТАТУС ━━━</b>\n🕐 {now.strftime('%H:%M:%S UTC')}\n"
+    if trading_paused:
+        msg += "<b>⏸ Новые ставки на паузе</b>\n"
+    
+    for market in markets:
+        sim = market.simulation
+        stats = sim['history'].stats
+        total_pnl = sim['balance'] - STARTING_BALANCE
+        price = market.price_history[-1] if market.price_history else None
+        msg += f"""
+<b>{market.title}</b>{f" — ${price:,.2f}" if price else ""}
+💼 ${sim['balance']:.2f} ({'+' if total_pnl >= 0 else ''}{total_pnl:.2f}) | WR {stats.win_rate:.1f}% | {stats.count} ставок
 """
+        portfolio = sim['portfolio']
+        for bet in itertools.islice(portfolio, STATUS_BETS_SHOWN):
+            remaining = (bet['close_time'] - now).total_seconds() / 60
+            msg += (f"{'🟢' if bet['direction'] == 'UP' else '🔴'} {bet['direction']} ${bet['amount']:.2f} "
+                    f"от ${bet['entry_price']:,.2f}, осталось {remaining:.1f} мин\n")
+        if len(portfolio) > 1:
+            unrealized = portfolio.unrealized(LOSE_MULTIPLIER)
+            more = len(portfolio) - STATUS_BETS_SHOWN
+            msg += (f"📦 Открыто {len(portfolio)}{f' (ещё {more})' if more > 0 else ''} | "
+                    f"в ставках ${portfolio.exposure:.2f} | "
+                    f"по текущей цене {'+' if unrealized >= 0 else ''}{unrealized:.2f}\n")
+    
+    msg += f"\n⚙️ Мин. уверенность {MIN_CONFIDENCE}% | ставка {MIN_BET_PERCENT}%-{MAX_BET_PERCENT}%"
+    if subscribers is not None:
+        depth = telegram_outbox.depth if telegram_outbox is not None else 0
+        msg += f"\n👥 Подписчиков: {len(subscribers)} | в очереди: {depth}"
     return msg
 
 
-def format_close_bet_message(result, current_price):
-    """Сообщение при закрытии ставки."""
+def format_subscribers_message():
+    """Ответ на /subscribers: число подписчиков и задержка доставки по чатам."""
     
-    now = datetime.now(timezone.utc)
-    
-    if result['won']:
-        status_emoji = "✅"
-        status_text = "ВЫИГРЫШ"
-        pnl_text = f"+${result['pnl']:.2f}"
-    else:
-        status_emoji = "❌"
-        status_text = "ПРОИГРЫШ"
-        pnl_text = f"-${abs(result['pnl']):.2f}"
+    if subscribers is None:
+        return "👥 Рассылка только в основной чат"
+    lag = telegram_outbox.lag_by_chat() if telegram_outbox is not None else {}
+    msg = f"<b>━━━ 👥 ПОДПИСЧИКИ: {len(subscribers)} ━━━</b>\n"
+    ordered = sorted(subscribers.all(), key=lambda s: lag.get(s.chat_id, 0), reverse=True)
+    for subscriber in ordered[:SUBSCRIBERS_COMMAND_LIMIT]:
+        chat_lag = lag.get(subscriber.chat_id)
+        msg += (f"{subscriber.chat_id}: {subscriber.lang}/{subscriber.style}, "
+                f"≥{subscriber.min_confidence}%{'' if subscriber.monitoring else ', без мониторинга'}"
+                f" | задержка {f'{chat_lag:.1f} с' if chat_lag is not None else '—'}\n")
+    if len(ordered) > SUBSCRIBERS_COMMAND_LIMIT:
+        msg += f"… и ещё {len(ordered) - SUBSCRIBERS_COMMAND_LIMIT}\n"
+    return msg
+
+
+def format_history_message(n):
+    """Ответ на /history: последние n ставок основного рынка."""
     
-    price_diff = result['exit_price'] - result['entry_price']
-    price_percent = (price_diff / result['entry_price']) * 100
+    bets = simulation['history'].recent(n)
+    if not bets:
+        return "📋 Ставок пока нет"
+    msg = f"<b>━━━ 📋 ПОСЛЕДНИЕ {len(bets)} ━━━</b>\n"
+    for bet in reversed(bets):
+        pnl = f"+${bet['pnl']:.2f}" if bet['pnl'] >= 0 else f"-${abs(bet['pnl']):.2f}"
+        msg += (f"{'✅' if bet['won'] else '❌'} {bet['direction']} ${bet['amount']:.2f} "
+                f"({bet['confidence']}%) → {pnl}\n")
+    return msg
+
+# ═══════════════════════════════════════════════════════════════
+# ЗАПУСК
+# ═══════════════════════════════════════════════════════════════
+
+def warm_start():
+    """
+    Быстрый старт: окна свечей поднимаются из локального кэша, пропуск за время
+    простоя дозагружается одним запросом на символ (символы параллельно), движки
+    индикаторов и price_history прогреваются до первого тика.
+    """
+    started = time.monotonic()
+    groups = group_by_symbol(markets)
+    caches = {symbol: get_candle_cache(symbol) for symbol in groups}
+    cached = {symbol: len(cache.candles()) for symbol, cache in caches.items()}
+    rows_before = {symbol: cache.stats['rows'] for symbol, cache in caches.items()}
+    with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+        windows = dict(zip(groups, pool.map(get_candles, groups)))
     
-    win_rate = (simulation['wins'] / simulation['total_bets'] * 100) if simulation['total_bets'] > 0 else 0
-    total_pnl = simulation['balance'] - STARTING_BALANCE
+    for symbol, group in groups.items():
+        candles = windows[symbol]
+        if not candles:
+            log('warm_start', f"🧊 {symbol}: свечей нет, старт без прогрева", symbol=symbol, candles=0)
+            continue
+        group[0].engine.sync(candles)
+        closes = [c['close'] for c in candles[-200:]]
+        for market in group:
+            market.price_history = list(closes)
+        fetched = caches[symbol].stats['rows'] - rows_before[symbol]
+        log('warm_start', f"🔥 {symbol}: {len(candles)} свечей (из кэша {cached[symbol]}, "
+                          f"дозагружено {fetched})",
+            symbol=symbol, candles=len(candles), cached=cached[symbol], fetched=fetched)
+    elapsed = time.monotonic() - started
+    log('warm_start_done', f"🔥 Прогрев за {elapsed * 1000:.0f} мс", seconds=round(elapsed, 3))
+    return elapsed
+
+
+def mark_first_signal(market, signal):
+    """Запоминает время от запуска до первого сигнала."""
+    global first_signal_seconds
     
-    msg = f"""
-<b>━━━ {status_emoji} {status_text} ━━━</b>
-🕐 {now.strftime('%H:%M:%S UTC')}
+    first_signal_seconds = time.monotonic() - process_started
+    FIRST_SIGNAL.set(first_signal_seconds)
+    log('first_signal', f"⏱ Первый сигнал ({market.key}) через {first_signal_seconds:.2f} с после запуска",
+        market=market.key, seconds=round(first_signal_seconds, 3), confidence=signal['confidence'])
 
-<b>Ставка: {result['direction']} {'📈' if result['direction'] == 'UP' else '📉'}</b>
-📊 Уверенность была: {result['confidence']}%
 
-<b>💵 Вход:</b> ${result['entry_price']:,.2f}
-<b>💵 Выход:</b> ${result['exit_price']:,.2f}
-<b>📊 Изменение:</b> {'+' if price_diff > 0 else ''}{price_diff:.2f} ({'+' if price_percent > 0 else ''}{price_percent:.3f}%)
+def send_startup_banner(scheduled_at):
+    """Сообщение о запуске — после первого тика и в конце очереди Telegram."""
+    send_telegram(f"""🤖 <b>Bitcoin Bot v3 запущен!</b>
 
-<b>💰 P&L: {pnl_text}</b>
+<b>Настройки:</b>
+• Минимальная уверенность: {MIN_CONFIDENCE}%
+• Размер ставки: {MIN_BET_PERCENT}%-{MAX_BET_PERCENT}%
+• Длительность ставки: {BET_DURATION_MINUTES} мин
+• Депозит: ${STARTING_BALANCE}
+• Рынки: {', '.join(market.title for market in markets)}
 
-<b>━━━ 📊 СТАТИСТИКА ━━━</b>
-💼 Баланс: ${simulation['balance']:.2f}
-📈 Общий P&L: {'+' if total_pnl >= 0 else ''}${total_pnl:.2f} ({'+' if total_pnl >= 0 else ''}{(total_pnl/STARTING_BALANCE)*100:.1f}%)
-🎯 Win Rate: {win_rate:.1f}% ({simulation['wins']}W / {simulation['losses']}L)
-📋 Всего ставок: {simulation['total_bets']}
-<b>━━━━━━━━━━━━━━━━━━━━━</b>
-"""
-    return msg
+<i>Симуляция ставок в стиле Polymarket</i>
+""", priority=OUTBOX_PRIORITY_LOW)
 
 
-def format_status_message(price, signal):
-    """Статус когда нет активной ставки и сигнал слабый."""
-    
-    now = datetime.now(timezone.utc)
-    win_rate = (simulation['wins'] / simulation['total_bets'] * 100) if simulation['total_bets'] > 0 else 0
-    total_pnl = simulation['balance'] - STARTING_BALANCE
+def start_market_feed():
+    """Запускает WebSocket-поток; при ошибке бот работает через REST."""
+    global market_feed
     
-    msg = f"""
-<b>━━━ 📊 МОНИТОРИНГ ━━━</b>
-🕐 {now.strftime('%H:%M:%S UTC')}
+    feed = MarketFeed(symbol="BTCUSDT", candle_limit=CANDLE_HISTORY, seed_candles=get_candles,
+                      depth_snapshot=lambda: get_depth_snapshot("BTCUSDT", 1000))
+    try:
+        feed.start()
+    except Exception as e:
+        log('stream_error', f"⚠️ Потоковый режим недоступен: {e}", error=str(e))
+        return None
+    market_feed = feed
+    return feed
 
-<b>💰 BTC: ${price:,.2f}</b>
 
-<b>⏸ Сигнал слабый ({signal['confidence']}%)</b>
-<i>Минимум для ставки: {MIN_CONFIDENCE}%</i>
+def start_telegram_outbox():
+    """Запускает фоновую отправку сообщений."""
+    global telegram_outbox
+    
+    outbox = TelegramOutbox(TELEGRAM_TOKEN, CHAT_ID, merge_window=OUTBOX_MERGE_SECONDS,
+                            workers=OUTBOX_WORKERS)
+    outbox.start()
+    atexit.register(outbox.stop)
+    telegram_outbox = outbox
+    return outbox
 
-Направление: {signal['direction']} {'📈' if signal['direction'] == 'UP' else '📉'}
 
-<b>💼 Баланс: ${simulation['balance']:.2f}</b>
-📈 P&L: {'+' if total_pnl >= 0 else ''}${total_pnl:.2f}
-🎯 WR: {win_rate:.1f}% | {simulation['total_bets']} ставок
-<b>━━━━━━━━━━━━━━━━━━━━━</b>
-"""
-    return msg
+def start_subscribers():
+    """Загружает подписчиков; CHAT_ID подписан всегда."""
+    global subscribers
+    
+    subs = SubscriberRegistry(STATE_DB)
+    if CHAT_ID not in subs:
+        subs.add(CHAT_ID)
+    subscribers = subs
+    log('subscribers', f"👥 Подписчиков: {len(subs)}", subscribers=len(subs))
+    return subs
+
+
+def start_capture():
+    """Включает запись ответов бирж в CAPTURE_PATH."""
+    writer = CaptureWriter(CAPTURE_PATH)
+    transport.capture = writer
+    atexit.register(writer.close)
+    log('capture_started', f"⏺ Запись рыночных данных: {CAPTURE_PATH}", path=CAPTURE_PATH)
+    return writer
+
+
+def start_audit():
+    """Открывает журнал оценок сигнала в AUDIT_DIR."""
+    global audit_log
+    audit_log = AuditLog(AUDIT_DIR)
+    atexit.register(audit_log.close)
+    log('audit_started', f"🔎 Журнал оценок сигнала: {AUDIT_DIR} ({audit_log.rows} строк)",
+        path=AUDIT_DIR, rows=audit_log.rows)
+    return audit_log
+
+
+def start_replay():
+    """Отвечает на запросы из журнала и переводит часы на время записи."""
+    replay = ReplayLog(REPLAY_PATH)
+    if replay.first_ts is None:
+        raise SystemExit(f"{REPLAY_PATH}: журнал пуст")
+    transport.replay = replay
+    clock.install(clock.VirtualClock(replay.first_ts, REPLAY_SPEED or None))
+    log('replay_started', f"⏯ Воспроизведение {REPLAY_PATH}: {replay.total} ответов, "
+                          f"{(replay.last_ts - replay.first_ts) / 60:.0f} мин",
+        path=REPLAY_PATH, frames=replay.total, speed=REPLAY_SPEED)
+    return replay
+
+
+def stop_when_replayed(scheduled_at):
+    """Останавливает планировщик, когда записанные ответы закончились."""
+    replay = transport.replay
+    if not replay.exhausted and clock.time() <= replay.last_ts:
+        return
+    scheduler.stop()
+    for market in markets:
+        sim = market.simulation
+        log('replay_done', f"⏹ {market.key}: баланс ${sim['balance']:.2f}, ставок {sim['total_bets']}, "
+                           f"W/L {sim['wins']}/{sim['losses']}",
+            market=market.key, balance=sim['balance'], total_bets=sim['total_bets'],
+            wins=sim['wins'], losses=sim['losses'], served=replay.served)
+
+
+def start_metrics_server():
+    """Запускает HTTP /metrics; занятый порт не мешает работе бота."""
+    if not METRICS_PORT:
+        return None
+    try:
+        server = metrics.serve(METRICS_PORT, METRICS_HOST)
+    except OSError as e:
+        log('metrics_error', f"⚠️ Метрики недоступны: {e}", error=str(e))
+        return None
+    log('metrics_started', f"📈 Метрики: http://{METRICS_HOST}:{METRICS_PORT}/metrics",
+        host=METRICS_HOST, port=METRICS_PORT)
+    return server
 
 
-def format_waiting_message(price, bet, remaining):
-    """Статус ожидания закрытия ставки."""
+def start_command_poller():
+    """Запускает приём команд из чата."""
+    global command_poller
     
-    now = datetime.now(timezone.utc)
-    current_pnl = price - bet['entry_price']
-    if bet['direction'] == 'DOWN':
-        current_pnl = -current_pnl
+    poller = CommandPoller(TELEGRAM_TOKEN, handle_command, send_telegram, ADMIN_CHATS,
+                           public_commands=SUBSCRIBER_COMMANDS)
+    poller.start()
+    command_poller = poller
+    return poller
+
+
+# ═══════════════════════════════════════════════════════════════
+# КОМАНДЫ
+# ═══════════════════════════════════════════════════════════════
+
+# Настройки, меняемые через /set: имя → (глобальная переменная, тип, минимум, максимум)
+TUNABLE_SETTINGS = {
+    'min_confidence': ('MIN_CONFIDENCE', int, 1, 100),
+    'min_bet_percent': ('MIN_BET_PERCENT', float, 0.1, 100),
+    'max_bet_percent': ('MAX_BET_PERCENT', float, 0.1, 100),
+    'max_open_bets': ('MAX_OPEN_BETS', int, 1, 50),
+    'max_exposure_percent': ('MAX_EXPOSURE_PERCENT', float, 1, 100),
+    'kelly_fraction': ('KELLY_FRACTION', float, 0.01, 1),
+    'vol_target': ('VOL_TARGET', float, 0, 10),
+    'max_drawdown_percent': ('MAX_DRAWDOWN_PERCENT', float, 0, 100),
+}
+
+# Пределы параметров сигнала для /set (flow_depth — одна из FLOW_DEPTHS)
+SIGNAL_PARAM_BOUNDS = {
+    **dict.fromkeys(('rsi_weight', 'rsi_soft_weight', 'macd_weight', 'macd_soft_weight',
+                     'vwap_weight', 'vwap_soft_weight', 'momentum_weight', 'flow_weight',
+                     'micro_weight'), (0, 100)),
+    **dict.fromkeys(('rsi_oversold', 'rsi_low', 'rsi_high', 'rsi_overbought',
+                     'flow_buy', 'flow_sell'), (0, 100)),
+    'macd_strong': (0, 100000),
+    'vwap_band': (0, 10),
+    'momentum_band': (0, 10),
+    'micro_tilt': (0, 1),
+    **dict.fromkeys(('tf_5m_weight', 'tf_15m_weight', 'tf_1h_weight'), (0, 2)),
+}
+# Пороги, которые должны идти строго по возрастанию
+SIGNAL_PARAM_ORDER = (
+    ('rsi_oversold', 'rsi_low', 'rsi_high', 'rsi_overbought'),
+    ('flow_sell', 'flow_buy'),
+)
+
+HISTORY_COMMAND_LIMIT = 20   # Максимум ставок в ответе /history
+SUBSCRIBERS_COMMAND_LIMIT = 20  # Подписчиков в ответе /subscribers (с наибольшей задержкой)
+STATUS_BETS_SHOWN = 3        # Ближайших открытых ставок рынка в ответе /status
+
+# Команды подписчика: из чатов не-администраторов принимаются от подписчиков,
+# /subscribe — от всех только при OPEN_SUBSCRIPTION
+SUBSCRIBER_COMMANDS = ('subscribe', 'unsubscribe', 'lang', 'style', 'minconf', 'monitoring')
+
+
+def handle_command(command, args, chat_id):
+    """
+    Обрабатывает команду из чата (в потоке опроса). Ответ строится из
+    состояния в памяти, без запросов к биржам; изменения настроек и паузы
+    применяются задачей планировщика — между тиками.
+    """
+    if command in ('status', 'start'):
+        return format_command_status()
+    if command == 'history':
+        n = int(args[0]) if args else 10
+        return format_history_message(max(1, min(n, HISTORY_COMMAND_LIMIT)))
+    if command in ('pause', 'resume'):
+        scheduler.at(clock.utcnow(), partial(set_paused, command == 'pause', chat_id),
+                     name='command', priority=PRIORITY_HIGH)
+        return None
+    if command in SUBSCRIBER_COMMANDS:
+        return handle_subscriber_command(command, args, chat_id)
+    if command == 'subscribers':
+        return format_subscribers_message()
+    if command == 'sub':
+        if len(args) < 2 or args[0] not in ('add', 'del'):
+            return "Использование: /sub add|del chat_id [мин. уверенность]"
+        if args[0] == 'del':
+            return "✅ Удалён" if subscribers.remove(args[1]) else "Нет такого подписчика"
+        subscriber = subscribers.add(args[1], min_confidence=args[2] if len(args) > 2 else None)
+        return f"✅ Подписчик {subscriber.chat_id}, мин. уверенность {subscriber.min_confidence}%"
+    if command == 'set':
+        if len(args) != 2:
+            names = ', '.join(list(TUNABLE_SETTINGS) + list(SIGNAL_PARAMS))
+            return f"Использование: /set имя значение\nДоступно: {names}"
+        name, value = parse_setting(args[0], args[1])
+        scheduler.at(clock.utcnow(), partial(apply_setting, name, value, chat_id),
+                     name='command', priority=PRIORITY_HIGH)
+        return None
+    return ("Команды: /status, /history [N], /pause, /resume, /set имя значение, "
+            "/subscribers, /sub add|del chat_id\n"
+            "Подписка: /subscribe, /unsubscribe, /lang ru|en, /style verbose|compact, "
+            "/minconf N, /monitoring on|off")
+
+
+def handle_subscriber_command(command, args, chat_id):
+    """Команды подписчика; при закрытой подписке чаты вне списка молча игнорируются."""
+    if not OPEN_SUBSCRIPTION and chat_id not in ADMIN_CHATS and chat_id not in subscribers:
+        return None
+    if command == 'subscribe':
+        subscriber = subscribers.add(chat_id)
+        return (f"✅ Подписка оформлена: {subscriber.lang}, {subscriber.style}, "
+                f"мин. уверенность {subscriber.min_confidence}%")
+    if command == 'unsubscribe':
+        return "👋 Подписка отменена" if subscribers.remove(chat_id) else "Подписки не было"
     
-    is_winning = current_pnl > 0
+    if not args:
+        subscriber = subscribers.get(chat_id)
+        lang, style = messages.variant_for(chat_id)
+        msg = (f"Язык: {lang} ({', '.join(messages.LANGS)}), "
+               f"вариант: {style} ({', '.join(messages.STYLES)})")
+        if subscriber is not None:
+            msg += (f"\nМин. уверенность: {subscriber.min_confidence}%, "
+                    f"мониторинг: {'вкл' if subscriber.monitoring else 'выкл'}")
+        return msg
     
-    msg = f"""
-<b>━━━ ⏳ СТАВКА АКТИВНА ━━━</b>
-🕐 {now.strftime('%H:%M:%S UTC')}
+    value = args[0].lower()
+    if command == 'minconf':
+        settings = {'min_confidence': value}
+    elif command == 'monitoring':
+        settings = {'monitoring': value in ('on', '1', 'yes', 'вкл')}
+    else:
+        settings = {command: value}
+    if chat_id not in subscribers:
+        if command in ('minconf', 'monitoring'):
+            return "Сначала /subscribe"
+        lang, style = messages.set_preference(chat_id, **settings)
+        return f"✅ Сообщения: {lang}, {style}"
+    subscriber = subscribers.update(chat_id, **settings)
+    return (f"✅ Сообщения: {subscriber.lang}, {subscriber.style}, "
+            f"мин. уверенность {subscriber.min_confidence}%, "
+            f"мониторинг {'вкл' if subscriber.monitoring else 'выкл'}")
+
+
+def parse_setting(name, raw):
+    """Проверяет имя и значение настройки; ValueError с пояснением при ошибке."""
+    name = name.lower()
+    if name in TUNABLE_SETTINGS:
+        _, kind, low, high = TUNABLE_SETTINGS[name]
+        value = kind(raw)
+        if not low <= value <= high:
+            raise ValueError(f"{name} должно быть от {low} до {high}")
+        return name, value
+    if name == 'flow_depth':
+        value = int(raw)
+        if value not in FLOW_DEPTHS:
+            raise ValueError(f"flow_depth должно быть одним из {', '.join(map(str, FLOW_DEPTHS))}")
+        return name, value
+    if name in SIGNAL_PARAMS:
+        value = type(SIGNAL_PARAMS[name])(raw)
+        low, high = SIGNAL_PARAM_BOUNDS[name]
+        if not low <= value <= high:
+            raise ValueError(f"{name} должно быть от {low} до {high}")
+        return name, value
+    raise ValueError(f"неизвестная настройка {name}")
+
+
+def signal_order_error(params):
+    """Текст ошибки, если пороги SIGNAL_PARAM_ORDER идут не по возрастанию, иначе None."""
+    for names in SIGNAL_PARAM_ORDER:
+        values = [params[name] for name in names]
+        if any(a >= b for a, b in zip(values, values[1:])):
+            shown = ' < '.join(f"{name} ({params[name]})" for name in names)
+            return f"должно быть {shown}"
+    return None
 
-<b>💰 BTC: ${price:,.2f}</b>
 
-<b>{'🟢' if bet['direction'] == 'UP' else '🔴'} {bet['direction']} {'📈' if bet['direction'] == 'UP' else '📉'}</b>
-💵 Ставка: ${bet['amount']:.2f}
-📊 Вход: ${bet['entry_price']:,.2f}
+def apply_setting(name, value, chat_id, scheduled_at):
+    """Меняет настройку (в потоке планировщика, между тиками) и подтверждает в чат."""
+    global SIGNAL_PARAMS
+    
+    if name in TUNABLE_SETTINGS:
+        target = TUNABLE_SETTINGS[name][0]
+        old = globals()[target]
+        low = value if name == 'min_bet_percent' else MIN_BET_PERCENT
+        high = value if name == 'max_bet_percent' else MAX_BET_PERCENT
+        if low > high:
+            send_telegram(f"⚠️ min_bet_percent ({low}) больше max_bet_percent ({high})", chat_id)
+            return
+        globals()[target] = value
+    else:
+        old = SIGNAL_PARAMS[name]
+        params = {**SIGNAL_PARAMS, name: value}
+        error = signal_order_error(params)
+        if error:
+            send_telegram(f"⚠️ {error}", chat_id)
+            return
+        # Словарь заменяется целиком — calculate_signal видит либо старый, либо новый
+        SIGNAL_PARAMS = params
+    log('setting', f"⚙️ {name}: {old} → {value}", name=name, old=old, value=value)
+    send_telegram(f"⚙️ {name}: {old} → <b>{value}</b>", chat_id)
+
+
+def set_paused(paused, chat_id, scheduled_at):
+    global trading_paused
+    
+    trading_paused = paused
+    log('paused' if paused else 'resumed', "⏸ Ставки на паузе" if paused else "▶️ Ставки возобновлены")
+    if paused:
+        send_telegram("⏸ Новые ставки приостановлены. Открытые закроются по расписанию.", chat_id)
+    else:
+        send_telegram("▶️ Ставки возобновлены.", chat_id)
 
-<b>{'✅' if is_winning else '❌'} Текущий P&L: {'+' if current_pnl > 0 else ''}{current_pnl:.2f}</b>
 
-<b>⏱ Осталось: {remaining:.1f} мин</b>
-<b>━━━━━━━━━━━━━━━━━━━━━</b>
-"""
-    return msg
+# ═══════════════════════════════════════════════════════════════
+# РАСПИСАНИЕ
+# ═══════════════════════════════════════════════════════════════
+
+def run_tick(scheduled_at, only=None):
+    """
+    Оценка сигналов на закрытии минутной свечи и открытие ставок.
+    only — рынки для оценки (по умолчанию все). Данные по каждому символу
+    запрашиваются один раз, цены дополнительных символов — одним запросом.
+    """
+    # Рынки, для которых этот момент уже оценён (например, закрытием ставки), пропускаем
+    due = [market for market in (only or markets) if market.last_tick_at != scheduled_at]
+    if not due:
+        return
+    for market in due:
+        market.last_tick_at = scheduled_at
+    
+    log('tick', f"\n[{scheduled_at.strftime('%H:%M:%S')}] Проверка...",
+        scheduled_at=scheduled_at, markets=[market.key for market in due])
+    with STAGE_SECONDS.time(stage='tick'):
+        _evaluate_due(scheduled_at, due)
+
+
+def _evaluate_due(scheduled_at, due):
+    groups = group_by_symbol(due)
+    extra = [symbol for symbol in groups if symbol != default_market.symbol]
+    prices = {}
+    if extra:
+        with STAGE_SECONDS.time(stage='price'):
+            prices = get_binance_prices(extra)
+    
+    for symbol, group in groups.items():
+        # Получаем данные
+        if symbol in extra and symbol not in prices:
+            DATA_FALLBACKS.inc(reason='batch_price_missing')
+        # Движку нужен только хвост окна от последней учтённой свечи
+        engine = group[0].engine
+        price, candles, flow = fetch_market_data(symbol, prices.get(symbol), engine.last_open_time)
+        if price == 0:
+            log('no_price', f"⚠️ Нет данных о цене {symbol}", symbol=symbol)
+            continue
+        
+        # Индикаторы обновляются инкрементально, один раз на символ
+        indicators = engine.sync(candles) if candles else None
+        for market in group:
+            evaluate_market(market, scheduled_at, price, candles, flow, indicators)
+
+
+def record_evaluation(market, now, price, signal, indicators):
+    """Пишет оценку в журнал и исход оценок, чей горизонт истёк к этому тику."""
+    ts = now.timestamp()
+    audit_log.resolve(market.key, ts, price,
+                      lambda due: get_price_at(datetime.fromtimestamp(due, timezone.utc), market.symbol))
+    audit_log.append(market.key, market.horizon, ts, price, signal,
+                     indicators['volatility'] if indicators else 0.0)
+
+
+def evaluate_market(market, now, price, candles, flow, indicators):
+    """Сигнал по рынку: закрытие наступившей ставки или открытие новой."""
+    market.price_history.append(price)
+    if len(market.price_history) > 200:
+        market.price_history = market.price_history[-200:]
+    
+    with STAGE_SECONDS.time(stage='signal'):
+        buy_pressure = flow['buy_pressure'] if flow else 50
+        signal = calculate_signal(price, candles, buy_pressure, indicators,
+                                  history=market.price_history, flow=flow)
+    if first_signal_seconds is None:
+        mark_first_signal(market, signal)
+    if audit_log is not None:
+        record_evaluation(market, now, price, signal, indicators)
+    
+    portfolio = market.simulation['portfolio']
+    nearest = portfolio.peek()
+    if nearest is not None and now >= nearest['close_time']:
+        # Тик совпал с закрытием и выполнился раньше него
+        close_due_bets(market, price, now)
+    portfolio.mark(price)
+    if portfolio:
+        nearest = portfolio.peek()
+        remaining = (nearest['close_time'] - now).total_seconds() / 60
+        log('bet_active', f"⏳ {market.key}: открыто ставок {len(portfolio)}, "
+                          f"ближайшая закроется через {remaining:.1f} мин",
+            market=market.key, open_bets=len(portfolio), remaining_minutes=round(remaining, 2),
+            exposure=round(portfolio.exposure, 2),
+            unrealized=round(portfolio.unrealized(LOSE_MULTIPLIER), 2))
+    if trading_paused or len(portfolio) >= MAX_OPEN_BETS:
+        return
+    
+    # Есть место в портфеле — пробуем открыть
+    if signal['confidence'] >= MIN_CONFIDENCE:
+        volatility = indicators['volatility'] if indicators else 0.0
+        bet_info = open_bet(signal['direction'], signal['confidence'], price, now, market, volatility)
+        if bet_info:
+            msg = format_new_bet_message(price, signal, bet_info, market)
+            broadcast(msg)
+            schedule_bet_jobs(market, bet_info['bet'])
+            log('bet_open', f"🎯 {market.key}: открыта ставка {signal['direction']} ${bet_info['amount']:.2f}",
+                market=market.key, direction=signal['direction'], confidence=signal['confidence'],
+                amount=bet_info['amount'], entry_price=price, open_bets=len(portfolio))
+        else:
+            log('bet_skipped', f"🧱 {market.key}: ставка не открыта — нет преимущества по Келли "
+                               f"или исчерпан предел {MAX_EXPOSURE_PERCENT}%",
+                market=market.key, confidence=signal['confidence'],
+                exposure=round(portfolio.exposure, 2))
+    elif not portfolio:
+        # Отправляем статус каждые 15 минут если нет ставок
+        if market.last_signal_time is None or (now - market.last_signal_time).total_seconds() >= 900:
+            msg = format_status_message(price, signal, market)
+            broadcast(msg)
+            market.last_signal_time = now
+            log('signal_weak', f"📊 {market.key}: сигнал слабый {signal['confidence']}%",
+                market=market.key, direction=signal['direction'], confidence=signal['confidence'])
+
+
+def settle_bet(market, bet, scheduled_at):
+    """Закрывает ставку ровно в close_time (с ней — все наступившие) и сразу пробует открыть новую."""
+    if bet not in market.simulation['portfolio']:
+        return
+    
+    with STAGE_SECONDS.time(stage='settle'):
+        price = get_current_price(market.symbol)
+    if price == 0:
+        log('settle_retry', "⚠️ Нет цены для закрытия, повтор", market=market.key)
+        scheduler.at(clock.utcnow() + timedelta(seconds=SETTLE_RETRY_SECONDS),
+                     partial(settle_bet, market, bet), name='settle', priority=PRIORITY_HIGH)
+        return
+    
+    close_due_bets(market, price, max(clock.utcnow(), bet['close_time']))
+    
+    # Сразу проверяем, можно ли открыть новую
+    run_tick(scheduled_at, only=[market])
+
+
+def close_due_bets(market, price, now):
+    """Закрывает ставки, срок которых наступил к now, и отправляет результаты."""
+    portfolio = market.simulation['portfolio']
+    close_times = [bet['close_time'] for bet in portfolio]
+    results = settle_due_bets(price, now, market)
+    for close_time, bet_result in zip(close_times, results):
+        lag = (clock.utcnow() - close_time).total_seconds()
+        SETTLE_LAG_SECONDS.observe(lag, market=market.key)
+        SETTLE_LAG.set(lag, market=market.key)
+        
+        msg = format_close_bet_message(bet_result, price, market)
+        broadcast(msg)
+        log('bet_close', f"{'✅ WIN' if bet_result['won'] else '❌ LOSS'} {market.key}: "
+                         f"{bet_result['pnl']:.2f} (задержка {lag:.2f} с)",
+            market=market.key, won=bet_result['won'], pnl=bet_result['pnl'], exit_price=price,
+            settle_lag=lag)
+    return results
+
+
+def send_reminder(market, bet, scheduled_at):
+    """Статус открытой ставки за REMINDER_MINUTES до закрытия."""
+    if bet not in market.simulation['portfolio']:
+        return
+    
+    price = get_current_price(market.symbol)
+    if price == 0:
+        return
+    remaining = (bet['close_time'] - clock.utcnow()).total_seconds() / 60
+    broadcast(format_waiting_message(price, bet, remaining, market))
+
+
+def schedule_bet_jobs(market, bet):
+    """Назначает закрытие ставки и напоминания о ней."""
+    scheduler.at(bet['close_time'], partial(settle_bet, market, bet), name='settle',
+                 priority=PRIORITY_HIGH)
+    now = clock.utcnow()
+    for minutes in REMINDER_MINUTES:
+        # Напоминания только в пределах горизонта ставки
+        when = bet['close_time'] - timedelta(minutes=minutes)
+        if when > now and minutes < market.horizon:
+            scheduler.at(when, partial(send_reminder, market, bet), name='reminder')
 
 # ═══════════════════════════════════════════════════════════════
 # MAIN
 # ═══════════════════════════════════════════════════════════════
 
 def main():
-    global price_history, last_signal_time
+    metrics.json_logs = JSON_LOGS
+    log('start', "🚀 Bitcoin Bot v3 (Polymarket Style) запущен!\n"
+                 f"⚙️ Минимальная уверенность: {MIN_CONFIDENCE}%\n"
+                 f"⚙️ Размер ставки: {MIN_BET_PERCENT}%-{MAX_BET_PERCENT}%\n"
+                 f"⚙️ Длительность: {BET_DURATION_MINUTES} минут",
+        min_confidence=MIN_CONFIDENCE, min_bet_percent=MIN_BET_PERCENT,
+        max_bet_percent=MAX_BET_PERCENT, markets=[market.key for market in markets])
     
-    print("🚀 Bitcoin Bot v3 (Polymarket Style) запущен!")
-    print(f"⚙️ Минимальная уверенность: {MIN_CONFIDENCE}%")
-    print(f"⚙️ Размер ставки: {MIN_BET_PERCENT}%-{MAX_BET_PERCENT}%")
-    print(f"⚙️ Длительность: {BET_DURATION_MINUTES} минут")
+    if REPLAY_PATH:
+        # Без сети, потока, базы состояния и очереди Telegram: только путь решений
+        start_replay()
+    else:
+        if CAPTURE_PATH:
+            start_capture()
+        if AUDIT_DIR:
+            start_audit()
+        start_metrics_server()
+        start_subscribers()
+        start_telegram_outbox()
+        if STREAM_MODE:
+            start_market_feed()
     
-    send_telegram(f"""🤖 <b>Bitcoin Bot v3 запущен!</b>
-
-<b>Настройки:</b>
-• Минимальная уверенность: {MIN_CONFIDENCE}%
-• Размер ставки: {MIN_BET_PERCENT}%-{MAX_BET_PERCENT}%
-• Длительность ставки: {BET_DURATION_MINUTES} мин
-• Депозит: ${STARTING_BALANCE}
-
-<i>Симуляция ставок в стиле Polymarket</i>
-""")
-    
-    while True:
-        try:
-            now = datetime.now(timezone.utc)
-            print(f"\n[{now.strftime('%H:%M:%S')}] Проверка...")
-            
-            # Получаем данные
-            price = get_btc_price()
-            if price == 0:
-                print("⚠️ Нет данных о цене")
-                time.sleep(30)
-                continue
-            
-            price_history.append(price)
-            if len(price_history) > 200:
-                price_history = price_history[-200:]
-            
-            candles = get_candles()
-            buy_pressure = get_orderbook()
-            
-            # Рассчитываем сигнал
-            signal = calculate_signal(price, candles, buy_pressure)
-            
-            # Проверяем активную ставку
-            bet_result = check_and_close_bet(price)
-            
-            if bet_result:
-                if bet_result['status'] == 'closed':
-                    # Ставка закрылась — отправляем результат
-                    msg = format_close_bet_message(bet_result, price)
-                    send_telegram(msg)
-                    print(f"{'✅ WIN' if bet_result['won'] else '❌ LOSS'}: {bet_result['pnl']:.2f}")
-                    
-                    # Сразу проверяем, можно ли открыть новую
-                    time.sleep(2)
-                    
-                elif bet_result['status'] == 'active':
-                    # Ставка ещё активна — отправляем статус каждые 5 минут
-                    remaining = bet_result['remaining_minutes']
-                    
-                    # Отправляем апдейт каждые 5 минут
-                    if remaining <= 10 and remaining > 9.5:
-                        msg = format_waiting_message(price, simulation['active_bet'], remaining)
-                        send_telegram(msg)
-                    elif remaining <= 5 and remaining > 4.5:
-                        msg = format_waiting_message(price, simulation['active_bet'], remaining)
-                        send_telegram(msg)
-                    elif remaining <= 1 and remaining > 0.5:
-                        msg = format_waiting_message(price, simulation['active_bet'], remaining)
-                        send_telegram(msg)
-                    
-                    print(f"⏳ Ставка активна, осталось {remaining:.1f} мин")
-            
-            # Если нет активной ставки — пробуем открыть
-            if simulation['active_bet'] is None:
-                if signal['confidence'] >= MIN_CONFIDENCE:
-                    bet_info = open_bet(signal['direction'], signal['confidence'], price)
-                    if bet_info:
-                        msg = format_new_bet_message(price, signal, bet_info)
-                        send_telegram(msg)
-                        print(f"🎯 Открыта ставка: {signal['direction']} ${bet_info['amount']:.2f}")
-                else:
-                    # Отправляем статус каждые 15 минут если нет ставки
-                    if last_signal_time is None or (now - last_signal_time).total_seconds() >= 900:
-                        msg = format_status_message(price, signal)
-                        send_telegram(msg)
-                        last_signal_time = now
-                        print(f"📊 Сигнал слабый: {signal['confidence']}%")
-            
-            time.sleep(CHECK_INTERVAL)
-            
-        except Exception as e:
-            print(f"⚠️ Ошибка: {e}")
-            time.sleep(60)
-
-
+    # Свечи — до восстановления: цены закрытия просроченных ставок берутся из окна.
+    # При воспроизведении тоже: прогрев забирает те же записанные ответы, что и при записи
+    warm_start()
+    recovered = [] if REPLAY_PATH else restore_state()
+    for market, result in recovered:
+        broadcast(format_close_bet_message(result, result['exit_price'], market))
+        log('bet_close', f"{'✅ WIN' if result['won'] else '❌ LOSS'} {market.key} (после перезапуска): "
+                         f"{result['pnl']:.2f}",
+            market=market.key, won=result['won'], pnl=result['pnl'], recovered=True)
+    for market in markets:
+        for bet in market.simulation['portfolio']:
+            schedule_bet_jobs(market, bet)
+    # Команды — после восстановления, иначе ранние /status и /history показали бы пустое состояние
+    if not REPLAY_PATH and COMMANDS_ENABLED:
+        start_command_poller()
+    
+    # Первая проверка сразу, дальше — на закрытии каждой минутной свечи
+    scheduler.at(clock.utcnow(), run_tick, name='tick')
+    scheduler.at(clock.utcnow(), send_startup_banner, name='banner', priority=PRIORITY_LOW)
+    scheduler.every(CHECK_INTERVAL, run_tick, name='tick', offset=SIGNAL_OFFSET_SECONDS)
+    if REPLAY_PATH:
+        scheduler.every(CHECK_INTERVAL, stop_when_replayed, name='replay',
+                        offset=SIGNAL_OFFSET_SECONDS + 1)
+    scheduler.run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Локальный кэш минутных свечей Binance.
+
+Окно свечей хранится в памяти; каждый цикл запрашиваются только свечи,
+начиная с последней (ещё не закрытой) — обычно одна-две строки вместо
+всего окна. Окно сохраняется на диск, так что после перезапуска
+индикаторы считаются сразу, а глубокая история (1000+ свечей)
+не стоит ничего, кроме первой загрузки.
+"""
+
+import json
+import os
+import threading
+from collections import deque
+
+import clock
+from metrics import log
+from transport import http_get
+
+KLINES_URL = "https://api.binance.com/api/v3/klines"
+MAX_PAGE = 1000              # Лимит строк в одном ответе Binance
+SAVE_INTERVAL = 300          # Секунд между записями окна на диск
+
+INTERVAL_MS = {
+    '1m': 60_000, '3m': 180_000, '5m': 300_000, '15m': 900_000, '30m': 1_800_000,
+    '1h': 3_600_000, '2h': 7_200_000, '4h': 14_400_000, '1d': 86_400_000,
+}
+
+
+def tail(candles, since=None):
+    """
+    Свечи окна с open_time >= since (все — при since=None). Ищет с конца,
+    так что копируется только хвост, а не всё окно.
+    """
+    if since is None:
+        return list(candles)
+    start = len(candles)
+    while start > 0 and candles[start - 1]['open_time'] >= since:
+        start -= 1
+    return [candles[i] for i in range(start, len(candles))]
+
+
+def parse_kline(k):
+    return {
+        'open_time': int(k[0]),
+        'open': float(k[1]),
+        'high': float(k[2]),
+        'low': float(k[3]),
+        'close': float(k[4]),
+        'volume': float(k[5])
+    }
+
+
+class CandleCache:
+    """Окно последних limit свечей символа с дозагрузкой только новых."""
+
+    def __init__(self, symbol="BTCUSDT", interval="1m", limit=100, path=None, timeout=10,
+                 save_interval=SAVE_INTERVAL):
+        """
+        path — JSON-файл для сохранения окна между запусками (None — не сохранять).
+        Окно пишется не чаще раза в save_interval секунд: после перезапуска
+        недостающие свечи всё равно дозагружаются одним запросом.
+        """
+        self.symbol = symbol
+        self.interval = interval
+        self.interval_ms = INTERVAL_MS[interval]
+        self.limit = limit
+        self.path = path
+        self.timeout = timeout
+        self.save_interval = save_interval
+        self._saved_at = None
+        self._candles = deque(maxlen=limit)
+        self._lock = threading.Lock()
+        self.stats = {'full_fetches': 0, 'delta_fetches': 0, 'rows': 0}
+        if path:
+            self._load()
+
+    # ───────────────────────────────────────────────────────────
+    # Интерфейс
+    # ───────────────────────────────────────────────────────────
+
+    def get(self, since=None):
+        """
+        Обновляет окно и возвращает свечи (последняя — текущая) или None.
+        since — open_time, с которого нужен хвост окна (None — окно целиком).
+        """
+        with self._lock:
+            try:
+                changed = self._refresh()
+            except Exception as e:
+                log('candle_cache_error', f"Candle cache error ({self.symbol}): {e}",
+                    symbol=self.symbol, error=str(e))
+                changed = False
+            if changed and self.path:
+                now = clock.monotonic()
+                if self._saved_at is None or now - self._saved_at >= self.save_interval:
+                    self._save()
+                    self._saved_at = now
+            return tail(self._candles, since) if self._candles else None
+
+    def candles(self):
+        """Окно без запросов к бирже."""
+        with self._lock:
+            return list(self._candles)
+
+    def open_at(self, moment_ms):
+        """
+        Open первой свечи, начавшейся не раньше moment_ms, если окно покрывает
+        этот момент без пропуска; иначе None. Без запросов к бирже.
+        """
+        with self._lock:
+            candles = self._candles
+            if not candles or candles[0]['open_time'] >= moment_ms:
+                return None
+            for i in range(len(candles) - 1, 0, -1):
+                if candles[i - 1]['open_time'] < moment_ms <= candles[i]['open_time']:
+                    if candles[i]['open_time'] - candles[i - 1]['open_time'] != self.interval_ms:
+                        return None
+                    return candles[i]['open']
+            return None
+
+    # ───────────────────────────────────────────────────────────
+    # Загрузка
+    # ───────────────────────────────────────────────────────────
+
+    def _refresh(self):
+        now_ms = int(clock.time() * 1000)
+        if self._candles:
+            last_open = self._candles[-1]['open_time']
+            missing = (now_ms - last_open) // self.interval_ms + 1
+            if missing < self.limit:
+                # Дозагрузка с последней свечи: она ещё могла меняться.
+                # Пропуск после простоя — одним запросом, если влезает в MAX_PAGE
+                rows = self._fetch_range(last_open, missing + 1)
+                if rows is None:
+                    return False
+                self.stats['delta_fetches'] += 1
+                self._merge(rows)
+                return True
+
+        # Кэш пуст или устарел больше чем на окно — загружаем окно целиком
+        start = now_ms - (self.limit - 1) * self.interval_ms
+        start -= start % self.interval_ms
+        rows = self._fetch_range(start, self.limit)
+        if rows is None:
+            return False
+        self.stats['full_fetches'] += 1
+        self._candles.clear()
+        self._merge(rows)
+        return True
+
+    def _fetch_range(self, start_ms, count):
+        """До count свечей с start_ms страницами по MAX_PAGE (None — ошибка запроса)."""
+        rows = []
+        while len(rows) < count:
+            limit = min(MAX_PAGE, count - len(rows))
+            page = self._fetch(start_ms, limit)
+            if page is None:
+                return None
+            rows.extend(page)
+            if len(page) < limit:
+                break
+            start_ms = page[-1]['open_time'] + self.interval_ms
+        return rows
+
+    def _fetch(self, start_ms, limit):
+        response = http_get(
+            KLINES_URL,
+            params={"symbol": self.symbol, "interval": self.interval,
+                    "startTime": start_ms, "limit": limit},
+            timeout=self.timeout
+        )
+        if response.status_code != 200:
+            return None
+        rows = [parse_kline(k) for k in response.json()]
+        self.stats['rows'] += len(rows)
+        return rows
+
+    def _merge(self, rows):
+        """Заменяет свечи с тем же open_time и дописывает более новые."""
+        for candle in rows:
+            if self._candles and candle['open_time'] <= self._candles[-1]['open_time']:
+                # Обычно совпадает последняя (текущая) свеча — ищем с конца
+                for i in range(len(self._candles) - 1, -1, -1):
+                    if self._candles[i]['open_time'] == candle['open_time']:
+                        self._candles[i] = candle
+                        break
+                continue
+            self._candles.append(candle)
+
+    # ───────────────────────────────────────────────────────────
+    # Диск
+    # ───────────────────────────────────────────────────────────
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('symbol') != self.symbol or data.get('interval') != self.interval:
+            return
+        fields = data['fields']
+        self._candles.extend(dict(zip(fields, row)) for row in data['rows'])
+
+    def _save(self):
+        fields = list(self._candles[0])
+        data = {
+            'symbol': self.symbol,
+            'interval': self.interval,
+            'fields': fields,
+            'rows': [[c[f] for f in fields] for c in self._candles],
+        }
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            log('candle_cache_save_error', f"Candle cache save error: {e}",
+                symbol=self.symbol, path=self.path, error=str(e))
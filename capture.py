@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Запись и воспроизведение рыночных данных.
+
+В режиме записи каждый GET-ответ бирж из CAPTURE_HOSTS (и итоговая цена
+get_btc_price) дописывается в бинарный журнал вместе со временем получения. В режиме
+воспроизведения транспорт вместо сети отдаёт ответы из журнала — по
+очереди для каждого ключа (хост + путь + символ), так что решения бота
+повторяются без сети, а часы идут от момента начала записи. Запросы
+к другим хостам (Telegram) и URL с учётными данными не пишутся никогда.
+Окно свечей при записи и воспроизведении не читается с диска: иначе
+тёплый кэш при записи и холодный при воспроизведении запрашивали бы
+разные ответы по одному ключу.
+
+Формат файла: MAGIC, затем кадры
+    <B kind> <d ts> <I length> payload
+kind 0 — объявление ключа (payload — имя ключа в UTF-8, id по порядку),
+kind 1 — ответ (payload — <H key_id> <H status> + zlib(тело)).
+
+Просмотр журнала:
+    python capture.py capture.bin
+"""
+
+import json
+import struct
+import sys
+import threading
+import zlib
+from collections import Counter, deque
+from urllib.parse import parse_qsl, urlsplit
+
+import clock
+
+MAGIC = b"BTCCAP1\n"
+FRAME = struct.Struct("<BdI")
+RESPONSE = struct.Struct("<HH")
+
+KIND_KEY = 0
+KIND_RESPONSE = 1
+
+STATUS_VALUE = 0     # Кадр хранит значение (JSON), а не HTTP-ответ
+
+# Хосты, чьи ответы пишутся в журнал: биржи и источники цены
+CAPTURE_HOSTS = frozenset({'api.binance.com', 'api.coingecko.com', 'api.coinbase.com'})
+# Параметры запроса с учётными данными: такие URL не пишутся
+SECRET_PARAMS = frozenset({'token', 'key', 'apikey', 'api_key', 'secret', 'signature'})
+
+
+def capturable(url, params=None):
+    """Запрос к хосту из CAPTURE_HOSTS без учётных данных в URL и параметрах."""
+    parts = urlsplit(url)
+    if parts.hostname not in CAPTURE_HOSTS or parts.username or parts.password:
+        return False
+    names = {name.lower() for name, _ in parse_qsl(parts.query)}
+    names.update(str(name).lower() for name in (params or {}))
+    return not names & SECRET_PARAMS
+
+
+def request_key(url, params=None):
+    """Ключ запроса: хост, путь и символ. startTime/limit не входят — они зависят от времени."""
+    parts = urlsplit(url)
+    key = f"{parts.netloc}{parts.path}"
+    symbol = (params or {}).get('symbol')
+    if symbol:
+        key += f"?{symbol}"
+    return key
+
+
+class CaptureWriter:
+    """Журнал только для дописывания; потокобезопасен."""
+
+    def __init__(self, path):
+        self.path = path
+        self._keys = {}
+        self._lock = threading.Lock()
+        existing = list(read_frames(path, raw=True)) if _exists(path) else []
+        for kind, _, payload in existing:
+            if kind == KIND_KEY:
+                self._keys[payload.decode('utf-8')] = len(self._keys)
+        self._file = open(path, 'ab')
+        if not existing and self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self.frames = 0
+
+    def record(self, key, status, body, ts=None):
+        """Записывает ответ: status — HTTP-код, body — bytes или str."""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        ts = clock.time() if ts is None else ts
+        with self._lock:
+            key_id = self._keys.get(key)
+            if key_id is None:
+                key_id = self._keys[key] = len(self._keys)
+                self._write(KIND_KEY, ts, key.encode('utf-8'))
+            self._write(KIND_RESPONSE, ts, RESPONSE.pack(key_id, status) + zlib.compress(body))
+            self._file.flush()
+            self.frames += 1
+
+    def record_value(self, key, value, ts=None):
+        """Записывает значение, вычисленное ботом (например, итоговую цену)."""
+        self.record(key, STATUS_VALUE, json.dumps(value), ts)
+
+    def _write(self, kind, ts, payload):
+        self._file.write(FRAME.pack(kind, ts, len(payload)))
+        self._file.write(payload)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def _exists(path):
+    try:
+        with open(path, 'rb') as f:
+            return bool(f.read(1))
+    except OSError:
+        return False
+
+
+def read_frames(path, raw=False):
+    """
+    Кадры журнала по порядку: (ts, ключ, status, тело bytes).
+    raw=True — необработанные (kind, ts, payload). Оборванный хвост пропускается.
+    """
+    keys = []
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: не журнал записи")
+        while True:
+            header = f.read(FRAME.size)
+            if len(header) < FRAME.size:
+                return
+            kind, ts, length = FRAME.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            if raw:
+                yield kind, ts, payload
+            elif kind == KIND_KEY:
+                keys.append(payload.decode('utf-8'))
+            elif kind == KIND_RESPONSE:
+                key_id, status = RESPONSE.unpack_from(payload)
+                yield ts, keys[key_id], status, zlib.decompress(payload[RESPONSE.size:])
+
+
+class ReplayResponse:
+    """Ответ из журнала с интерфейсом requests.Response, который использует бот."""
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.content = body
+        self.text = body.decode('utf-8')
+        self.ok = 200 <= status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class ReplayLog:
+    """Очереди записанных ответов по ключам."""
+
+    def __init__(self, path):
+        self._queues = {}
+        self._lock = threading.Lock()
+        self.first_ts = None
+        self.last_ts = None
+        self.total = 0
+        for ts, key, status, body in read_frames(path):
+            self._queues.setdefault(key, deque()).append((ts, status, body))
+            self.first_ts = ts if self.first_ts is None else self.first_ts
+            self.last_ts = ts
+            self.total += 1
+        self.served = 0
+        self.misses = Counter()
+
+    def respond(self, key):
+        """Следующий ответ по ключу или None, если они закончились."""
+        with self._lock:
+            queue = self._queues.get(key)
+            if not queue:
+                self.misses[key] += 1
+                return None
+            _, status, body = queue.popleft()
+            self.served += 1
+        return ReplayResponse(status, body)
+
+    def value(self, key):
+        """Следующее записанное значение по ключу (record_value) или None."""
+        response = self.respond(key)
+        return response.json() if response is not None else None
+
+    @property
+    def exhausted(self):
+        """Журнал исчерпан: ответов не осталось или запрошен ключ, которого уже нет."""
+        with self._lock:
+            return bool(self.misses) or not any(self._queues.values())
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print("Использование: python capture.py capture.bin")
+        return 2
+    counts = Counter()
+    sizes = Counter()
+    first = last = None
+    for ts, key, status, body in read_frames(argv[0]):
+        counts[key] += 1
+        sizes[key] += len(body)
+        first = ts if first is None else first
+        last = ts
+    if first is None:
+        print("Журнал пуст")
+        return 0
+    print(f"Кадров: {sum(counts.values())}, интервал {last - first:.0f} с")
+    for key, count in counts.most_common():
+        print(f"{key:<60} {count:>7} ответов {sizes[key] / 1024:>10.1f} КБ")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Часы бота: системные или виртуальные.
+
+Всё, что зависит от времени (планировщик, кэш свечей, моменты ставок),
+берёт его отсюда. При воспроизведении записи ставятся виртуальные часы,
+идущие от момента начала записи — в реальном темпе или без ожидания.
+"""
+
+import time as _time
+from datetime import datetime, timezone
+
+
+class SystemClock:
+    def time(self):
+        return _time.time()
+
+    def monotonic(self):
+        return _time.monotonic()
+
+    def wait(self, event, timeout):
+        """Ждёт event не дольше timeout секунд (None — без ограничения)."""
+        return event.wait(timeout)
+
+
+class VirtualClock:
+    """
+    Часы, начинающиеся с момента start (epoch-секунды).
+    speed = None — ожидание мгновенно сдвигает часы вперёд;
+    иначе часы идут в speed раз быстрее реального времени.
+    """
+
+    def __init__(self, start, speed=None):
+        self.start = start
+        self.speed = speed
+        self._elapsed = 0.0
+        self._real_start = _time.monotonic()
+
+    def monotonic(self):
+        if self.speed is None:
+            return self._elapsed
+        return (_time.monotonic() - self._real_start) * self.speed
+
+    def time(self):
+        return self.start + self.monotonic()
+
+    def wait(self, event, timeout):
+        if event.is_set() or timeout is None:
+            return event.wait(timeout)
+        if self.speed is None:
+            self._elapsed += max(0.0, timeout)
+            return False
+        return event.wait(timeout / self.speed)
+
+
+current = SystemClock()
+
+
+def install(clock):
+    """Подменяет часы процесса (до запуска планировщика)."""
+    global current
+    current = clock
+
+
+def time():
+    return current.time()
+
+
+def monotonic():
+    return current.monotonic()
+
+
+def wait(event, timeout):
+    return current.wait(event, timeout)
+
+
+def utcnow():
+    """Текущий момент, aware datetime UTC."""
+    return datetime.fromtimestamp(current.time(), timezone.utc)
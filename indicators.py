@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+"""
+Инкрементальный движок индикаторов.
+
+Состояние RSI / MACD / VWAP / моментума и реализованной волатильности
+обновляется за O(1) при закрытии каждой свечи. RSI, VWAP и моментум
+совпадают с calculate_rsi / calculate_vwap / get_momentum по тому же окну
+свечей. MACD — непрерывная EMA с затравкой на первой свече, которую видел
+движок: она совпадает с calculate_macd по всему ряду с этой свечи, а не по
+окну. calculate_macd на окне затравливает EMA заново на его первой свече,
+и остаток затравки сдвигает значение (на минутках BTC — до десятых долей
+доллара; см. tests/test_indicators.py).
+
+MultiTimeframeEngine считает те же индикаторы на старших интервалах
+(5m, 15m, 1h), собирая их бары из минутных свечей по мере закрытия.
+"""
+
+from collections import deque
+
+# Раз в столько обновлений скользящие суммы пересчитываются заново,
+# чтобы ошибка округления float не накапливалась
+RESYNC_EVERY = 1000
+
+
+class IndicatorEngine:
+    """Состояние индикаторов для одного символа и интервала."""
+
+    def __init__(self, window=100, rsi_period=14, momentum_period=10,
+                 macd_fast=12, macd_slow=26, macd_signal=9, macd_min_len=35,
+                 volatility_period=15):
+        self.window = window
+        self.rsi_period = rsi_period
+        self.momentum_period = momentum_period
+        self.volatility_period = volatility_period
+        self.macd_min_len = macd_min_len
+        self._k_fast = 2 / (macd_fast + 1)
+        self._k_slow = 2 / (macd_slow + 1)
+        self._k_signal = 2 / (macd_signal + 1)
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.last_open_time = None
+        self.last_close = None
+
+        # RSI: скользящее окно приращений
+        self._deltas = deque(maxlen=self.rsi_period)
+        self._gain_sum = 0.0
+        self._loss_sum = 0.0
+        self._loss_count = 0
+
+        # MACD: EMA с затравкой первой свечой ряда (без перезатравки по окну)
+        self._ema_fast = None
+        self._ema_slow = None
+        self._ema_signal = None
+
+        # VWAP: окно (typical price * volume, volume)
+        self._vwap_terms = deque(maxlen=self.window)
+        self._tp_vol_sum = 0.0
+        self._vol_sum = 0.0
+
+        # Моментум: последние N закрытий
+        self._closes = deque(maxlen=self.momentum_period)
+
+        # Волатильность: окно минутных доходностей (%) и их суммы
+        self._returns = deque(maxlen=self.volatility_period)
+        self._ret_sum = 0.0
+        self._ret_sq_sum = 0.0
+
+        self._updates_since_resync = 0
+
+    # ───────────────────────────────────────────────────────────
+    # Обновление
+    # ───────────────────────────────────────────────────────────
+
+    def update(self, candle):
+        """Добавляет закрытую свечу."""
+        close = candle['close']
+
+        if self.last_close is not None:
+            delta = close - self.last_close
+            if len(self._deltas) == self._deltas.maxlen:
+                old = self._deltas[0]
+                if old > 0:
+                    self._gain_sum -= old
+                elif old < 0:
+                    self._loss_sum += old
+                    self._loss_count -= 1
+            self._deltas.append(delta)
+            if delta > 0:
+                self._gain_sum += delta
+            elif delta < 0:
+                self._loss_sum -= delta
+                self._loss_count += 1
+
+        if self.last_close:
+            ret = delta / self.last_close * 100
+            if len(self._returns) == self._returns.maxlen:
+                old = self._returns[0]
+                self._ret_sum -= old
+                self._ret_sq_sum -= old * old
+            self._returns.append(ret)
+            self._ret_sum += ret
+            self._ret_sq_sum += ret * ret
+
+        self._ema_fast, self._ema_slow, self._ema_signal = self._macd_step(close)
+
+        term = _vwap_term(candle)
+        if len(self._vwap_terms) == self._vwap_terms.maxlen:
+            old_tp_vol, old_vol = self._vwap_terms[0]
+            self._tp_vol_sum -= old_tp_vol
+            self._vol_sum -= old_vol
+        self._vwap_terms.append(term)
+        self._tp_vol_sum += term[0]
+        self._vol_sum += term[1]
+
+        self._closes.append(close)
+        self.last_close = close
+        self.last_open_time = candle.get('open_time')
+        self.count += 1
+
+        self._updates_since_resync += 1
+        if self._updates_since_resync >= RESYNC_EVERY:
+            self._resync()
+
+    def sync(self, candles):
+        """
+        Синхронизирует движок со списком свечей Binance (последняя — текущая,
+        ещё не закрытая) и возвращает снимок индикаторов.
+        Закрытые свечи, которых движок ещё не видел, добавляются по одной.
+        """
+        if not candles:
+            return self.snapshot()
+
+        live = candles[-1]
+        n_closed = len(candles) - 1
+        first_time = candles[0].get('open_time') if n_closed else None
+
+        # Окно не пересекается с состоянием (первый запуск или пропуск) — перестраиваем
+        if (self.last_open_time is None or first_time is None
+                or first_time > self.last_open_time):
+            self.reset()
+            for i in range(n_closed):
+                self.update(candles[i])
+        else:
+            # Новые свечи — в конце окна; ищем с конца, не копируя окно
+            start = n_closed
+            while start > 0 and candles[start - 1]['open_time'] > self.last_open_time:
+                start -= 1
+            for i in range(start, n_closed):
+                self.update(candles[i])
+
+        return self.snapshot(live)
+
+    # ───────────────────────────────────────────────────────────
+    # Значения
+    # ───────────────────────────────────────────────────────────
+
+    def snapshot(self, live=None):
+        """
+        Значения индикаторов. live — текущая незакрытая свеча: учитывается
+        как последняя в ряду, но в состояние не записывается.
+        """
+        return {
+            'rsi': self.rsi(live),
+            'macd': self.macd(live),
+            'vwap': self.vwap(live),
+            'momentum': self.momentum(live),
+            'volatility': self.volatility(live),
+        }
+
+    def rsi(self, live=None):
+        gain_sum, loss_sum, loss_count = self._gain_sum, self._loss_sum, self._loss_count
+        n_prices = self.count
+
+        if live is not None and self.last_close is not None:
+            if len(self._deltas) == self._deltas.maxlen:
+                old = self._deltas[0]
+                if old > 0:
+                    gain_sum -= old
+                elif old < 0:
+                    loss_sum += old
+                    loss_count -= 1
+            delta = live['close'] - self.last_close
+            if delta > 0:
+                gain_sum += delta
+            elif delta < 0:
+                loss_sum -= delta
+                loss_count += 1
+        if live is not None:
+            n_prices += 1
+
+        if n_prices < self.rsi_period + 1:
+            return 50
+        if loss_count == 0:
+            return 100
+        gains = gain_sum / self.rsi_period
+        losses = loss_sum / self.rsi_period
+        rs = gains / losses
+        return round(100 - (100 / (1 + rs)), 1)
+
+    def macd(self, live=None):
+        ema_fast, ema_slow, ema_signal = self._ema_fast, self._ema_slow, self._ema_signal
+        n_prices = self.count
+        if live is not None:
+            ema_fast, ema_slow, ema_signal = self._macd_step(live['close'])
+            n_prices += 1
+
+        if n_prices < self.macd_min_len:
+            return 0
+        return round((ema_fast - ema_slow) - ema_signal, 2)
+
+    def vwap(self, live=None):
+        tp_vol_sum, vol_sum = self._tp_vol_sum, self._vol_sum
+        n = len(self._vwap_terms)
+
+        if live is not None:
+            if n == self._vwap_terms.maxlen:
+                old_tp_vol, old_vol = self._vwap_terms[0]
+                tp_vol_sum -= old_tp_vol
+                vol_sum -= old_vol
+            else:
+                n += 1
+            live_tp_vol, live_vol = _vwap_term(live)
+            tp_vol_sum += live_tp_vol
+            vol_sum += live_vol
+
+        if n == 0:
+            return 0
+        return round(tp_vol_sum / vol_sum, 2) if vol_sum > 0 else 0
+
+    def momentum(self, live=None):
+        period = self.momentum_period
+        if live is not None:
+            if len(self._closes) < period - 1:
+                return 0
+            base = self._closes[-(period - 1)] if period > 1 else live['close']
+            last = live['close']
+        else:
+            if len(self._closes) < period:
+                return 0
+            base = self._closes[-period]
+            last = self._closes[-1]
+        return ((last - base) / base) * 100
+
+    def volatility(self, live=None):
+        """Стандартное отклонение минутных доходностей (%) за volatility_period свечей."""
+        ret_sum, ret_sq_sum, n = self._ret_sum, self._ret_sq_sum, len(self._returns)
+        if live is not None and self.last_close:
+            if n == self._returns.maxlen:
+                old = self._returns[0]
+                ret_sum -= old
+                ret_sq_sum -= old * old
+            else:
+                n += 1
+            ret = (live['close'] - self.last_close) / self.last_close * 100
+            ret_sum += ret
+            ret_sq_sum += ret * ret
+        if n < 2:
+            return 0.0
+        var = (ret_sq_sum - ret_sum * ret_sum / n) / (n - 1)
+        return var ** 0.5 if var > 0 else 0.0
+
+    # ───────────────────────────────────────────────────────────
+    # Внутреннее
+    # ───────────────────────────────────────────────────────────
+
+    def _macd_step(self, price):
+        """Один шаг EMA fast/slow/signal (порядок операций как в calculate_macd)."""
+        if self._ema_fast is None:
+            return price, price, 0.0
+        ema_fast = (price * self._k_fast) + (self._ema_fast * (1 - self._k_fast))
+        ema_slow = (price * self._k_slow) + (self._ema_slow * (1 - self._k_slow))
+        macd_line = ema_fast - ema_slow
+        ema_signal = (macd_line * self._k_signal) + (self._ema_signal * (1 - self._k_signal))
+        return ema_fast, ema_slow, ema_signal
+
+    def _resync(self):
+        """Пересчитывает скользящие суммы с нуля."""
+        self._gain_sum = sum(d for d in self._deltas if d > 0)
+        self._loss_sum = sum(-d for d in self._deltas if d < 0)
+        self._tp_vol_sum = sum(t[0] for t in self._vwap_terms)
+        self._vol_sum = sum(t[1] for t in self._vwap_terms)
+        self._ret_sum = sum(self._returns)
+        self._ret_sq_sum = sum(r * r for r in self._returns)
+        self._updates_since_resync = 0
+
+
+def _vwap_term(candle):
+    tp = (candle['high'] + candle['low'] + candle['close']) / 3
+    return tp * candle['volume'], candle['volume']
+
+
+# ═══════════════════════════════════════════════════════════════
+# СТАРШИЕ ИНТЕРВАЛЫ
+# ═══════════════════════════════════════════════════════════════
+
+MINUTE_MS = 60_000
+
+
+def timeframe_label(minutes):
+    """5 → '5m', 60 → '1h'."""
+    return f"{minutes // 60}h" if minutes % 60 == 0 else f"{minutes}m"
+
+
+def merge_bar(bar, candle):
+    """Бар, дополненный следующей минутной свечой (новый словарь)."""
+    return {
+        'open_time': bar['open_time'],
+        'open': bar['open'],
+        'high': max(bar['high'], candle['high']),
+        'low': min(bar['low'], candle['low']),
+        'close': candle['close'],
+        'volume': bar['volume'] + candle['volume'],
+    }
+
+
+class BarAggregator:
+    """Бары в minutes минут из закрытых минутных свечей; закрытые бары — в свой движок."""
+
+    def __init__(self, minutes, engine):
+        self.minutes = minutes
+        self.label = timeframe_label(minutes)
+        self.bar_ms = minutes * MINUTE_MS
+        self.engine = engine
+        self.partial = None      # Бар, собираемый из уже закрытых минут
+
+    def reset(self):
+        self.engine.reset()
+        self.partial = None
+
+    def bucket(self, open_time):
+        return open_time - open_time % self.bar_ms
+
+    def update(self, candle):
+        """Добавляет закрытую минутную свечу; O(1)."""
+        start = self.bucket(candle['open_time'])
+        if self.partial is not None and self.partial['open_time'] != start:
+            # Пропуск минут: незаконченный бар закрывается как есть
+            self.engine.update(self.partial)
+            self.partial = None
+        if self.partial is None:
+            self.partial = dict(candle, open_time=start)
+        else:
+            self.partial = merge_bar(self.partial, candle)
+        if candle['open_time'] + MINUTE_MS >= start + self.bar_ms:
+            self.engine.update(self.partial)
+            self.partial = None
+
+    def live_bar(self, live):
+        """Текущий бар с учётом незакрытой минуты live (None — только закрытые минуты)."""
+        if live is None or live.get('open_time') is None:
+            return self.partial
+        start = self.bucket(live['open_time'])
+        if self.partial is not None and self.partial['open_time'] == start:
+            return merge_bar(self.partial, live)
+        return dict(live, open_time=start)
+
+    def snapshot(self, live=None):
+        snapshot = self.engine.snapshot(self.live_bar(live))
+        snapshot['bars'] = self.engine.count
+        return snapshot
+
+
+class MultiTimeframeEngine(IndicatorEngine):
+    """
+    Минутный движок плюс старшие интервалы. Каждая закрытая минута
+    обновляет и их бары, так что лишних запросов и пересчётов нет.
+    Снимок — минутные индикаторы и 'timeframes': {'5m': {...}, ...}.
+    """
+
+    def __init__(self, timeframes=(5, 15, 60), window=100, **kwargs):
+        self.timeframes = [
+            BarAggregator(minutes, IndicatorEngine(window=window, **kwargs))
+            for minutes in sorted(set(timeframes)) if minutes > 1
+        ]
+        super().__init__(window=window, **kwargs)
+
+    def reset(self):
+        super().reset()
+        for aggregator in self.timeframes:
+            aggregator.reset()
+
+    def update(self, candle):
+        super().update(candle)
+        for aggregator in self.timeframes:
+            aggregator.update(candle)
+
+    def snapshot(self, live=None):
+        snapshot = super().snapshot(live)
+        snapshot['timeframes'] = {
+            aggregator.label: aggregator.snapshot(live) for aggregator in self.timeframes
+        }
+        return snapshot
+
+    def history_minutes(self, bars):
+        """Минут истории, чтобы на старшем интервале набралось bars баров."""
+        longest = max((a.minutes for a in self.timeframes), default=1)
+        return longest * (bars + 1)
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Потоковые рыночные данные Binance через WebSocket.
+
+Подписка на kline_1m, bookTicker, diff-поток depth и trade одного символа.
+Держит в памяти кольцо свечей и локальный стакан (OrderBook),
+переподключается с экспоненциальной задержкой. Если поток устарел — вызывающий код
+переходит на REST.
+"""
+
+import json
+import random
+import socket
+import threading
+import time
+from collections import deque
+
+from candle_cache import tail
+from metrics import log
+from order_book import OrderBook
+
+try:
+    import websocket  # пакет websocket-client
+except ImportError:
+    websocket = None
+
+STREAM_URL = "wss://stream.binance.com:9443/stream"
+SNAPSHOT_RETRY_SECONDS = 1.0   # Не чаще одного REST-снимка стакана в секунду
+
+
+class MarketFeed:
+    """Кольцо свечей и стакан одного символа, обновляемые из WebSocket."""
+
+    def __init__(self, symbol="BTCUSDT", interval="1m", candle_limit=100,
+                 url=STREAM_URL, seed_candles=None, depth_snapshot=None, max_age=5.0,
+                 backoff_base=1.0, backoff_max=60.0):
+        """
+        seed_candles — функция без аргументов, возвращающая свечи REST
+        (формат get_candles); вызывается при каждом подключении, чтобы
+        заполнить кольцо историей и закрыть пропуск после обрыва.
+        depth_snapshot — функция без аргументов, возвращающая REST-снимок
+        стакана с lastUpdateId; без неё стакан не синхронизируется.
+        max_age — сколько секунд без сообщений поток считается свежим.
+        """
+        stream = symbol.lower()
+        self.symbol = symbol
+        self.streams = [
+            f"{stream}@kline_{interval}",
+            f"{stream}@bookTicker",
+            f"{stream}@depth@100ms",
+            f"{stream}@trade",
+        ]
+        self.url = f"{url}?streams={'/'.join(self.streams)}"
+        self.candle_limit = candle_limit
+        self.seed_candles = seed_candles
+        self.depth_snapshot = depth_snapshot
+        self.max_age = max_age
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._lock = threading.Lock()
+        self._candles = deque(maxlen=candle_limit)
+        self.book = OrderBook(symbol)
+        self._last_snapshot_at = None
+        self._snapshot_thread = None
+        self._best_bid = None
+        self._best_ask = None
+        self._last_trade = None
+        self._last_message = None
+
+        self._ws = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.reconnects = 0
+
+    # ───────────────────────────────────────────────────────────
+    # Жизненный цикл
+    # ───────────────────────────────────────────────────────────
+
+    def start(self):
+        if websocket is None:
+            raise RuntimeError("Для потокового режима нужен пакет websocket-client")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="market-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        ws = self._ws
+        if ws is not None:
+            ws.keep_running = False
+            raw = getattr(ws.sock, 'sock', None)
+            if raw is not None:
+                # shutdown будит поток чтения в select. Сокет закрывается только после
+                # его выхода: закрытый дескриптор epoll забывает вместе с событием,
+                # и поток ждал бы до ping_timeout
+                try:
+                    raw.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if ws is not None:
+            ws.close()
+        snapshot_thread = self._snapshot_thread
+        if snapshot_thread is not None:
+            snapshot_thread.join(timeout=5)
+
+    def _run(self):
+        attempt = 0
+        while not self._stop.is_set():
+            self._ws = websocket.WebSocketApp(
+                self.url,
+                on_open=self._on_open,
+                on_message=lambda ws, raw: self.handle_message(raw),
+                on_error=lambda ws, e: log('stream_error', f"Stream error: {e}", error=str(e)),
+            )
+            started = time.monotonic()
+            self._ws.run_forever(ping_interval=20, ping_timeout=10)
+            if self._stop.is_set():
+                break
+
+            # Соединение продержалось дольше окна задержки — начинаем заново
+            if time.monotonic() - started > self.backoff_max:
+                attempt = 0
+            delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+            delay *= random.uniform(0.5, 1.0)
+            attempt += 1
+            self.reconnects += 1
+            log('stream_reconnect', f"🔌 Поток отключён, переподключение через {delay:.1f} с",
+                symbol=self.symbol, delay=round(delay, 1), reconnects=self.reconnects)
+            self._stop.wait(delay)
+
+    def _on_open(self, ws):
+        # После обрыва последовательность update ID потеряна — ждём новый снимок
+        with self._lock:
+            self.book = OrderBook(self.symbol)
+        if self.seed_candles is None:
+            return
+        try:
+            candles = self.seed_candles()
+        except Exception as e:
+            log('stream_seed_error', f"Stream seed error: {e}", symbol=self.symbol, error=str(e))
+            return
+        if candles:
+            with self._lock:
+                self._merge_candles(candles)
+
+    # ───────────────────────────────────────────────────────────
+    # Обработка сообщений
+    # ───────────────────────────────────────────────────────────
+
+    def handle_message(self, raw):
+        """Разбирает сообщение комбинированного потока."""
+        message = json.loads(raw)
+        stream = message.get('stream', '')
+        data = message.get('data', {})
+
+        with self._lock:
+            if '@kline_' in stream:
+                self._on_kline(data['k'])
+            elif stream.endswith('@bookTicker'):
+                self._best_bid = float(data['b'])
+                self._best_ask = float(data['a'])
+            elif '@depth' in stream:
+                self.book.apply_diff(data)
+            elif stream.endswith('@trade'):
+                self._last_trade = float(data['p'])
+            self._last_message = time.monotonic()
+            needs_snapshot = self.book.needs_snapshot
+
+        if needs_snapshot and '@depth' in stream:
+            self._sync_book()
+
+    def _sync_book(self):
+        """
+        Запрашивает REST-снимок стакана в отдельном потоке, чтобы не держать
+        поток чтения WebSocket. Пока снимка нет, OrderBook буферизует diff-события;
+        снимок применяется под блокировкой, буфер — поверх него.
+        """
+        if self.depth_snapshot is None:
+            return
+        if self._snapshot_thread is not None and self._snapshot_thread.is_alive():
+            return
+        now = time.monotonic()
+        if self._last_snapshot_at is not None and now - self._last_snapshot_at < SNAPSHOT_RETRY_SECONDS:
+            return
+        self._last_snapshot_at = now
+        self._snapshot_thread = threading.Thread(target=self._load_snapshot, args=(self.book,),
+                                                 name="depth-snapshot", daemon=True)
+        self._snapshot_thread.start()
+
+    def _load_snapshot(self, book):
+        try:
+            snapshot = self.depth_snapshot()
+        except Exception as e:
+            log('depth_snapshot_error', f"Depth snapshot error: {e}", symbol=self.symbol, error=str(e))
+            return
+        if not snapshot:
+            return
+        with self._lock:
+            # После переподключения стакан новый — снимок старого соединения не нужен
+            if book is self.book:
+                book.load_snapshot(snapshot)
+
+    def _on_kline(self, k):
+        self._merge_candles([{
+            'open_time': int(k['t']),
+            'open': float(k['o']),
+            'high': float(k['h']),
+            'low': float(k['l']),
+            'close': float(k['c']),
+            'volume': float(k['v'])
+        }])
+
+    def _merge_candles(self, candles):
+        """Вставляет свечи по open_time: обновляет текущую, добавляет новые."""
+        for candle in candles:
+            if self._candles and candle['open_time'] < self._candles[-1]['open_time']:
+                # Более старая свеча — заменяем на месте, если она есть в кольце
+                for i, existing in enumerate(self._candles):
+                    if existing['open_time'] == candle['open_time']:
+                        self._candles[i] = candle
+                        break
+            elif self._candles and candle['open_time'] == self._candles[-1]['open_time']:
+                self._candles[-1] = candle
+            else:
+                self._candles.append(candle)
+
+    # ───────────────────────────────────────────────────────────
+    # Чтение
+    # ───────────────────────────────────────────────────────────
+
+    def is_fresh(self):
+        """Есть ли сообщения за последние max_age секунд и достаточно ли свечей."""
+        with self._lock:
+            if self._last_message is None:
+                return False
+            if time.monotonic() - self._last_message > self.max_age:
+                return False
+            return len(self._candles) >= self.candle_limit // 2
+
+    def get_price(self):
+        """Последняя сделка, иначе середина спреда, иначе закрытие свечи."""
+        with self._lock:
+            if self._last_trade is not None:
+                return self._last_trade
+            if self._best_bid is not None and self._best_ask is not None:
+                return (self._best_bid + self._best_ask) / 2
+            if self._candles:
+                return self._candles[-1]['close']
+        return 0
+
+    def get_candles(self, since=None):
+        """
+        Копия кольца свечей (последняя — текущая незакрытая) или его хвоста
+        с open_time >= since.
+        """
+        with self._lock:
+            return tail(self._candles, since) or None
+
+    def get_flow(self):
+        """Метрики локального стакана (OrderBook.flow) или None, пока он не синхронизирован."""
+        with self._lock:
+            if not self.book.synced:
+                return None
+            return self.book.flow()
+
+    def get_buy_pressure(self):
+        """Доля объёма покупателей на 20 уровнях, как в get_orderbook."""
+        with self._lock:
+            return self.book.buy_pressure(20)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Несколько рынков (символ × горизонт ставки) в одном процессе.
+
+У каждого рынка своя симуляция и свои открытые ставки. Рынки одного
+символа делят движок индикаторов, а данные по символу запрашиваются
+один раз за тик, сколько бы горизонтов его ни использовало.
+"""
+
+from bet_history import BetHistory
+from indicators import IndicatorEngine
+from portfolio import Portfolio
+
+QUOTE_ASSETS = ('USDT', 'USDC', 'FDUSD', 'BUSD', 'USD')
+
+
+def new_simulation(starting_balance, history_window, spill_path=None):
+    """Пустое состояние симуляции одного рынка."""
+    return {
+        'balance': starting_balance,
+        'total_bets': 0,
+        'wins': 0,
+        'losses': 0,
+        'portfolio': Portfolio(),  # Открытые ставки
+        'history': BetHistory(history_window, spill_path, base=starting_balance),
+        'total_profit': 0
+    }
+
+
+class Market:
+    """Рынок: символ Binance и длительность ставки в минутах."""
+
+    def __init__(self, symbol, horizon, simulation, engine=None, is_default=False):
+        self.symbol = symbol.upper()
+        self.horizon = horizon
+        self.key = f"{self.symbol}:{horizon}"
+        self.simulation = simulation
+        self.engine = engine or IndicatorEngine()
+        self.is_default = is_default
+        self.price_history = []
+        self.last_signal_time = None
+        self.last_tick_at = None
+
+    @property
+    def label(self):
+        """Базовый актив: BTCUSDT → BTC."""
+        for quote in QUOTE_ASSETS:
+            if self.symbol.endswith(quote) and len(self.symbol) > len(quote):
+                return self.symbol[:-len(quote)]
+        return self.symbol
+
+    @property
+    def title(self):
+        return f"{self.label} · {self.horizon} мин"
+
+    def __repr__(self):
+        return f"Market({self.key})"
+
+
+def parse_markets(spec):
+    """'ETHUSDT:15,SOLUSDT:5' → [('ETHUSDT', 15), ('SOLUSDT', 5)]."""
+    result = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        symbol, _, horizon = item.partition(':')
+        result.append((symbol.upper(), int(horizon or 15)))
+    return result
+
+
+def build_markets(default, spec, starting_balance, history_window, spill_path=None,
+                  engine_factory=IndicatorEngine):
+    """
+    Список рынков: default первым, затем рынки из spec. Рынки одного
+    символа получают общий движок индикаторов (engine_factory()).
+    """
+    markets = [default]
+    engines = {default.symbol: default.engine}
+    seen = {default.key}
+    for symbol, horizon in parse_markets(spec):
+        key = f"{symbol}:{horizon}"
+        if key in seen:
+            continue
+        seen.add(key)
+        spill = f"{spill_path}.{symbol}_{horizon}" if spill_path else None
+        engine = engines.get(symbol) or engines.setdefault(symbol, engine_factory())
+        markets.append(Market(symbol, horizon,
+                              new_simulation(starting_balance, history_window, spill),
+                              engine=engine))
+    return markets
+
+
+def group_by_symbol(markets):
+    """{символ: [рынки]} в порядке первого появления."""
+    groups = {}
+    for market in markets:
+        groups.setdefault(market.symbol, []).append(market)
+    return groups
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+Шаблоны сообщений и отложенная отрисовка.
+
+Форматтеры бота собирают только данные сообщения (Message); текст
+строится при отправке — в потоке очереди Telegram — и лишь для тех
+вариантов (язык × подробность), которые выбраны в чатах получателей.
+Шаблоны разбираются один раз при импорте, статистика рынка считается
+один раз на состояние симуляции и общая для всех сообщений тика.
+"""
+
+import threading
+from string import Formatter
+
+LANGS = ('ru', 'en')
+STYLES = ('verbose', 'compact')
+DEFAULT_VARIANT = ('ru', 'verbose')
+
+LINE = "<b>━━━━━━━━━━━━━━━━━━━━━</b>"
+
+
+class Template:
+    """Шаблон str.format, разобранный заранее: поля проверены, format_map привязан."""
+
+    __slots__ = ('text', 'fields', '_format')
+
+    def __init__(self, text):
+        self.text = text
+        self.fields = {name.split('[', 1)[0].split('.', 1)[0]
+                       for _, name, _, _ in Formatter().parse(text) if name}
+        self._format = text.format_map
+
+    def render(self, values):
+        return self._format(values)
+
+
+# ═══════════════════════════════════════════════════════════════
+# ШАБЛОНЫ
+# ═══════════════════════════════════════════════════════════════
+
+_SOURCES = {
+    ('new_bet', 'ru', 'verbose'): """
+<b>━━━ 🎯 НОВАЯ СТАВКА ━━━</b>{tag}
+🕐 {now:%H:%M:%S UTC}
+
+<b>💰 {label}: ${price:,.2f}</b>
+
+<b>{emoji} СТАВКА: {direction} {arrow}</b>
+📊 Уверенность: {confidence}%
+💵 Сумма: ${amount:.2f} ({percent:.1f}%)
+
+<b>⏱ Закрытие в: {close_time:%H:%M:%S UTC}</b>
+<i>(через {horizon} минут)</i>
+
+<b>📈 Анализ:</b>
+{reasons}
+<b>💼 Баланс: ${stats[balance]:.2f}</b>
+📊 Ставок: {stats[count]} | Win: {stats[wins]} | Loss: {stats[losses]}
+🎯 Win Rate: {stats[win_rate]:.1f}%
+""" + LINE + "\n",
+    ('new_bet', 'en', 'verbose'): """
+<b>━━━ 🎯 NEW BET ━━━</b>{tag}
+🕐 {now:%H:%M:%S UTC}
+
+<b>💰 {label}: ${price:,.2f}</b>
+
+<b>{emoji} BET: {direction} {arrow}</b>
+📊 Confidence: {confidence}%
+💵 Amount: ${amount:.2f} ({percent:.1f}%)
+
+<b>⏱ Closes at: {close_time:%H:%M:%S UTC}</b>
+<i>(in {horizon} minutes)</i>
+
+<b>📈 Analysis:</b>
+RSI {rsi:.1f} | MACD {macd:.2f} | VWAP ${vwap:,.2f} | Momentum {momentum:+.2f}%
+
+<b>💼 Balance: ${stats[balance]:.2f}</b>
+📊 Bets: {stats[count]} | Win: {stats[wins]} | Loss: {stats[losses]}
+🎯 Win Rate: {stats[win_rate]:.1f}%
+""" + LINE + "\n",
+    ('new_bet', 'ru', 'compact'):
+        "{prefix}🎯 {emoji} {direction} {arrow} {label} ${price:,.2f} | {confidence}% | "
+        "${amount:.2f} | до {close_time:%H:%M}\n💼 ${stats[balance]:.2f} | WR {stats[win_rate]:.1f}%",
+    ('new_bet', 'en', 'compact'):
+        "{prefix}🎯 {emoji} {direction} {arrow} {label} ${price:,.2f} | {confidence}% | "
+        "${amount:.2f} | until {close_time:%H:%M}\n💼 ${stats[balance]:.2f} | WR {stats[win_rate]:.1f}%",
+
+    ('close_bet', 'ru', 'verbose'): """
+<b>━━━ {status_emoji} {status_ru} ━━━</b>{tag}
+🕐 {now:%H:%M:%S UTC}
+
+<b>Ставка: {direction} {arrow}</b>
+📊 Уверенность была: {confidence}%
+
+<b>💵 Вход:</b> ${entry_price:,.2f}
+<b>💵 Выход:</b> ${exit_price:,.2f}
+<b>📊 Изменение:</b> {diff_sign}{price_diff:.2f} ({pct_sign}{price_percent:.3f}%)
+
+<b>💰 P&L: {pnl_text}</b>
+
+<b>━━━ 📊 СТАТИСТИКА ━━━</b>
+💼 Баланс: ${stats[balance]:.2f}
+📈 Общий P&L: {stats[total_pnl_text]} ({stats[total_pnl_pct]:+.1f}%)
+🎯 Win Rate: {stats[win_rate]:.1f}% ({stats[wins]}W / {stats[losses]}L)
+📋 Всего ставок: {stats[count]} | Средний P&L: {stats[avg_pnl_text]}
+📉 Макс. просадка: {stats[max_drawdown_pct]:.1f}% | Серия: {stats[streak_text]}
+""" + LINE + "\n",
+    ('close_bet', 'en', 'verbose'): """
+<b>━━━ {status_emoji} {status_en} ━━━</b>{tag}
+🕐 {now:%H:%M:%S UTC}
+
+<b>Bet: {direction} {arrow}</b>
+📊 Confidence was: {confidence}%
+
+<b>💵 Entry:</b> ${entry_price:,.2f}
+<b>💵 Exit:</b> ${exit_price:,.2f}
+<b>📊 Change:</b> {diff_sign}{price_diff:.2f} ({pct_sign}{price_percent:.3f}%)
+
+<b>💰 P&L: {pnl_text}</b>
+
+<b>━━━ 📊 STATISTICS ━━━</b>
+💼 Balance: ${stats[balance]:.2f}
+📈 Total P&L: {stats[total_pnl_text]} ({stats[total_pnl_pct]:+.1f}%)
+🎯 Win Rate: {stats[win_rate]:.1f}% ({stats[wins]}W / {stats[losses]}L)
+📋 Total bets: {stats[count]} | Avg P&L: {stats[avg_pnl_text]}
+📉 Max drawdown: {stats[max_drawdown_pct]:.1f}% | Streak: {stats[streak_text]}
+""" + LINE + "\n",
+    ('close_bet', 'ru', 'compact'):
+        "{prefix}{status_emoji} {direction} {arrow} {pnl_text} | ${entry_price:,.2f} → ${exit_price:,.2f}\n"
+        "💼 ${stats[balance]:.2f} | WR {stats[win_rate]:.1f}% | {stats[count]} ставок",
+    ('close_bet', 'en', 'compact'):
+        "{prefix}{status_emoji} {direction} {arrow} {pnl_text} | ${entry_price:,.2f} → ${exit_price:,.2f}\n"
+        "💼 ${stats[balance]:.2f} | WR {stats[win_rate]:.1f}% | {stats[count]} bets",
+
+    ('status', 'ru', 'verbose'): """
+<b>━━━ 📊 МОНИТОРИНГ ━━━</b>{tag}
+🕐 {now:%H:%M:%S UTC}
+
+<b>💰 {label}: ${price:,.2f}</b>
+
+<b>⏸ Сигнал слабый ({confidence}%)</b>
+<i>Минимум для ставки: {min_confidence}%</i>
+
+Направление: {direction} {arrow}
+
+<b>💼 Баланс: ${stats[balance]:.2f}</b>
+📈 P&L: {stats[total_pnl_text]}
+🎯 WR: {stats[win_rate]:.1f}% | {stats[count]} ставок
+""" + LINE + "\n",
+    ('status', 'en', 'verbose'): """
+<b>━━━ 📊 MONITORING ━━━</b>{tag}
+🕐 {now:%H:%M:%S UTC}
+
+<b>💰 {label}: ${price:,.2f}</b>
+
+<b>⏸ Weak signal ({confidence}%)</b>
+<i>Minimum to bet: {min_confidence}%</i>
+
+Direction: {direction} {arrow}
+
+<b>💼 Balance: ${stats[balance]:.2f}</b>
+📈 P&L: {stats[total_pnl_text]}
+🎯 WR: {stats[win_rate]:.1f}% | {stats[count]} bets
+""" + LINE + "\n",
+    ('status', 'ru', 'compact'):
+        "{prefix}📊 {label} ${price:,.2f} | сигнал {confidence}% {direction} (мин. {min_confidence}%) | "
+        "💼 ${stats[balance]:.2f}",
+    ('status', 'en', 'compact'):
+        "{prefix}📊 {label} ${price:,.2f} | signal {confidence}% {direction} (min {min_confidence}%) | "
+        "💼 ${stats[balance]:.2f}",
+
+    ('waiting', 'ru', 'verbose'): """
+<b>━━━ ⏳ СТАВКА АКТИВНА ━━━</b>{tag}
+🕐 {now:%H:%M:%S UTC}
+
+<b>💰 {label}: ${price:,.2f}</b>
+
+<b>{emoji} {direction} {arrow}</b>
+💵 Ставка: ${amount:.2f}
+📊 Вход: ${entry_price:,.2f}
+
+<b>{pnl_emoji} Текущий P&L: {pnl_sign}{current_pnl:.2f}</b>
+
+<b>⏱ Осталось: {remaining:.1f} мин</b>
+""" + LINE + "\n",
+    ('waiting', 'en', 'verbose'): """
+<b>━━━ ⏳ BET ACTIVE ━━━</b>{tag}
+🕐 {now:%H:%M:%S UTC}
+
+<b>💰 {label}: ${price:,.2f}</b>
+
+<b>{emoji} {direction} {arrow}</b>
+💵 Amount: ${amount:.2f}
+📊 Entry: ${entry_price:,.2f}
+
+<b>{pnl_emoji} Current P&L: {pnl_sign}{current_pnl:.2f}</b>
+
+<b>⏱ Remaining: {remaining:.1f} min</b>
+""" + LINE + "\n",
+    ('waiting', 'ru', 'compact'):
+        "{prefix}⏳ {emoji} {direction} {label} ${price:,.2f} | {pnl_emoji} {pnl_sign}{current_pnl:.2f} | "
+        "осталось {remaining:.1f} мин",
+    ('waiting', 'en', 'compact'):
+        "{prefix}⏳ {emoji} {direction} {label} ${price:,.2f} | {pnl_emoji} {pnl_sign}{current_pnl:.2f} | "
+        "{remaining:.1f} min left",
+}
+
+TEMPLATES = {key: Template(text) for key, text in _SOURCES.items()}
+
+# ═══════════════════════════════════════════════════════════════
+# ДАННЫЕ СООБЩЕНИЙ
+# ═══════════════════════════════════════════════════════════════
+
+_stats_cache = {}
+
+
+def stats_snapshot(market, starting_balance):
+    """
+    Сводка статистики рынка для сообщений. Пересчитывается только при
+    изменении баланса или числа ставок — сообщения одного тика делят её.
+    """
+    sim = market.simulation
+    stats = sim['history'].stats
+    key = (stats.count, sim['balance'])
+    cached = _stats_cache.get(market.key)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    total_pnl = sim['balance'] - starting_balance
+    snapshot = {
+        'balance': sim['balance'],
+        'count': stats.count,
+        'wins': stats.wins,
+        'losses': stats.losses,
+        'win_rate': stats.win_rate,
+        'total_pnl': total_pnl,
+        'total_pnl_text': _money_signed(total_pnl),
+        'total_pnl_pct': total_pnl / starting_balance * 100 if starting_balance else 0,
+        'avg_pnl_text': _money_signed(stats.avg_pnl),
+        'max_drawdown_pct': stats.max_drawdown_pct,
+        'streak_text': f"{'+' if stats.streak > 0 else ''}{stats.streak}",
+    }
+    _stats_cache[market.key] = (key, snapshot)
+    return snapshot
+
+
+def _money_signed(value):
+    return f"+${value:.2f}" if value >= 0 else f"-${abs(value):.2f}"
+
+
+def _direction_marks(direction):
+    if direction == 'UP':
+        return "🟢", "📈"
+    return "🔴", "📉"
+
+
+def _prepare_new_bet(v):
+    v['emoji'], v['arrow'] = _direction_marks(v['direction'])
+    v['reasons'] = "".join(f"{reason}\n" for reason in v['reasons_list'])
+
+
+def _prepare_close_bet(v):
+    won = v['won']
+    v['status_emoji'] = "✅" if won else "❌"
+    v['status_ru'] = "ВЫИГРЫШ" if won else "ПРОИГРЫШ"
+    v['status_en'] = "WIN" if won else "LOSS"
+    v['pnl_text'] = f"+${v['pnl']:.2f}" if won else f"-${abs(v['pnl']):.2f}"
+    v['arrow'] = _direction_marks(v['direction'])[1]
+    v['price_diff'] = v['exit_price'] - v['entry_price']
+    v['price_percent'] = v['price_diff'] / v['entry_price'] * 100
+    v['diff_sign'] = '+' if v['price_diff'] > 0 else ''
+    v['pct_sign'] = '+' if v['price_percent'] > 0 else ''
+
+
+def _prepare_status(v):
+    v['arrow'] = _direction_marks(v['direction'])[1]
+
+
+def _prepare_waiting(v):
+    v['emoji'], v['arrow'] = _direction_marks(v['direction'])
+    v['pnl_emoji'] = "✅" if v['current_pnl'] > 0 else "❌"
+    v['pnl_sign'] = '+' if v['current_pnl'] > 0 else ''
+
+
+_PREPARE = {
+    'new_bet': _prepare_new_bet,
+    'close_bet': _prepare_close_bet,
+    'status': _prepare_status,
+    'waiting': _prepare_waiting,
+}
+
+# ═══════════════════════════════════════════════════════════════
+# ОТРИСОВКА
+# ═══════════════════════════════════════════════════════════════
+
+preferences = {}             # chat_id → (язык, подробность)
+
+
+def set_preference(chat_id, lang=None, style=None):
+    """Выбор варианта сообщений для чата; возвращает итоговый вариант."""
+    current_lang, current_style = preferences.get(str(chat_id), DEFAULT_VARIANT)
+    if lang is not None and lang not in LANGS:
+        raise ValueError(f"язык: {', '.join(LANGS)}")
+    if style is not None and style not in STYLES:
+        raise ValueError(f"вариант: {', '.join(STYLES)}")
+    variant = (lang or current_lang, style or current_style)
+    preferences[str(chat_id)] = variant
+    return variant
+
+
+def variant_for(chat_id):
+    return preferences.get(str(chat_id), DEFAULT_VARIANT)
+
+
+class Message:
+    """
+    Данные сообщения; текст строится при первом запросе варианта
+    и запоминается, так что рассылка по чатам рисует каждый вариант один раз.
+    """
+
+    __slots__ = ('kind', 'values', '_rendered', '_prepared')
+
+    _lock = threading.Lock()     # Отрисовка из нескольких потоков очереди
+
+    def __init__(self, kind, values):
+        self.kind = kind
+        self.values = values
+        self._rendered = {}
+        self._prepared = False
+
+    def render(self, lang=None, style=None):
+        variant = (lang or DEFAULT_VARIANT[0], style or DEFAULT_VARIANT[1])
+        text = self._rendered.get(variant)
+        if text is not None:
+            return text
+        with self._lock:
+            text = self._rendered.get(variant)
+            if text is not None:
+                return text
+            if not self._prepared:
+                _PREPARE[self.kind](self.values)
+                self._prepared = True
+            values = self.values
+            values['tag'] = f"\n🏷 <b>{values['title']}</b>" if values['title'] else ""
+            values['prefix'] = f"[{values['title']}] " if values['title'] else ""
+            text = self._rendered[variant] = TEMPLATES[(self.kind,) + variant].render(values)
+        return text
+
+    def render_for(self, chat_id):
+        return self.render(*variant_for(chat_id))
+
+    def __str__(self):
+        return self.render()
+
+
+def render_text(message, chat_id=None):
+    """Текст для отправки: строки как есть, Message — в варианте чата."""
+    if isinstance(message, str):
+        return message
+    return message.render_for(chat_id) if chat_id is not None else message.render()
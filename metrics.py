@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Метрики в формате Prometheus и структурированные логи.
+
+Счётчики, gauge и гистограммы хранятся в реестре и отдаются текстом
+по HTTP на /metrics. Gauge может вычисляться при каждом запросе
+(collect) — так баланс и возраст ставки не нужно обновлять вручную.
+log() печатает либо обычную строку, либо JSON (JSON_LOGS=1).
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import clock
+
+# Границы корзин гистограмм задержки, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return "{" + body + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    if isinstance(value, (bool, int)):
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help_text, collect=None):
+        """collect — функция, возвращающая [(labels, значение)] на момент запроса."""
+        self.name = name
+        self.help = help_text
+        self.collect = collect
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels))
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        if self.collect is not None:
+            for labels, value in self.collect():
+                values[_label_key(labels)] = value
+        return [(self.name, key, value) for key, value in values.items() if value is not None]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._series = {}          # labels → [счётчики корзин, сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замер длительности блока with."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        series = self._series.get(_label_key(labels))
+        return series[2] if series else 0
+
+    def samples(self):
+        result = []
+        with self._lock:
+            for key, (counts, total, count) in self._series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    result.append((f"{self.name}_bucket", key + (('le', _format_value(bound)),),
+                                   cumulative))
+                result.append((f"{self.name}_sum", key, total))
+                result.append((f"{self.name}_count", key, count))
+        return result
+
+
+class Registry:
+    """Набор метрик с выводом в текстовом формате Prometheus."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text):
+        return self._register(Counter(name, help_text))
+
+    def gauge(self, name, help_text, collect=None):
+        return self._register(Gauge(name, help_text, collect))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, buckets))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                lines.append(f"# ошибка сбора: {e}")
+                continue
+            for name, key, value in samples:
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# ═══════════════════════════════════════════════════════════════
+# HTTP
+# ═══════════════════════════════════════════════════════════════
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = registry
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host="127.0.0.1", source=registry):
+    """Запускает HTTP-сервер /metrics в фоновом потоке; возвращает сервер."""
+    handler = type("MetricsHandler", (_MetricsHandler,), {'registry': source})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    return server
+
+
+# ═══════════════════════════════════════════════════════════════
+# ЛОГИ
+# ═══════════════════════════════════════════════════════════════
+
+json_logs = False
+
+
+def log(event, text, **fields):
+    """
+    Строка лога: text в обычном режиме или JSON c event и полями
+    (время в UTC ISO 8601) при json_logs.
+    """
+    if not json_logs:
+        print(text)
+        return
+    record = {'ts': clock.utcnow().isoformat(), 'event': event}
+    record.update(fields)
+    print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Перебор весов и порогов сигнала на истории по всем ядрам.
+
+Индикаторы и волатильность считаются один раз в главном процессе
+и кладутся в общую память (multiprocessing.shared_memory) — воркеры
+читают их без копирования. Поддерживается walk-forward: ряд режется на отрезки,
+параметры выбираются на одном и проверяются на следующем.
+
+    python optimize.py data/*.csv --grid rsi_weight=15,25,35 \
+        --grid min_confidence=30,40,50 --folds 4 --out sweep.csv
+"""
+
+import argparse
+import csv
+import itertools
+import os
+import random
+import time
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+import btc_telegram_bot as bot
+from backtest import compute_indicators, compute_volatility, load_klines, score_signals, simulate_bets
+
+# Поля общей памяти (строки матрицы); к ним добавляются поля старших
+# интервалов '<интервал>.<поле>' (см. shared_fields)
+SHARED_FIELDS = ('open_time', 'close', 'rsi', 'macd', 'vwap', 'momentum', 'volatility')
+TIMEFRAME_FIELDS = ('rsi', 'macd', 'vwap', 'momentum', 'bars')
+
+# Параметры сигнала, которые векторный бэктест не использует: стакана в истории нет
+UNUSED_PARAMS = ('flow_depth', 'micro_weight', 'micro_tilt')
+
+# Параметры ставок, которые можно перебирать вместе с SIGNAL_PARAMS
+BET_PARAMS = {
+    'min_confidence': bot.MIN_CONFIDENCE,
+    'min_bet_percent': bot.MIN_BET_PERCENT,
+    'max_bet_percent': bot.MAX_BET_PERCENT,
+}
+
+DEFAULT_GRID = {
+    'rsi_weight': [15, 25, 35],
+    'macd_weight': [15, 25, 35],
+    'vwap_band': [0.2, 0.3, 0.5],
+    'momentum_band': [0.2, 0.3, 0.5],
+    'min_confidence': [30, 40, 50, 60],
+}
+
+# ═══════════════════════════════════════════════════════════════
+# ВОРКЕРЫ
+# ═══════════════════════════════════════════════════════════════
+
+_shm = None
+_data = None
+_fields = None
+_segments = None
+_objective = None
+
+
+def _init_worker(shm_name, shape, fields, segments, objective):
+    global _shm, _data, _fields, _segments, _objective
+    _shm = shared_memory.SharedMemory(name=shm_name)
+    _data = np.ndarray(shape, dtype=np.float64, buffer=_shm.buf)
+    _fields = fields
+    _segments = segments
+    _objective = objective
+
+
+def shared_fields(labels):
+    """Строки общей памяти для старших интервалов labels."""
+    return SHARED_FIELDS + tuple(f"{label}.{name}" for label in labels for name in TIMEFRAME_FIELDS)
+
+
+def _indicators(fields):
+    """Словарь compute_indicators из строк общей памяти."""
+    ind = {name: fields[name] for name in SHARED_FIELDS}
+    ind['timeframes'] = {}
+    for key, values in fields.items():
+        label, dot, name = key.partition('.')
+        if dot:
+            ind['timeframes'].setdefault(label, {})[name] = values
+    return ind
+
+
+def _evaluate(task):
+    """Оценивает один набор параметров на всех отрезках."""
+    index, params = task
+    fields = dict(zip(_fields, _data))
+    signal_params = {**bot.SIGNAL_PARAMS, **{k: v for k, v in params.items() if k in bot.SIGNAL_PARAMS}}
+    bet_params = {**BET_PARAMS, **{k: v for k, v in params.items() if k in BET_PARAMS}}
+
+    signals = score_signals(fields['close'], _indicators(fields), params=signal_params)
+    open_time = fields['open_time'].astype(np.int64)
+
+    metrics = []
+    for start, end in _segments:
+        klines = {'open_time': open_time[start:end], 'close': fields['close'][start:end]}
+        part = {name: arr[start:end] for name, arr in signals.items()}
+        result = simulate_bets(klines, part, volatility=fields['volatility'][start:end],
+                               min_confidence=bet_params['min_confidence'],
+                               min_percent=bet_params['min_bet_percent'],
+                               max_percent=bet_params['max_bet_percent'])
+        metrics.append(_metrics(result, _objective))
+    return index, metrics
+
+
+def _metrics(result, objective):
+    ret = (result['balance'] - result['starting_balance']) / result['starting_balance'] * 100
+    dd = result['max_drawdown']
+    if objective == 'calmar':
+        score = ret / dd if dd > 0 else ret
+    elif objective == 'winrate':
+        score = result['win_rate'] if result['total_bets'] else 0.0
+    else:
+        score = ret
+    return {
+        'bets': result['total_bets'],
+        'win_rate': result['win_rate'],
+        'return_pct': ret,
+        'max_drawdown': dd,
+        'objective': score,
+    }
+
+# ═══════════════════════════════════════════════════════════════
+# ПЕРЕБОР
+# ═══════════════════════════════════════════════════════════════
+
+def build_grid(grid, samples=0, seed=0):
+    """Декартово произведение значений; samples > 0 — случайная выборка из него."""
+    keys = list(grid)
+    combos = [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+    if samples and samples < len(combos):
+        combos = random.Random(seed).sample(combos, samples)
+    return combos
+
+
+def split_segments(n, folds):
+    """Первый отрезок — весь ряд, далее folds + 1 равных частей для walk-forward."""
+    segments = [(0, n)]
+    if folds:
+        bounds = np.linspace(0, n, folds + 2).astype(int)
+        segments += list(zip(bounds[:-1], bounds[1:]))
+    return segments
+
+
+def run_sweep(klines, combos, folds=0, objective='pnl', processes=None):
+    """
+    Возвращает [(params, [метрики по отрезкам])] в порядке combos.
+    Отрезок 0 — весь ряд, 1..folds+1 — части walk-forward.
+    """
+    ind = compute_indicators(klines)
+    timeframes = ind.pop('timeframes')
+    columns = {'open_time': klines['open_time'], 'close': klines['close'], **ind,
+               'volatility': compute_volatility(klines['close'])}
+    for label, tf in timeframes.items():
+        columns.update({f"{label}.{name}": values for name, values in tf.items()})
+    fields = shared_fields(timeframes)
+    matrix = np.stack([np.asarray(columns[f], dtype=np.float64) for f in fields])
+    segments = split_segments(matrix.shape[1], folds)
+
+    shm = shared_memory.SharedMemory(create=True, size=matrix.nbytes)
+    try:
+        shared = np.ndarray(matrix.shape, dtype=np.float64, buffer=shm.buf)
+        shared[:] = matrix
+        del matrix
+
+        results = [None] * len(combos)
+        with Pool(processes or os.cpu_count(), initializer=_init_worker,
+                  initargs=(shm.name, shared.shape, fields, segments, objective)) as pool:
+            chunksize = max(1, len(combos) // ((processes or os.cpu_count()) * 8))
+            for index, metrics in pool.imap_unordered(_evaluate, enumerate(combos), chunksize=chunksize):
+                results[index] = (combos[index], metrics)
+        del shared
+    finally:
+        shm.close()
+        shm.unlink()
+    return results
+
+
+def walk_forward(results, folds):
+    """На каждом шаге лучший по отрезку f набор проверяется на отрезке f + 1."""
+    steps = []
+    for fold in range(1, folds + 1):
+        best_params, best_metrics = max(results, key=lambda r: r[1][fold]['objective'])
+        steps.append({
+            'train': fold,
+            'test': fold + 1,
+            'params': best_params,
+            'train_metrics': best_metrics[fold],
+            'test_metrics': best_metrics[fold + 1],
+        })
+    return steps
+
+# ═══════════════════════════════════════════════════════════════
+# ВЫВОД
+# ═══════════════════════════════════════════════════════════════
+
+def rank(results, folds):
+    """Таблица, отсортированная по цели на всём ряду."""
+    rows = []
+    for params, metrics in results:
+        row = dict(params)
+        row.update(metrics[0])
+        if folds:
+            row['oos_mean'] = float(np.mean([m['objective'] for m in metrics[2:]]))
+        rows.append(row)
+    rows.sort(key=lambda r: r['objective'], reverse=True)
+    return rows
+
+
+def write_table(rows, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _parse_grid(items):
+    grid = {}
+    for item in items:
+        key, _, values = item.partition('=')
+        if key not in bot.SIGNAL_PARAMS and key not in BET_PARAMS:
+            raise SystemExit(f"Неизвестный параметр: {key}")
+        if key in UNUSED_PARAMS:
+            raise SystemExit(f"{key} не влияет на бэктест: стакана в истории нет")
+        grid[key] = [float(v) if '.' in v else int(v) for v in values.split(',')]
+    return grid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перебор параметров сигнала")
+    parser.add_argument('paths', nargs='+', help="CSV/Parquet файлы или маски")
+    parser.add_argument('--grid', action='append', default=[], metavar='KEY=V1,V2',
+                        help="Значения параметра (можно несколько раз)")
+    parser.add_argument('--samples', type=int, default=0, help="Случайная выборка из сетки")
+    parser.add_argument('--folds', type=int, default=0, help="Шагов walk-forward")
+    parser.add_argument('--objective', choices=('pnl', 'calmar', 'winrate'), default='pnl')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--out', help="Сохранить таблицу в CSV")
+    args = parser.parse_args()
+
+    grid = _parse_grid(args.grid) if args.grid else DEFAULT_GRID
+    combos = build_grid(grid, args.samples)
+
+    started = time.perf_counter()
+    klines = load_klines(args.paths)
+    results = run_sweep(klines, combos, args.folds, args.objective, args.processes)
+    elapsed = time.perf_counter() - started
+
+    rows = rank(results, args.folds)
+    print(f"━━━ 🔧 ПЕРЕБОР: {len(combos)} наборов, {len(klines['close'])} баров ({elapsed:.1f} с) ━━━")
+    for i, row in enumerate(rows[:args.top], 1):
+        params = ' '.join(f"{k}={row[k]}" for k in grid)
+        print(f"{i:>3}. {args.objective}={row['objective']:.2f} ret={row['return_pct']:+.1f}% "
+              f"wr={row['win_rate']:.1f}% bets={row['bets']} dd={row['max_drawdown']:.1f}% | {params}")
+
+    if args.folds:
+        print("\n━━━ WALK-FORWARD ━━━")
+        total = 1.0
+        for step in walk_forward(results, args.folds):
+            test = step['test_metrics']
+            total *= 1 + test['return_pct'] / 100
+            params = ' '.join(f"{k}={step['params'][k]}" for k in grid)
+            print(f"отрезок {step['train']}→{step['test']}: train {step['train_metrics']['objective']:.2f}, "
+                  f"test ret={test['return_pct']:+.1f}% wr={test['win_rate']:.1f}% | {params}")
+        print(f"Итог вне выборки: {(total - 1) * 100:+.1f}%")
+
+    if args.out:
+        write_table(rows, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Локальный стакан Binance, синхронизируемый по diff-потоку глубины.
+
+Протокол синхронизации: события @depth буферизуются, берётся REST-снимок
+(lastUpdateId), события с u <= lastUpdateId отбрасываются, первое
+применённое должно накрывать lastUpdateId + 1, дальше каждое начинается
+с u предыдущего + 1. Разрыв последовательности — повторная синхронизация.
+
+Уровни хранятся в отсортированных массивах цен и объёмов (bisect),
+так что лучшие N уровней берутся срезом. Из стакана считаются
+дисбаланс ликвидности на нескольких глубинах, microprice и спред.
+
+Проверка на записанных сообщениях:
+    python order_book.py depth.jsonl
+"""
+
+import json
+import sys
+from bisect import bisect_left
+
+FLOW_DEPTHS = (5, 10, 20)    # Глубины, на которых считается дисбаланс
+
+
+class BookSide:
+    """Одна сторона стакана: цены по возрастанию и объёмы рядом."""
+
+    def __init__(self, descending):
+        self.descending = descending     # Лучшая цена — наибольшая (биды)
+        self.prices = []
+        self.qtys = []
+
+    def clear(self):
+        self.prices.clear()
+        self.qtys.clear()
+
+    def set(self, price, qty):
+        """Устанавливает объём уровня; qty = 0 удаляет уровень."""
+        i = bisect_left(self.prices, price)
+        exists = i < len(self.prices) and self.prices[i] == price
+        if qty == 0:
+            if exists:
+                del self.prices[i]
+                del self.qtys[i]
+        elif exists:
+            self.qtys[i] = qty
+        else:
+            self.prices.insert(i, price)
+            self.qtys.insert(i, qty)
+
+    def top(self, n):
+        """Лучшие n уровней [(цена, объём)], от лучшего к худшему."""
+        if self.descending:
+            start = max(0, len(self.prices) - n)
+            return list(zip(reversed(self.prices[start:]), reversed(self.qtys[start:])))
+        return list(zip(self.prices[:n], self.qtys[:n]))
+
+    def best(self):
+        if not self.prices:
+            return None
+        i = -1 if self.descending else 0
+        return self.prices[i], self.qtys[i]
+
+    def __len__(self):
+        return len(self.prices)
+
+
+class OrderBook:
+    """Стакан одного символа: снимок + diff-события с проверкой update ID."""
+
+    def __init__(self, symbol="BTCUSDT", max_buffer=1000):
+        self.symbol = symbol
+        self.bids = BookSide(descending=True)
+        self.asks = BookSide(descending=False)
+        self.last_update_id = None
+        self.synced = False
+        self.max_buffer = max_buffer
+        self._buffer = []
+        self.resyncs = 0
+
+    # ───────────────────────────────────────────────────────────
+    # Синхронизация
+    # ───────────────────────────────────────────────────────────
+
+    def load_snapshot(self, snapshot):
+        """Загружает REST-снимок (/api/v3/depth) и применяет подходящие события из буфера."""
+        self.bids.clear()
+        self.asks.clear()
+        for price, qty in snapshot['bids']:
+            self.bids.set(float(price), float(qty))
+        for price, qty in snapshot['asks']:
+            self.asks.set(float(price), float(qty))
+        self.last_update_id = snapshot['lastUpdateId']
+        self.synced = True
+
+        buffered, self._buffer = self._buffer, []
+        for i, event in enumerate(buffered):
+            if not self.apply_diff(event):
+                # Снимок старше буфера — нужен новый снимок, события сохраняем
+                self._buffer.extend(buffered[i + 1:])
+                return False
+        return True
+
+    def apply_diff(self, event):
+        """
+        Применяет событие depthUpdate. Пока снимка нет — буферизует.
+        Возвращает False, если последовательность разорвана (нужен снимок).
+        """
+        if not self.synced:
+            self._buffer.append(event)
+            if len(self._buffer) > self.max_buffer:
+                self._buffer.pop(0)
+            return False
+
+        if event['u'] <= self.last_update_id:
+            return True                      # Уже учтено снимком
+        if event['U'] > self.last_update_id + 1:
+            self._desync(event)
+            return False
+
+        for price, qty in event['b']:
+            self.bids.set(float(price), float(qty))
+        for price, qty in event['a']:
+            self.asks.set(float(price), float(qty))
+        self.last_update_id = event['u']
+        return True
+
+    def _desync(self, event):
+        self.synced = False
+        self.resyncs += 1
+        self._buffer = [event]
+
+    @property
+    def needs_snapshot(self):
+        return not self.synced
+
+    # ───────────────────────────────────────────────────────────
+    # Метрики
+    # ───────────────────────────────────────────────────────────
+
+    def mid(self):
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None:
+            return None
+        return (bid[0] + ask[0]) / 2
+
+    def spread(self):
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None:
+            return None
+        return ask[0] - bid[0]
+
+    def microprice(self):
+        """Середина, взвешенная объёмами лучших уровней: ближе к стороне с меньшим объёмом."""
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None:
+            return None
+        total = bid[1] + ask[1]
+        if total <= 0:
+            return (bid[0] + ask[0]) / 2
+        return (bid[0] * ask[1] + ask[0] * bid[1]) / total
+
+    def imbalance(self, depth):
+        """
+        Дисбаланс ликвидности на depth уровнях, от -1 (всё в асках) до 1.
+        Объём уровня взвешивается близостью к середине: 1 / (1 + расстояние в б.п.).
+        """
+        mid = self.mid()
+        if mid is None:
+            return 0.0
+        weighted = []
+        for side in (self.bids, self.asks):
+            weighted.append(sum(qty / (1 + abs(price - mid) / mid * 10_000)
+                                for price, qty in side.top(depth)))
+        total = weighted[0] + weighted[1]
+        return (weighted[0] - weighted[1]) / total if total > 0 else 0.0
+
+    def buy_pressure(self, depth=20):
+        """Доля объёма бидов на depth уровнях, % (как прежний get_orderbook)."""
+        bid_vol = sum(qty for _, qty in self.bids.top(depth))
+        ask_vol = sum(qty for _, qty in self.asks.top(depth))
+        total = bid_vol + ask_vol
+        return (bid_vol / total * 100) if total > 0 else 50
+
+    def flow(self, depths=FLOW_DEPTHS):
+        """Снимок метрик стакана для calculate_signal; None, если стакан пуст."""
+        mid = self.mid()
+        if mid is None:
+            return None
+        spread = self.spread()
+        return {
+            'buy_pressure': self.buy_pressure(max(depths)),
+            'imbalance': {depth: self.imbalance(depth) for depth in depths},
+            'microprice': self.microprice(),
+            'mid': mid,
+            'spread': spread,
+            'spread_bps': spread / mid * 10_000,
+        }
+
+
+def parse_depth_event(message):
+    """depthUpdate из сообщения отдельного или комбинированного потока."""
+    return message.get('data', message)
+
+
+def replay(lines, book=None):
+    """
+    Прогоняет записанные сообщения через стакан. Строки — JSON: снимок
+    ({"lastUpdateId", "bids", "asks"}) или событие depthUpdate.
+    Возвращает стакан.
+    """
+    book = book or OrderBook()
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        message = json.loads(line)
+        if 'lastUpdateId' in message:
+            book.load_snapshot(message)
+        else:
+            book.apply_diff(parse_depth_event(message))
+    return book
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print("Использование: python order_book.py depth.jsonl")
+        return 2
+    with open(argv[0]) as f:
+        book = replay(f)
+    print(f"Синхронизирован: {'да' if book.synced else 'нет'}, lastUpdateId {book.last_update_id}, "
+          f"уровней {len(book.bids)}/{len(book.asks)}, пересинхронизаций {book.resyncs}")
+    flow = book.flow()
+    if flow:
+        print(json.dumps(flow, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Модель выплат Polymarket Up/Down.
+
+Ставка — это покупка долей Up или Down по цене q (подразумеваемая
+вероятность); выигравшая доля стоит $1, так что выигрыш на $1 ставки
+равен 1/q - 1. Цена доли берётся из таблицы по минуте входа в окно рынка
+и режиму волатильности (или одна на все ставки), дальше вычитаются
+комиссия и проскальзывание, зависящее от размера заявки.
+
+Все расчёты принимают и скаляры, и массивы NumPy: живой цикл считает
+одну ставку при открытии, бэктест — все ставки разом.
+
+Формат таблицы (CSV, строки в любом порядке):
+
+    minute,vol_max,up,down
+    0,0.05,0.52,0.52
+    0,,0.53,0.53
+
+minute — минута от начала окна (для окон длиннее таблицы берётся
+последняя строка), vol_max — верхняя граница режима
+волатильности (IndicatorEngine.volatility, пусто — без границы),
+up/down — цена доли стороны.
+"""
+
+import csv
+import math
+
+import numpy as np
+
+WINDOW_MINUTES = 15          # Длина окна рынка по умолчанию (у рынков — их horizon)
+
+
+def entry_minute(timestamp, window=WINDOW_MINUTES):
+    """
+    Минута от начала окна рынка длиной window минут для момента входа
+    (datetime или секунды Unix, массивы тоже).
+    """
+    if hasattr(timestamp, 'timestamp'):
+        timestamp = timestamp.timestamp()
+    return np.asarray(timestamp, dtype=np.float64) / 60 % window
+
+# ═══════════════════════════════════════════════════════════════
+# ЦЕНЫ ДОЛЕЙ
+# ═══════════════════════════════════════════════════════════════
+
+class FlatOdds:
+    """Один множитель выигрыша на все ставки (прежний WIN_MULTIPLIER)."""
+
+    def __init__(self, multiple):
+        self.multiple = float(multiple)
+
+    def multiples(self, up, minute, volatility):
+        return np.full(np.shape(up), self.multiple)
+
+
+class OddsTable:
+    """Цена доли Up/Down по минуте входа в окно и режиму волатильности."""
+
+    def __init__(self, up, down, vol_edges=()):
+        """
+        up, down — массивы [режим, минута] с ценой доли; vol_edges — верхние
+        границы режимов по возрастанию (на одну меньше, чем режимов).
+        """
+        self.up = np.asarray(up, dtype=np.float64)
+        self.down = np.asarray(down, dtype=np.float64)
+        self.vol_edges = np.asarray(vol_edges, dtype=np.float64)
+        if self.up.shape != self.down.shape or self.up.ndim != 2:
+            raise ValueError("up и down должны быть таблицами одинакового размера [режим, минута]")
+        if len(self.vol_edges) != self.up.shape[0] - 1:
+            raise ValueError("границ волатильности должно быть на одну меньше, чем режимов")
+        if not ((self.up > 0) & (self.up < 1) & (self.down > 0) & (self.down < 1)).all():
+            raise ValueError("цены долей должны быть в интервале (0, 1)")
+
+    @classmethod
+    def load(cls, path):
+        """Читает таблицу из CSV (формат — в описании модуля)."""
+        cells = {}
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                vol_max = float(row['vol_max']) if row.get('vol_max', '').strip() else math.inf
+                cells[(vol_max, int(row['minute']))] = (float(row['up']), float(row['down']))
+        edges = sorted({vol_max for vol_max, _ in cells})
+        minutes = sorted({minute for _, minute in cells})
+        if minutes != list(range(len(minutes))):
+            raise ValueError(f"{path}: минуты должны идти с 0 без пропусков")
+        up = np.empty((len(edges), len(minutes)))
+        down = np.empty_like(up)
+        for r, vol_max in enumerate(edges):
+            for minute in minutes:
+                if (vol_max, minute) not in cells:
+                    raise ValueError(f"{path}: нет строки minute={minute}, vol_max={vol_max}")
+                up[r, minute], down[r, minute] = cells[(vol_max, minute)]
+        if edges[-1] != math.inf:
+            raise ValueError(f"{path}: у последнего режима vol_max должен быть пустым")
+        return cls(up, down, edges[:-1])
+
+    def prices(self, up, minute, volatility):
+        """Цена доли выбранной стороны."""
+        regime = np.searchsorted(self.vol_edges, volatility, side='left')
+        column = np.clip(np.asarray(minute, dtype=np.int64), 0, self.up.shape[1] - 1)
+        return np.where(up, self.up[regime, column], self.down[regime, column])
+
+    def multiples(self, up, minute, volatility):
+        return 1.0 / self.prices(up, minute, volatility) - 1.0
+
+
+class SlippageCurve:
+    """Проскальзывание (доля цены) от размера заявки, линейно между точками."""
+
+    def __init__(self, sizes, impacts):
+        self.sizes = np.asarray(sizes, dtype=np.float64)
+        self.impacts = np.asarray(impacts, dtype=np.float64)
+        if len(self.sizes) != len(self.impacts) or not len(self.sizes):
+            raise ValueError("sizes и impacts должны быть одной ненулевой длины")
+        if (np.diff(self.sizes) <= 0).any():
+            raise ValueError("размеры должны возрастать")
+
+    @classmethod
+    def parse(cls, spec):
+        """'100:0.002,1000:0.01' → кривая (от 0 до первой точки — без проскальзывания)."""
+        points = sorted((float(size), float(impact))
+                        for size, impact in (item.split(':') for item in spec.split(',') if item))
+        if points and points[0][0] > 0:
+            points.insert(0, (0.0, 0.0))
+        return cls([p[0] for p in points], [p[1] for p in points])
+
+    def impact(self, amount):
+        return np.interp(amount, self.sizes, self.impacts)
+
+# ═══════════════════════════════════════════════════════════════
+# МОДЕЛЬ
+# ═══════════════════════════════════════════════════════════════
+
+class PayoutModel:
+    """Чистый множитель выигрыша и P&L ставок с учётом цены доли, комиссии и проскальзывания."""
+
+    def __init__(self, odds, fee_rate=0.0, slippage=None, lose_multiplier=1.0):
+        """
+        odds — FlatOdds или OddsTable; fee_rate — комиссия с суммы ставки;
+        slippage — SlippageCurve или None.
+        """
+        if not 0 <= fee_rate < 1:
+            raise ValueError("fee_rate должна быть в [0, 1)")
+        self.odds = odds
+        self.fee_rate = fee_rate
+        self.slippage = slippage
+        self.lose_multiplier = lose_multiplier
+
+    def gross(self, up, minute=0.0, volatility=0.0):
+        """Множитель выигрыша по цене доли, до комиссии и проскальзывания."""
+        return self.odds.multiples(up, minute, volatility)
+
+    def net(self, gross, amount):
+        """
+        Множитель после комиссии и проскальзывания: долей покупается
+        amount·(1 - fee) / (q·(1 + impact)), выигрыш — их число минус amount.
+        """
+        impact = self.slippage.impact(amount) if self.slippage is not None else 0.0
+        k = (1.0 - self.fee_rate) / (1.0 + impact)
+        # (1 + gross)·k - 1 в таком виде без комиссии и проскальзывания даёт ровно gross
+        return gross * k + (k - 1.0)
+
+    def quote(self, up, amount, minute=0.0, volatility=0.0):
+        """Чистый множитель выигрыша для ставки (ставок) при входе."""
+        return self.net(self.gross(up, minute, volatility), amount)
+
+    def pnl(self, won, amount, multiple):
+        """P&L: выигрыш по зафиксированному при входе множителю или потеря ставки."""
+        return np.where(won, amount * multiple, -amount * self.lose_multiplier)
+
+    def evaluate(self, up, won, amount, minute=0.0, volatility=0.0):
+        """P&L массива ставок одним проходом."""
+        return self.pnl(won, amount, self.quote(up, amount, minute, volatility))
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Открытые ставки рынка (портфель).
+
+Ставки лежат в куче по close_time: наступившие закрытия снимаются за
+O(k log n), без перебора всех открытых. Сумма в ставках и нереализованный
+результат поддерживаются инкрементально: для каждого направления цены
+входа хранятся отсортированными, и при новой цене пересчитываются только
+ставки, чью цену входа она пересекла. Выигрыш каждой ставки считается
+по её множителю bet['payout'], зафиксированному при входе.
+"""
+
+import heapq
+import itertools
+from bisect import bisect_left, bisect_right
+
+DIRECTIONS = ('UP', 'DOWN')
+
+
+class _Side:
+    """Ставки одного направления, отсортированные по цене входа."""
+
+    __slots__ = ('prices', 'amounts', 'gains', 'seqs')
+
+    def __init__(self):
+        self.prices = []
+        self.amounts = []
+        self.gains = []              # amount · payout
+        self.seqs = []
+
+    def insert(self, price, amount, gain, seq):
+        i = bisect_right(self.prices, price)
+        self.prices.insert(i, price)
+        self.amounts.insert(i, amount)
+        self.gains.insert(i, gain)
+        self.seqs.insert(i, seq)
+        return i
+
+    def remove(self, price, seq):
+        i = bisect_left(self.prices, price)
+        while self.seqs[i] != seq:
+            i += 1
+        del self.prices[i], self.amounts[i], self.gains[i], self.seqs[i]
+        return i
+
+
+class Portfolio:
+    """Открытые ставки: куча по close_time, сумма в ставках и выигрывающая/проигрывающая части."""
+
+    def __init__(self):
+        self._heap = []              # (close_time, seq, bet)
+        self._seqs = {}              # id(bet) → seq
+        self._seq = itertools.count()
+        self._sides = {direction: _Side() for direction in DIRECTIONS}
+        self.exposure = 0.0
+        self.exposure_by_direction = dict.fromkeys(DIRECTIONS, 0.0)
+        self.winning = 0.0           # Сумма ставок, которые выиграли бы по mark_price
+        self.winning_gain = 0.0      # Их выигрыш по своим множителям
+        self.losing = 0.0
+        self.mark_price = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, bet):
+        return id(bet) in self._seqs
+
+    def __iter__(self):
+        """Ставки по возрастанию close_time."""
+        return (bet for _, _, bet in sorted(self._heap))
+
+    def peek(self):
+        """Ставка, которая закроется первой, или None."""
+        return self._heap[0][2] if self._heap else None
+
+    # ───────────────────────────────────────────────────────────
+    # Изменения
+    # ───────────────────────────────────────────────────────────
+
+    def add(self, bet):
+        seq = next(self._seq)
+        heapq.heappush(self._heap, (bet['close_time'], seq, bet))
+        self._seqs[id(bet)] = seq
+        amount = bet['amount']
+        gain = amount * bet['payout']
+        self._sides[bet['direction']].insert(bet['entry_price'], amount, gain, seq)
+        self.exposure += amount
+        self.exposure_by_direction[bet['direction']] += amount
+        if self.mark_price is None:
+            self.mark_price = bet['entry_price']
+        if self._wins(bet, self.mark_price):
+            self.winning += amount
+            self.winning_gain += gain
+        else:
+            self.losing += amount
+
+    def pop_due(self, now):
+        """Снимает и возвращает ставки с close_time <= now (по порядку закрытия)."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[2])
+        for bet in due:
+            self._forget(bet)
+        return due
+
+    def clear(self):
+        self.__init__()
+
+    def _forget(self, bet):
+        seq = self._seqs.pop(id(bet))
+        amount = bet['amount']
+        self._sides[bet['direction']].remove(bet['entry_price'], seq)
+        self.exposure -= amount
+        self.exposure_by_direction[bet['direction']] -= amount
+        if self._wins(bet, self.mark_price):
+            self.winning -= amount
+            self.winning_gain -= amount * bet['payout']
+        else:
+            self.losing -= amount
+        if not self._heap:
+            # Портфель пуст — сбрасываем накопленную ошибку округления
+            self.exposure = self.winning = self.winning_gain = self.losing = 0.0
+            self.exposure_by_direction = dict.fromkeys(DIRECTIONS, 0.0)
+
+    # ───────────────────────────────────────────────────────────
+    # Оценка
+    # ───────────────────────────────────────────────────────────
+
+    def mark(self, price):
+        """Новая цена: перекладывает между winning и losing только пересечённые ставки."""
+        old = self.mark_price
+        self.mark_price = price
+        if old is None or old == price or not self._heap:
+            return
+        # UP выигрывает при цене выше входа: выигрывающие — prices[:bisect_left(price)]
+        up = self._sides['UP']
+        self._shift(up, bisect_left(up.prices, old), bisect_left(up.prices, price))
+        # DOWN выигрывает при цене ниже входа: выигрывающие — prices[bisect_right(price):]
+        down = self._sides['DOWN']
+        self._shift(down, bisect_right(down.prices, price), bisect_right(down.prices, old))
+
+    def _shift(self, side, was, now):
+        """Граница выигрывающих сдвинулась с was на now (в индексах отсортированного ряда)."""
+        if now > was:
+            moved = sum(side.amounts[was:now])
+            self.winning += moved
+            self.winning_gain += sum(side.gains[was:now])
+            self.losing -= moved
+        elif now < was:
+            moved = sum(side.amounts[now:was])
+            self.winning -= moved
+            self.winning_gain -= sum(side.gains[now:was])
+            self.losing += moved
+
+    def unrealized(self, lose_multiplier=1.0):
+        """Результат, если бы все ставки закрылись по mark_price."""
+        return self.winning_gain - self.losing * lose_multiplier
+
+    @staticmethod
+    def _wins(bet, price):
+        if bet['direction'] == 'UP':
+            return price > bet['entry_price']
+        return price < bet['entry_price']
+
+    # ───────────────────────────────────────────────────────────
+    # Состояние
+    # ───────────────────────────────────────────────────────────
+
+    def to_state(self):
+        return list(self)
+
+    def restore(self, bets):
+        self.clear()
+        for bet in bets:
+            self.add(bet)
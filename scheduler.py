@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Планировщик задач на монотонных часах.
+
+Задачи назначаются на момент по UTC, а ждутся по монотонным часам, так
+что сдвиг системных часов и время, потраченное на I/O, не накапливаются.
+Часы берутся из модуля clock (при воспроизведении записи — виртуальные).
+Периодические задачи выравниваются по границам интервала (например, по
+закрытию минутной свечи) и пропускают уже прошедшие запуски.
+"""
+
+import heapq
+import itertools
+import threading
+from datetime import datetime, timezone
+
+import clock
+from metrics import log
+
+PRIORITY_HIGH = 0      # Закрытие ставок — раньше прочих задач на тот же момент
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2       # Фоновые задачи (сообщение о запуске) — после тиков
+
+
+class Job:
+    __slots__ = ('when', 'deadline', 'priority', 'seq', 'fn', 'name', 'interval',
+                 'offset', 'cancelled')
+
+    def __init__(self, when, fn, name, priority, interval=None, offset=0.0):
+        self.when = when               # UTC, секунды epoch
+        self.deadline = None           # clock.monotonic()
+        self.priority = priority
+        self.seq = 0
+        self.fn = fn
+        self.name = name or getattr(fn, '__name__', 'job')
+        self.interval = interval
+        self.offset = offset
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.deadline, self.priority, self.seq) < (other.deadline, other.priority, other.seq)
+
+
+class Scheduler:
+    """
+    Очередь задач, выполняемых по очереди в потоке run().
+    Задача вызывается с запланированным моментом (aware datetime UTC).
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._seq = itertools.count()
+        self._stopped = False
+        self.lag = {}              # Имя задачи → опоздание последнего запуска, с
+
+    # ───────────────────────────────────────────────────────────
+    # Назначение
+    # ───────────────────────────────────────────────────────────
+
+    def at(self, when, fn, name=None, priority=PRIORITY_NORMAL):
+        """Однократный запуск в момент when (datetime или epoch-секунды)."""
+        if isinstance(when, datetime):
+            when = when.timestamp()
+        return self._push(Job(when, fn, name, priority))
+
+    def every(self, interval, fn, name=None, offset=0.0, priority=PRIORITY_NORMAL):
+        """Запуск на каждой границе interval секунд (плюс offset) по UTC."""
+        job = Job(_next_boundary(clock.time(), interval, offset), fn, name, priority,
+                  interval=interval, offset=offset)
+        return self._push(job)
+
+    def cancel(self, job):
+        job.cancelled = True
+
+    def _push(self, job):
+        # Перевод момента UTC в монотонные часы
+        job.deadline = clock.monotonic() + (job.when - clock.time())
+        job.seq = next(self._seq)
+        with self._lock:
+            heapq.heappush(self._heap, job)
+        self._wakeup.set()
+        return job
+
+    # ───────────────────────────────────────────────────────────
+    # Выполнение
+    # ───────────────────────────────────────────────────────────
+
+    def run(self):
+        """Выполняет задачи до stop()."""
+        while not self._stopped:
+            with self._lock:
+                job = self._heap[0] if self._heap else None
+                timeout = None if job is None else job.deadline - clock.monotonic()
+                if job is not None and timeout <= 0:
+                    heapq.heappop(self._heap)
+            if job is None or timeout > 0:
+                clock.wait(self._wakeup, timeout)
+                self._wakeup.clear()
+                continue
+            if job.cancelled:
+                continue
+
+            self.lag[job.name] = clock.time() - job.when
+            try:
+                job.fn(datetime.fromtimestamp(job.when, timezone.utc))
+            except Exception as e:
+                log('job_error', f"⚠️ Ошибка в задаче {job.name}: {e}",
+                    job=job.name, error=f"{type(e).__name__}: {e}")
+
+            if job.interval and not job.cancelled:
+                # Следующая граница после текущего момента — пропущенные не догоняем
+                job.when = _next_boundary(max(clock.time(), job.when), job.interval, job.offset)
+                self._push(job)
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return [(job.name, job.when) for job in sorted(self._heap) if not job.cancelled]
+
+
+def _next_boundary(now, interval, offset):
+    """Ближайший момент вида k * interval + offset, строго позже now."""
+    k = (now - offset) // interval + 1
+    return k * interval + offset
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Размер ставки по дробному критерию Келли.
+
+Вероятность выигрыша оценивается по закрытым ставкам корзины уверенности
+(BetHistory.buckets) со сжатием к общему win rate, пока ставок в корзине
+мало. Оценки пересчитываются только после новой закрытой ставки, так что
+решение о размере стоит O(1). Доля Келли уменьшается, когда реализованная
+волатильность выше целевой и по мере роста просадки.
+"""
+
+MIN_BETS = 20                # Закрытых ставок корзины, с которых её оценке доверяем
+PRIOR_BETS = 20              # Вес общего win rate в оценке корзины (в ставках)
+PRIOR_WIN_RATE = 0.5         # К чему сжимается общий win rate при короткой истории
+
+
+def kelly_fraction(p, win_multiple, lose_multiple=1.0):
+    """
+    Доля депозита, максимизирующая ожидаемый логарифм роста, для ставки,
+    которая с вероятностью p приносит win_multiple и иначе теряет lose_multiple.
+    """
+    if win_multiple <= 0:
+        return 0.0
+    return p / lose_multiple - (1 - p) / win_multiple
+
+
+class KellySizer:
+    """Оценки вероятности выигрыша по корзинам и размер ставки по ним."""
+
+    def __init__(self, history, min_bets=MIN_BETS, prior_bets=PRIOR_BETS):
+        self.history = history
+        self.min_bets = min_bets
+        self.prior_bets = prior_bets
+        self._estimates = {}
+        self._version = None
+
+    def win_probability(self, confidence):
+        """Оценка вероятности выигрыша или None, пока в корзине меньше min_bets ставок."""
+        stats = self.history.stats
+        if (id(stats), stats.count) != self._version:
+            self._refresh()
+        return self._estimates.get(self.history.bucket_of(confidence))
+
+    def _refresh(self):
+        stats = self.history.stats
+        prior = self.prior_bets
+        overall = (stats.wins + PRIOR_WIN_RATE * prior) / (stats.count + prior)
+        self._estimates = {
+            bucket: (bucket_stats.wins + overall * prior) / (bucket_stats.count + prior)
+            for bucket, bucket_stats in self.history.buckets.items()
+            if bucket_stats.count >= self.min_bets
+        }
+        self._version = (id(stats), stats.count)
+
+    def percent(self, confidence, win_multiple, lose_multiple=1.0, volatility=0.0,
+                fraction=0.25, target_volatility=0.0, max_drawdown_percent=0.0):
+        """
+        Ставка в % депозита: fraction от доли Келли, уменьшенная пропорционально
+        при volatility выше target_volatility и вдвое к просадке max_drawdown_percent
+        (0 — без поправки). 0 — преимущества нет, None — истории корзины мало.
+        """
+        p = self.win_probability(confidence)
+        if p is None:
+            return None
+        f = kelly_fraction(p, win_multiple, lose_multiple)
+        if f <= 0:
+            return 0.0
+        f *= fraction
+        if target_volatility > 0 and volatility > target_volatility:
+            f *= target_volatility / volatility
+        if max_drawdown_percent > 0:
+            f *= 1 - 0.5 * min(1.0, self.history.stats.drawdown_pct / max_drawdown_percent)
+        return f * 100
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Постоянное хранилище состояния симуляции (SQLite в режиме WAL).
+
+Каждый переход ставки (открытие, закрытие) пишется в журнал вместе со
+снимком состояния. Запись идёт в фоновом потоке пачками, так что
+главный цикл не ждёт fsync. При запуске состояние восстанавливается
+из последнего снимка, последние ставки — из таблицы закрытых ставок.
+"""
+
+import json
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+
+import clock
+from metrics import log
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts TEXT NOT NULL,
+    event TEXT NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshot (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    ts TEXT NOT NULL,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    result TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS market_snapshot (
+    market TEXT PRIMARY KEY,
+    ts TEXT NOT NULL,
+    state TEXT NOT NULL
+);
+"""
+
+# Колонка рынка в журнале и ставках (NULL — основной рынок)
+MARKET_COLUMNS = ('journal', 'bets')
+
+# Поля ставки, которые хранятся как datetime
+DATETIME_FIELDS = ('open_time', 'close_time')
+
+_STOP = object()
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Не сериализуется: {type(value).__name__}")
+
+
+def _decode_bet(bet):
+    if bet is None:
+        return None
+    bet = dict(bet)
+    for field in DATETIME_FIELDS:
+        if isinstance(bet.get(field), str):
+            bet[field] = datetime.fromisoformat(bet[field])
+    return bet
+
+
+class StateStore:
+    """Журнал переходов и снимок состояния в одной базе SQLite."""
+
+    def __init__(self, path):
+        self.path = path
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        for table in MARKET_COLUMNS:
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+            if 'market' not in columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN market TEXT")
+        conn.commit()
+        conn.close()
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="state-store", daemon=True)
+        self._thread.start()
+
+    # ───────────────────────────────────────────────────────────
+    # Запись
+    # ───────────────────────────────────────────────────────────
+
+    def record(self, event, payload, simulation, market=None):
+        """
+        Ставит в очередь событие и снимок состояния. Сериализация идёт здесь,
+        чтобы в базу попало состояние на момент вызова; остальное — в фоне.
+        market — ключ рынка; None — основной рынок.
+        """
+        now = clock.utcnow().isoformat()
+        state = {}
+        for key, value in simulation.items():
+            if hasattr(value, 'to_state'):
+                state[key] = value.to_state()
+            elif key != 'history':
+                state[key] = value
+        self._queue.put((
+            now,
+            market,
+            event,
+            json.dumps(payload, default=_encode),
+            json.dumps(state, default=_encode),
+        ))
+
+    def _run(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        stopping = False
+
+        while not stopping:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            items = [item for item in batch if item is not _STOP]
+            stopping = len(items) != len(batch)
+            try:
+                with conn:
+                    latest = {}
+                    for ts, market, event, payload, state in items:
+                        conn.execute("INSERT INTO journal (ts, market, event, payload) VALUES (?, ?, ?, ?)",
+                                     (ts, market, event, payload))
+                        if event == 'close':
+                            conn.execute("INSERT INTO bets (market, result) VALUES (?, ?)",
+                                         (market, payload))
+                        latest[market] = (ts, state)
+                    for market, (ts, state) in latest.items():
+                        if market is None:
+                            conn.execute("INSERT OR REPLACE INTO snapshot (id, ts, state) VALUES (1, ?, ?)",
+                                         (ts, state))
+                        else:
+                            conn.execute("INSERT OR REPLACE INTO market_snapshot (market, ts, state) "
+                                         "VALUES (?, ?, ?)", (market, ts, state))
+            except sqlite3.Error as e:
+                log('state_store_error', f"State store error: {e}", error=str(e))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        conn.close()
+
+    def flush(self):
+        """Ждёт, пока очередь будет записана."""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join(timeout=10)
+
+    # ───────────────────────────────────────────────────────────
+    # Чтение
+    # ───────────────────────────────────────────────────────────
+
+    def load(self, history_limit=None, market=None):
+        """
+        Последний снимок состояния рынка или None, если его нет.
+        В 'recent_bets' — последние history_limit закрытых ставок (все, если None).
+        """
+        conn = sqlite3.connect(self.path)
+        try:
+            if market is None:
+                row = conn.execute("SELECT state FROM snapshot WHERE id = 1").fetchone()
+            else:
+                row = conn.execute("SELECT state FROM market_snapshot WHERE market = ?",
+                                   (market,)).fetchone()
+            if row is None:
+                return None
+            state = json.loads(row[0])
+            # Снимки до портфеля хранят одну ставку в 'active_bet'
+            state['active_bet'] = _decode_bet(state.get('active_bet'))
+            state['portfolio'] = [_decode_bet(bet) for bet in state.get('portfolio') or []]
+
+            query = "SELECT result FROM bets WHERE market IS ? ORDER BY id"
+            if history_limit is not None:
+                query = ("SELECT result FROM (SELECT id, result FROM bets WHERE market IS ? "
+                         f"ORDER BY id DESC LIMIT {int(history_limit)}) ORDER BY id")
+            state['recent_bets'] = [json.loads(r[0]) for r in conn.execute(query, (market,))]
+            return state
+        finally:
+            conn.close()
+
+    def iter_bets(self, market=None):
+        """Все закрытые ставки рынка по порядку, без загрузки в память целиком."""
+        conn = sqlite3.connect(self.path)
+        try:
+            for row in conn.execute("SELECT result FROM bets WHERE market IS ? ORDER BY id", (market,)):
+                yield json.loads(row[0])
+        finally:
+            conn.close()
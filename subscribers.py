@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Подписчики рассылки сигналов.
+
+Каждый чат или канал хранит свои настройки: язык и подробность сообщений,
+минимальную уверенность ставки и получение мониторинга. Реестр живёт
+в памяти (рассылка не ходит в базу), изменения сразу пишутся в SQLite —
+в ту же базу, что и состояние бота.
+"""
+
+import sqlite3
+import threading
+
+import clock
+import messages
+from metrics import log
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscriber (
+    chat_id TEXT PRIMARY KEY,
+    lang TEXT NOT NULL,
+    style TEXT NOT NULL,
+    min_confidence INTEGER NOT NULL,
+    monitoring INTEGER NOT NULL,
+    added_at TEXT NOT NULL
+);
+"""
+
+FIELDS = ('chat_id', 'lang', 'style', 'min_confidence', 'monitoring', 'added_at')
+
+# Виды сообщений, которые получают только подписчики с мониторингом
+MONITORING_KINDS = ('status', 'waiting')
+
+
+class Subscriber:
+    __slots__ = FIELDS
+
+    def __init__(self, chat_id, lang, style, min_confidence=0, monitoring=True, added_at=None):
+        self.chat_id = str(chat_id)
+        self.lang = lang
+        self.style = style
+        self.min_confidence = int(min_confidence)
+        self.monitoring = bool(monitoring)
+        self.added_at = added_at or clock.utcnow().isoformat()
+
+    def accepts(self, kind, confidence=None):
+        """Подходит ли подписчику сообщение вида kind с уверенностью ставки confidence."""
+        if kind in MONITORING_KINDS and not self.monitoring:
+            return False
+        if kind == 'status' or confidence is None:
+            # Мониторинг и есть слабый сигнал — порог к нему не применяется
+            return True
+        return confidence >= self.min_confidence
+
+    def row(self):
+        return tuple(getattr(self, field) for field in FIELDS)
+
+
+class SubscriberRegistry:
+    """Подписчики в памяти с записью изменений в SQLite (path=None — без записи)."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        if path:
+            conn = sqlite3.connect(path)
+            try:
+                conn.executescript(SCHEMA)
+                for row in conn.execute(f"SELECT {', '.join(FIELDS)} FROM subscriber"):
+                    subscriber = Subscriber(*row)
+                    self._subscribers[subscriber.chat_id] = subscriber
+                    messages.preferences[subscriber.chat_id] = (subscriber.lang, subscriber.style)
+            finally:
+                conn.close()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def __contains__(self, chat_id):
+        return str(chat_id) in self._subscribers
+
+    def get(self, chat_id):
+        return self._subscribers.get(str(chat_id))
+
+    def all(self):
+        return list(self._subscribers.values())
+
+    # ───────────────────────────────────────────────────────────
+    # Изменения
+    # ───────────────────────────────────────────────────────────
+
+    def add(self, chat_id, **settings):
+        """Добавляет подписчика (существующему меняет настройки)."""
+        chat_id = str(chat_id)
+        with self._lock:
+            subscriber = self._subscribers.get(chat_id)
+            if subscriber is None:
+                lang, style = messages.variant_for(chat_id)
+                subscriber = Subscriber(chat_id, lang, style)
+            self._apply(subscriber, settings)
+            self._subscribers[chat_id] = subscriber
+            self._save(subscriber)
+        return subscriber
+
+    def update(self, chat_id, **settings):
+        """Меняет настройки подписчика; KeyError, если его нет."""
+        chat_id = str(chat_id)
+        with self._lock:
+            subscriber = self._subscribers[chat_id]
+            self._apply(subscriber, settings)
+            self._save(subscriber)
+        return subscriber
+
+    def remove(self, chat_id):
+        chat_id = str(chat_id)
+        with self._lock:
+            if self._subscribers.pop(chat_id, None) is None:
+                return False
+            messages.preferences.pop(chat_id, None)
+            self._execute("DELETE FROM subscriber WHERE chat_id = ?", (chat_id,))
+        return True
+
+    def _apply(self, subscriber, settings):
+        """Сначала проверяет все значения, затем меняет: ошибка не оставляет полуизменений."""
+        min_confidence = settings.get('min_confidence')
+        if min_confidence is not None:
+            min_confidence = int(min_confidence)
+            if not 0 <= min_confidence <= 100:
+                raise ValueError("min_confidence должно быть от 0 до 100")
+        lang, style = messages.set_preference(subscriber.chat_id, settings.get('lang'),
+                                              settings.get('style'))
+        subscriber.lang, subscriber.style = lang, style
+        if min_confidence is not None:
+            subscriber.min_confidence = min_confidence
+        if settings.get('monitoring') is not None:
+            subscriber.monitoring = bool(settings['monitoring'])
+
+    def _save(self, subscriber):
+        self._execute(f"INSERT OR REPLACE INTO subscriber ({', '.join(FIELDS)}) "
+                      f"VALUES ({', '.join('?' * len(FIELDS))})", subscriber.row())
+
+    def _execute(self, query, params):
+        if not self.path:
+            return
+        try:
+            conn = sqlite3.connect(self.path)
+            with conn:
+                conn.execute(query, params)
+            conn.close()
+        except sqlite3.Error as e:
+            log('subscriber_store_error', f"Subscriber store error: {e}", error=str(e))
+
+    # ───────────────────────────────────────────────────────────
+    # Рассылка
+    # ───────────────────────────────────────────────────────────
+
+    def recipients(self, kind, confidence=None):
+        """Чаты, которым подходит сообщение."""
+        return [s.chat_id for s in list(self._subscribers.values()) if s.accepts(kind, confidence)]
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Входящие команды Telegram через long polling getUpdates.
+
+Фоновый поток держит открытый запрос getUpdates (timeout=POLL_TIMEOUT)
+на общей сессии транспорта, запоминает offset последнего обновления
+и передаёт команды из разрешённых чатов обработчику. Ответ обработчика
+отправляется через переданную функцию send (обычно очередь Telegram),
+так что цикл ставок ни на чём не ждёт.
+"""
+
+import threading
+import time
+
+import requests
+
+from metrics import log
+from transport import http_get
+
+POLL_TIMEOUT = 30            # Секунд, которые Telegram держит запрос без обновлений
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+LONG_POLL_CIRCUIT = "api.telegram.org/getUpdates"  # Ключ автомата long polling
+STALE_SECONDS = 60           # Команды, отправленные раньше запуска бота, игнорируются
+
+
+def parse_command(text):
+    """'/set@MyBot min_confidence 50' → ('set', ['min_confidence', '50']); не команда → None."""
+    if not text or not text.startswith('/'):
+        return None
+    parts = text.split()
+    command = parts[0][1:].split('@', 1)[0].lower()
+    return command, parts[1:]
+
+
+class CommandPoller:
+    """
+    Получение команд в фоне; handler(command, args, chat_id) → текст ответа или None.
+    Из allowed_chats принимаются все команды, из остальных чатов — только public_commands.
+    """
+
+    def __init__(self, token, handler, send, allowed_chats, public_commands=(),
+                 poll_timeout=POLL_TIMEOUT):
+        self.url = f"https://api.telegram.org/bot{token}/getUpdates"
+        self.handler = handler
+        self.send = send
+        self.allowed_chats = {str(chat) for chat in allowed_chats}
+        self.public_commands = set(public_commands)
+        self.poll_timeout = poll_timeout
+        self.offset = None
+        self.started_at = None
+        self.handled = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="telegram-commands", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        attempt = 0
+        while not self._stop.is_set():
+            try:
+                updates = self._poll()
+            except (requests.RequestException, ValueError) as e:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+                attempt += 1
+                log('telegram_poll_error', f"Telegram getUpdates error: {e}",
+                    error=str(e), retry_in=round(delay, 1))
+                self._stop.wait(delay)
+                continue
+            attempt = 0
+            for update in updates:
+                self.offset = update['update_id'] + 1
+                self._dispatch(update)
+
+    def _poll(self):
+        params = {"timeout": self.poll_timeout, "allowed_updates": '["message"]'}
+        if self.offset is not None:
+            params["offset"] = self.offset
+        # HTTP-таймаут длиннее long polling, иначе пустой ответ считался бы обрывом.
+        # Свой автомат: обрывы long polling не должны отключать sendMessage
+        response = http_get(self.url, params=params, timeout=self.poll_timeout + 10, retries=0,
+                            circuit=LONG_POLL_CIRCUIT)
+        if response.status_code == 429:
+            retry_after = response.json().get('parameters', {}).get('retry_after', 5)
+            self._stop.wait(retry_after)
+            return []
+        if response.status_code != 200:
+            raise ValueError(f"getUpdates {response.status_code}: {response.text[:200]}")
+        return response.json().get('result', [])
+
+    def _dispatch(self, update):
+        message = update.get('message') or {}
+        chat_id = str(message.get('chat', {}).get('id', ''))
+        if message.get('date', 0) < self.started_at - STALE_SECONDS:
+            return
+        parsed = parse_command(message.get('text', ''))
+        if parsed is None:
+            return
+        command, args = parsed
+        if chat_id not in self.allowed_chats and command not in self.public_commands:
+            return
+        try:
+            reply = self.handler(command, args, chat_id)
+        except Exception as e:
+            reply = f"⚠️ Ошибка команды /{command}: {e}"
+        self.handled += 1
+        if reply:
+            self.send(reply, chat_id)
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Очередь исходящих сообщений Telegram.
+
+Сообщения отправляются фоновыми потоками, так что закрытие и открытие
+ставок не ждёт Telegram. Очередь приоритетная: итоги ставок уходят раньше
+мониторинга. Потоки делят общий расписатель отправок, который соблюдает
+лимиты (не чаще раза в секунду на чат и 30 сообщений в секунду всего),
+выдерживают retry_after из ответов 429, повторяют сетевые ошибки
+с задержкой и могут склеивать сообщения одному чату, пришедшие подряд.
+"""
+
+import bisect
+import itertools
+import queue
+import random
+import threading
+import time
+
+import requests
+
+from messages import render_text
+from metrics import log
+from transport import http_post
+
+TELEGRAM_MAX_LENGTH = 4096   # Лимит длины сообщения Telegram
+PER_CHAT_INTERVAL = 1.0      # Секунд между сообщениями в один чат
+GLOBAL_PER_SECOND = 30       # Сообщений в секунду на бота
+MAX_ATTEMPTS = 5             # Попыток доставки одного сообщения
+BACKOFF_BASE = 1.0           # Базовая задержка повтора (секунд)
+BACKOFF_MAX = 30.0
+
+PRIORITY_HIGH = 0            # Итоги ставок и ответы на команды
+PRIORITY_NORMAL = 1          # Новые ставки
+PRIORITY_LOW = 2             # Мониторинг
+
+# Приоритет сообщений бота по виду (messages.Message.kind); строки — PRIORITY_HIGH
+KIND_PRIORITY = {
+    'close_bet': PRIORITY_HIGH,
+    'new_bet': PRIORITY_NORMAL,
+    'status': PRIORITY_LOW,
+    'waiting': PRIORITY_LOW,
+}
+
+_STOP = object()
+_STOP_PRIORITY = PRIORITY_LOW + 1   # Остановка — после всего, что уже в очереди
+
+
+class OutboxItem:
+    __slots__ = ('chat_id', 'text', 'enqueued_at', 'parts', 'priority')
+
+    def __init__(self, chat_id, text, priority=PRIORITY_NORMAL):
+        self.chat_id = chat_id
+        self.text = text
+        self.enqueued_at = time.monotonic()
+        self.parts = 1
+        self.priority = priority
+
+
+class TelegramOutbox:
+    """Фоновая доставка сообщений с приоритетами, лимитами и повторами."""
+
+    def __init__(self, token, default_chat_id, merge_window=0.0, workers=1,
+                 per_chat_interval=PER_CHAT_INTERVAL, global_per_second=GLOBAL_PER_SECOND,
+                 max_attempts=MAX_ATTEMPTS, timeout=10):
+        """
+        merge_window — сколько секунд ждать следующих сообщений в тот же чат,
+        чтобы отправить их одним (0 — не склеивать).
+        workers — потоков доставки; лимиты общие для всех.
+        """
+        self.url = f"https://api.telegram.org/bot{token}/sendMessage"
+        self.default_chat_id = default_chat_id
+        self.merge_window = merge_window
+        self.workers = max(1, workers)
+        self.per_chat_interval = per_chat_interval
+        self.global_per_second = global_per_second
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._threads = []
+        self._rate_lock = threading.Lock()
+        self._next_slot = {}         # chat_id → ближайшее время, когда можно писать в чат
+        self._slots = []             # Занятые моменты отправки за последнюю секунду (по возрастанию)
+        self._blocked_until = 0.0    # retry_after из 429 — для всех потоков
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'sent': 0,
+            'failed': 0,
+            'retries': 0,
+            'rate_limited': 0,
+            'merged': 0,
+            'last_latency': None,
+            'avg_latency': None,
+        }
+        self.chat_lag = {}           # chat_id → сглаженная задержка доставки (секунд)
+
+    # ───────────────────────────────────────────────────────────
+    # Интерфейс
+    # ───────────────────────────────────────────────────────────
+
+    def start(self):
+        self._threads = [
+            threading.Thread(target=self._run, name=f"telegram-outbox-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=10):
+        """Доотправляет очередь (не дольше timeout секунд) и останавливает потоки."""
+        if not self._threads:
+            return
+        self._queue.put((_STOP_PRIORITY, next(self._seq), _STOP))
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+        self._threads = []
+
+    def send(self, text, chat_id=None, priority=None):
+        """
+        Ставит сообщение (строку или messages.Message) в очередь; не блокирует.
+        priority=None — по виду сообщения (KIND_PRIORITY).
+        """
+        priority = _priority(text) if priority is None else priority
+        self._put(OutboxItem(chat_id or self.default_chat_id, text, priority))
+        return True
+
+    def send_many(self, text, chat_ids, priority=None):
+        """
+        Рассылка одного сообщения по чатам. Message рисуется один раз на вариант
+        (язык × подробность), а не на чат.
+        """
+        priority = _priority(text) if priority is None else priority
+        for chat_id in chat_ids:
+            self._put(OutboxItem(chat_id, text, priority))
+        return len(chat_ids)
+
+    @property
+    def depth(self):
+        """Сообщений в очереди."""
+        return self._queue.qsize()
+
+    def snapshot(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['depth'] = self.depth
+        return stats
+
+    def lag_by_chat(self):
+        with self._stats_lock:
+            return dict(self.chat_lag)
+
+    # ───────────────────────────────────────────────────────────
+    # Потоки доставки
+    # ───────────────────────────────────────────────────────────
+
+    def _put(self, item):
+        self._queue.put((item.priority, next(self._seq), item))
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            item = entry[2]
+            if item is _STOP:
+                # Сигнал остановки — следующему потоку
+                self._queue.put(entry)
+                return
+            if self.merge_window > 0:
+                item = self._merge(item)
+            self._deliver(item)
+
+    def _merge(self, item):
+        """Собирает сообщения в тот же чат, пришедшие за merge_window."""
+        item.text = render_text(item.text, item.chat_id)
+        held = []
+        deadline = time.monotonic() + self.merge_window
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            nxt = entry[2]
+            if nxt is _STOP:
+                held.append(entry)
+                break
+            if nxt.chat_id == item.chat_id:
+                nxt.text = render_text(nxt.text, nxt.chat_id)
+            if (nxt.chat_id == item.chat_id
+                    and len(item.text) + len(nxt.text) + 1 <= TELEGRAM_MAX_LENGTH):
+                item.text = f"{item.text}\n{nxt.text}"
+                item.parts += 1
+                item.priority = min(item.priority, nxt.priority)
+                with self._stats_lock:
+                    self.stats['merged'] += 1
+            else:
+                held.append(entry)
+        # Остальные возвращаются со своими приоритетом и порядком
+        for entry in held:
+            self._queue.put(entry)
+        return item
+
+    def _reserve(self, chat_id):
+        """
+        Занимает момент отправки в чат с учётом лимитов всех потоков
+        и возвращает, сколько до него ждать.
+        """
+        with self._rate_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(chat_id, 0.0), self._blocked_until)
+            cutoff = bisect.bisect_left(self._slots, now - 1.0)
+            del self._slots[:cutoff]
+            while True:
+                # Не больше global_per_second отправок в любой секунде до slot
+                end = bisect.bisect_right(self._slots, slot)
+                start = bisect.bisect_right(self._slots, slot - 1.0)
+                if end - start < self.global_per_second:
+                    break
+                slot = self._slots[end - self.global_per_second] + 1.0
+            bisect.insort(self._slots, slot)
+            self._next_slot[chat_id] = slot + self.per_chat_interval
+            return slot - now
+
+    def _deliver(self, item):
+        # Сообщения бота (messages.Message) рисуются здесь, вне цикла ставок
+        data = {"chat_id": item.chat_id, "text": render_text(item.text, item.chat_id),
+                "parse_mode": "HTML"}
+
+        for attempt in range(self.max_attempts):
+            if attempt:
+                with self._stats_lock:
+                    self.stats['retries'] += 1
+            wait = self._reserve(item.chat_id)
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                response = http_post(self.url, data=data, timeout=self.timeout, retries=0)
+            except requests.RequestException as e:
+                log('telegram_error', f"Telegram error: {e}", chat_id=item.chat_id, error=str(e))
+                self._backoff(attempt)
+                continue
+
+            if response.status_code == 429:
+                retry_after = _retry_after(response)
+                with self._stats_lock:
+                    self.stats['rate_limited'] += 1
+                with self._rate_lock:
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+                continue
+            if response.status_code >= 500:
+                self._backoff(attempt)
+                continue
+            if response.status_code != 200:
+                # 400/403 и т.п. — повтор не поможет
+                log('telegram_error', f"Telegram error: {response.status_code} {response.text[:200]}",
+                    chat_id=item.chat_id, status=response.status_code, error=response.text[:200])
+                break
+
+            self._record_delivery(item)
+            return True
+
+        with self._stats_lock:
+            self.stats['failed'] += item.parts
+        return False
+
+    def _backoff(self, attempt):
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+        time.sleep(random.uniform(delay / 2, delay))
+
+    def _record_delivery(self, item):
+        latency = time.monotonic() - item.enqueued_at
+        with self._stats_lock:
+            self.stats['sent'] += item.parts
+            self.stats['last_latency'] = latency
+            if self.stats['avg_latency'] is None:
+                self.stats['avg_latency'] = latency
+            else:
+                self.stats['avg_latency'] += 0.2 * (latency - self.stats['avg_latency'])
+            lag = self.chat_lag.get(item.chat_id)
+            self.chat_lag[item.chat_id] = latency if lag is None else lag + 0.2 * (latency - lag)
+
+
+def _priority(text):
+    return KIND_PRIORITY.get(getattr(text, 'kind', None), PRIORITY_HIGH)
+
+
+def _retry_after(response):
+    try:
+        return float(response.json()['parameters']['retry_after'])
+    except Exception:
+        return 5.0
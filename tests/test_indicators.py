@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""IndicatorEngine против исходных функций бота на скользящем окне свечей."""
+
+import os
+
+import pytest
+
+import btc_telegram_bot as bot
+from backtest import KLINE_FIELDS, load_klines
+from indicators import IndicatorEngine
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'klines.csv')
+WINDOW = 100                 # CANDLE_LIMIT по умолчанию: окно, которое видит calculate_signal
+
+
+@pytest.fixture(scope='module')
+def candles():
+    klines = load_klines([FIXTURE])
+    return [{name: int(klines[name][i]) if name == 'open_time' else float(klines[name][i])
+             for name in KLINE_FIELDS} for i in range(len(klines['close']))]
+
+
+def _windows(candles):
+    """Окна, как их отдаёт кэш свечей: последняя — текущая незакрытая."""
+    for end in range(WINDOW, len(candles) + 1):
+        yield end, candles[end - WINDOW:end]
+
+
+def test_rsi_vwap_momentum_match_window(candles):
+    engine = IndicatorEngine(window=WINDOW)
+    for _, window in _windows(candles):
+        snapshot = engine.sync(window)
+        closes = [c['close'] for c in window]
+        assert snapshot['rsi'] == bot.calculate_rsi(closes)
+        assert snapshot['vwap'] == bot.calculate_vwap(window)
+        assert snapshot['momentum'] == bot.get_momentum(closes)
+
+
+def test_macd_matches_full_series_not_window(candles):
+    engine = IndicatorEngine(window=WINDOW)
+    worst = 0.0
+    for end, window in _windows(candles):
+        snapshot = engine.sync(window)
+        # Затравка — первая свеча, которую видел движок: совпадение с рядом целиком
+        full = [c['close'] for c in candles[:end]]
+        assert snapshot['macd'] == bot.calculate_macd(full)
+        worst = max(worst, abs(snapshot['macd'] - bot.calculate_macd([c['close'] for c in window])))
+    # calculate_macd по окну затравливает EMA заново: расхождение — остаток затравки
+    assert 0 < worst < 0.5
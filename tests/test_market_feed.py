@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""MarketFeed против локального WebSocket-сервера: данные, обрыв, переподключение."""
+
+import base64
+import hashlib
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+import market_feed
+from market_feed import MarketFeed
+
+pytestmark = pytest.mark.skipif(market_feed.websocket is None, reason="нет websocket-client")
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class FakeStream:
+    """
+    Минимальный WebSocket-сервер комбинированного потока. Каждому подключению
+    отдаёт сообщения из scripts (по порядку подключений); drop=True — после них
+    обрывает соединение, иначе держит его, пока клиент не закроет.
+    """
+
+    def __init__(self, scripts):
+        self.scripts = scripts
+        self.paths = []
+        self._stop = threading.Event()
+        self._sock = socket.socket()
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.listen()
+        self._sock.settimeout(0.1)
+        self.url = f"ws://127.0.0.1:{self._sock.getsockname()[1]}/stream"
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._sock.close()
+
+    def _serve(self):
+        while not self._stop.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except socket.timeout:
+                continue
+            with conn:
+                self._handle(conn)
+
+    def _handle(self, conn):
+        request = b""
+        while b"\r\n\r\n" not in request:
+            request += conn.recv(4096)
+        lines = request.decode().split("\r\n")
+        self.paths.append(lines[0].split()[1])
+        key = next(line.split(":", 1)[1].strip() for line in lines
+                   if line.lower().startswith("sec-websocket-key"))
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        conn.sendall(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                      f"Connection: Upgrade\r\nSec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+
+        messages, drop = self.scripts[min(len(self.paths), len(self.scripts)) - 1]
+        for message in messages:
+            conn.sendall(_frame(json.dumps(message).encode()))
+        if drop:
+            return
+        # Держим соединение, пока клиент его не закроет (close-кадр или обрыв)
+        conn.settimeout(0.05)
+        while not self._stop.is_set():
+            try:
+                conn.recv(1024)
+                return
+            except socket.timeout:
+                continue
+
+
+def _frame(payload):
+    """Текстовый кадр сервера (без маски)."""
+    if len(payload) < 126:
+        header = bytes([0x81, len(payload)])
+    else:
+        header = bytes([0x81, 126]) + len(payload).to_bytes(2, 'big')
+    return header + payload
+
+
+def _kline(open_time, close):
+    return {'stream': 'btcusdt@kline_1m',
+            'data': {'k': {'t': open_time, 'o': close, 'h': close, 'l': close, 'c': close, 'v': 1}}}
+
+
+def _depth(first, last, bid):
+    return {'stream': 'btcusdt@depth@100ms',
+            'data': {'U': first, 'u': last, 'b': [[str(bid), '1']], 'a': [[str(bid + 1), '1']]}}
+
+
+def _wait(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_reconnects_with_same_streams_and_resyncs(monkeypatch):
+    monkeypatch.setattr(market_feed, 'SNAPSHOT_RETRY_SECONDS', 0)
+    seeds = []
+    snapshots = [
+        {'lastUpdateId': 10, 'bids': [['100', '1']], 'asks': [['101', '1']]},
+        {'lastUpdateId': 50, 'bids': [['200', '1']], 'asks': [['201', '1']]},
+    ]
+    server = FakeStream([
+        ([_kline(0, 100), _depth(11, 12, 100)], True),
+        ([_kline(60_000, 200), _depth(51, 52, 200),
+          {'stream': 'btcusdt@trade', 'data': {'p': '200.5'}}], False),
+    ])
+    feed = MarketFeed(url=server.url, candle_limit=4, backoff_base=0.05, backoff_max=0.2,
+                      seed_candles=lambda: seeds.append(len(seeds)) or [],
+                      depth_snapshot=lambda: snapshots[min(len(server.paths), 2) - 1])
+    feed.start()
+    try:
+        assert _wait(lambda: feed.get_price() == 200.5)
+    finally:
+        feed.stop()
+        server.stop()
+
+    # Переподключение с той же подпиской, история дозапрошена на каждом подключении
+    assert len(server.paths) == 2
+    assert server.paths[0] == server.paths[1]
+    assert server.paths[0].endswith("streams=" + "/".join(feed.streams))
+    assert feed.reconnects == 1
+    assert len(seeds) == 2
+
+    # Свечи из обоих подключений, стакан пересобран по второму снимку
+    assert [c['close'] for c in feed.get_candles()] == [100.0, 200.0]
+    assert feed.book.synced
+    assert feed.book.last_update_id == 52
+    assert feed.get_flow()['mid'] == 200.5
+
+
+def test_depth_snapshot_does_not_block_reader(monkeypatch):
+    monkeypatch.setattr(market_feed, 'SNAPSHOT_RETRY_SECONDS', 0)
+    release = threading.Event()
+
+    def slow_snapshot():
+        release.wait(5)
+        return {'lastUpdateId': 10, 'bids': [['100', '1']], 'asks': [['101', '1']]}
+
+    feed = MarketFeed(depth_snapshot=slow_snapshot)
+    feed.handle_message(json.dumps(_depth(11, 12, 100)))
+
+    # Снимок ещё грузится: поток чтения свободен, события копятся в буфере
+    feed.handle_message(json.dumps({'stream': 'btcusdt@trade', 'data': {'p': '100.5'}}))
+    feed.handle_message(json.dumps(_depth(13, 14, 99)))
+    assert feed.get_price() == 100.5
+    assert not feed.book.synced
+
+    release.set()
+    assert _wait(lambda: feed.book.synced)
+    assert feed.book.last_update_id == 14
+    feed.stop()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""Стакан на записанных сообщениях глубины: пересинхронизация и дисбаланс."""
+
+import json
+import os
+
+import pytest
+
+from order_book import FLOW_DEPTHS, OrderBook, parse_depth_event, replay
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'depth.jsonl')
+
+
+def _messages():
+    with open(FIXTURE) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ReferenceBook:
+    """Тот же стакан словарями — независимая проверка уровней и дисбаланса."""
+
+    def __init__(self, snapshot):
+        self.bids = {float(p): float(q) for p, q in snapshot['bids']}
+        self.asks = {float(p): float(q) for p, q in snapshot['asks']}
+
+    def apply(self, event):
+        for side, levels in ((self.bids, event['b']), (self.asks, event['a'])):
+            for price, qty in levels:
+                if float(qty) == 0:
+                    side.pop(float(price), None)
+                else:
+                    side[float(price)] = float(qty)
+
+    def imbalance(self, depth):
+        bids = sorted(self.bids.items(), reverse=True)[:depth]
+        asks = sorted(self.asks.items())[:depth]
+        mid = (bids[0][0] + asks[0][0]) / 2
+        bid = sum(q / (1 + abs(p - mid) / mid * 10_000) for p, q in bids)
+        ask = sum(q / (1 + abs(p - mid) / mid * 10_000) for p, q in asks)
+        return (bid - ask) / (bid + ask)
+
+
+def _assert_matches(book, reference):
+    assert book.bids.top(len(book.bids)) == sorted(reference.bids.items(), reverse=True)
+    assert book.asks.top(len(book.asks)) == sorted(reference.asks.items())
+    flow = book.flow()
+    for depth in FLOW_DEPTHS:
+        assert flow['imbalance'][depth] == pytest.approx(reference.imbalance(depth), abs=1e-12)
+
+
+def test_replay_resyncs_after_sequence_gap():
+    messages = _messages()
+    stale, snapshot, first, second, gap, buffered, resnapshot, last = messages
+    book = OrderBook()
+
+    # До снимка события копятся; устаревшее отбрасывается при загрузке снимка
+    assert not book.apply_diff(parse_depth_event(stale))
+    assert book.load_snapshot(snapshot)
+    reference = ReferenceBook(snapshot)
+    assert book.last_update_id == 100
+
+    for message in (first, second):
+        assert book.apply_diff(parse_depth_event(message))
+        reference.apply(message['data'])
+        _assert_matches(book, reference)
+    assert book.last_update_id == 105
+
+    # Пропуск 106..109 — стакан ждёт новый снимок, события буферизуются
+    assert not book.apply_diff(parse_depth_event(gap))
+    assert book.needs_snapshot and book.resyncs == 1
+    assert not book.apply_diff(parse_depth_event(buffered))
+
+    # Новый снимок накрывает начало буфера: оба события применяются поверх
+    assert book.load_snapshot(resnapshot)
+    reference = ReferenceBook(resnapshot)
+    reference.apply(gap['data'])
+    reference.apply(buffered['data'])
+    assert book.synced and book.last_update_id == 114
+    _assert_matches(book, reference)
+
+    assert book.apply_diff(parse_depth_event(last))
+    reference.apply(last['data'])
+    _assert_matches(book, reference)
+
+
+def test_replay_helper_end_state():
+    with open(FIXTURE) as f:
+        book = replay(f)
+    assert book.synced
+    assert book.resyncs == 1
+    assert book.last_update_id == 116
+    flow = book.flow()
+    assert set(flow['imbalance']) == set(FLOW_DEPTHS)
+    assert flow['mid'] == pytest.approx(60000.375)
+    assert flow['spread'] == pytest.approx(0.25)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""Портфель: порядок закрытий по куче и инкрементальные суммы против пересчёта."""
+
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from portfolio import Portfolio
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def _bet(direction, entry_price, amount, minutes, payout=0.9):
+    return {'direction': direction, 'entry_price': entry_price, 'amount': amount,
+            'payout': payout, 'close_time': START + timedelta(minutes=minutes)}
+
+
+def _expected(bets, price, lose_multiplier=1.0):
+    """Суммы перебором всех ставок."""
+    winning = winning_gain = losing = 0.0
+    for bet in bets:
+        wins = price > bet['entry_price'] if bet['direction'] == 'UP' else price < bet['entry_price']
+        if wins:
+            winning += bet['amount']
+            winning_gain += bet['amount'] * bet['payout']
+        else:
+            losing += bet['amount']
+    return winning, winning_gain, losing, winning_gain - losing * lose_multiplier
+
+
+def _assert_sums(portfolio, bets):
+    winning, winning_gain, losing, unrealized = _expected(bets, portfolio.mark_price, 1.5)
+    assert portfolio.winning == pytest.approx(winning)
+    assert portfolio.winning_gain == pytest.approx(winning_gain)
+    assert portfolio.losing == pytest.approx(losing)
+    assert portfolio.unrealized(1.5) == pytest.approx(unrealized)
+    assert portfolio.exposure == pytest.approx(sum(b['amount'] for b in bets))
+
+
+def test_pop_due_in_close_order():
+    portfolio = Portfolio()
+    late = _bet('UP', 100, 10, 15)
+    early = _bet('DOWN', 100, 20, 5)
+    tie_first = _bet('UP', 101, 30, 10)
+    tie_second = _bet('UP', 101, 40, 10)
+    for bet in (late, early, tie_first, tie_second):
+        portfolio.add(bet)
+
+    assert portfolio.peek() is early
+    assert list(portfolio) == [early, tie_first, tie_second, late]
+    assert portfolio.pop_due(START + timedelta(minutes=4)) == []
+
+    # Одинаковый close_time — в порядке добавления
+    assert portfolio.pop_due(START + timedelta(minutes=10)) == [early, tie_first, tie_second]
+    assert len(portfolio) == 1 and late in portfolio and early not in portfolio
+    assert portfolio.exposure == pytest.approx(10)
+    assert portfolio.exposure_by_direction == {'UP': pytest.approx(10), 'DOWN': pytest.approx(0)}
+
+    assert portfolio.pop_due(START + timedelta(minutes=15)) == [late]
+    assert portfolio.exposure == 0.0
+    assert portfolio.winning == portfolio.losing == portfolio.winning_gain == 0.0
+
+
+def test_mark_moves_only_crossed_bets():
+    portfolio = Portfolio()
+    bets = [_bet('UP', 100, 10, 5, 0.8), _bet('UP', 102, 20, 5, 0.9),
+            _bet('DOWN', 101, 30, 5, 1.0), _bet('DOWN', 103, 40, 5, 0.7)]
+    portfolio.mark(101.5)
+    for bet in bets:
+        portfolio.add(bet)
+    _assert_sums(portfolio, bets)
+
+    # Цена ровно на входе — ставка не выигрывает ни в одну сторону
+    for price in (102, 99, 104, 101, 100.5, 103):
+        portfolio.mark(price)
+        _assert_sums(portfolio, bets)
+
+
+def test_random_add_mark_settle_matches_recount():
+    rnd = random.Random(7)
+    portfolio = Portfolio()
+    open_bets = []
+    minute = 0
+    for _ in range(500):
+        action = rnd.random()
+        if action < 0.4:
+            bet = _bet(rnd.choice(('UP', 'DOWN')), rnd.randint(95, 105), rnd.uniform(1, 50),
+                       minute + rnd.randint(1, 15), rnd.uniform(0.5, 1.5))
+            portfolio.add(bet)
+            open_bets.append(bet)
+        elif action < 0.8:
+            portfolio.mark(rnd.randint(95, 105) + rnd.choice((0, 0.5)))
+        else:
+            minute += rnd.randint(1, 5)
+            now = START + timedelta(minutes=minute)
+            due = portfolio.pop_due(now)
+            expected = sorted((b for b in open_bets if b['close_time'] <= now),
+                              key=lambda b: b['close_time'])
+            assert [b['close_time'] for b in due] == [b['close_time'] for b in expected]
+            assert {id(b) for b in due} == {id(b) for b in expected}
+            open_bets = [b for b in open_bets if b['close_time'] > now]
+        if portfolio.mark_price is not None:
+            _assert_sums(portfolio, open_bets)
+    assert len(portfolio) == len(open_bets)
+
+
+def test_restore_keeps_close_order():
+    portfolio = Portfolio()
+    bets = [_bet('UP', 100, 10, m) for m in (9, 3, 6)]
+    for bet in bets:
+        portfolio.add(bet)
+    restored = Portfolio()
+    restored.restore(portfolio.to_state())
+    assert [b['close_time'] for b in restored] == sorted(b['close_time'] for b in bets)
+    assert restored.exposure == pytest.approx(30)
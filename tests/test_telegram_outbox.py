@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Расписатель отправок: лимиты на чат и на бота, пауза по 429 для всех потоков."""
+
+import pytest
+
+import telegram_outbox
+from telegram_outbox import TelegramOutbox
+
+
+class FakeTime:
+    """monotonic и sleep: sleep только двигает часы."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Response:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body or {}
+        self.text = str(self._body)
+
+    def json(self):
+        return self._body
+
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(telegram_outbox.time, 'monotonic', fake.monotonic)
+    monkeypatch.setattr(telegram_outbox.time, 'sleep', fake.sleep)
+    return fake
+
+
+def test_per_chat_interval(fake_time):
+    outbox = TelegramOutbox("token", 1, per_chat_interval=1.0, global_per_second=30)
+    assert outbox._reserve(1) == 0
+    assert outbox._reserve(1) == pytest.approx(1.0)
+    assert outbox._reserve(1) == pytest.approx(2.0)
+    # Другой чат своей очереди не ждёт
+    assert outbox._reserve(2) == 0
+
+
+def test_global_slots_shared_between_chats(fake_time):
+    outbox = TelegramOutbox("token", 1, per_chat_interval=1.0, global_per_second=3)
+    waits = [outbox._reserve(chat_id) for chat_id in range(7)]
+    # По три отправки в секунду на всех, следующие — на секунду позже
+    assert waits == pytest.approx([0, 0, 0, 1.0, 1.0, 1.0, 2.0])
+
+    # Через секунду старые слоты освобождаются
+    fake_time.now += 3.0
+    assert outbox._reserve(100) == 0
+
+
+def test_429_blocks_every_chat_until_retry_after(fake_time, monkeypatch):
+    responses = [Response(429, {'parameters': {'retry_after': 7}}), Response(200, {'ok': True})]
+    sent_at = []
+    other_waits = []
+
+    def fake_post(url, data, timeout, retries):
+        sent_at.append((data['chat_id'], fake_time.now))
+        return responses.pop(0)
+
+    def sleep(seconds):
+        # Пока первый чат выжидает паузу, другой поток просит слот
+        other_waits.append(outbox._reserve(2))
+        FakeTime.sleep(fake_time, seconds)
+
+    monkeypatch.setattr(telegram_outbox, 'http_post', fake_post)
+    monkeypatch.setattr(telegram_outbox.time, 'sleep', sleep)
+    outbox = TelegramOutbox("token", 1, per_chat_interval=1.0)
+
+    assert outbox._deliver(telegram_outbox.OutboxItem(1, "итог"))
+    assert sent_at == [(1, 1000.0), (1, 1007.0)]
+    assert other_waits == pytest.approx([7.0])
+    assert outbox.stats['rate_limited'] == 1
+    assert outbox.stats['retries'] == 1
+    assert outbox.stats['sent'] == 1
+
+
+def test_client_error_is_not_retried(fake_time, monkeypatch):
+    calls = []
+
+    def fake_post(url, data, timeout, retries):
+        calls.append(data['chat_id'])
+        return Response(403, {'description': 'blocked'})
+
+    monkeypatch.setattr(telegram_outbox, 'http_post', fake_post)
+    outbox = TelegramOutbox("token", 1)
+    assert not outbox._deliver(telegram_outbox.OutboxItem(5, "текст"))
+    assert calls == [5]
+    assert outbox.stats['failed'] == 1
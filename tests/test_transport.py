@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""Автомат хоста: размыкание, охлаждение и одна пробная попытка в half-open."""
+
+import pytest
+import requests
+
+import transport
+from transport import CircuitBreaker, CircuitOpenError, Transport
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(transport.time, 'monotonic', clock)
+    monkeypatch.setattr(transport.time, 'sleep', lambda seconds: None)
+    return clock
+
+
+def test_opens_after_threshold_and_closes_after_trial(fake_time):
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=60)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == 'closed'
+
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+    # Охлаждение прошло: пропускается ровно одна пробная попытка
+    fake_time.now += 60
+    assert breaker.state == 'half-open'
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.failures == 0
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_trial_reopens_for_full_cooldown(fake_time):
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=60)
+    for _ in range(3):
+        breaker.record_failure()
+
+    fake_time.now += 60
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+    # Отсчёт охлаждения — от неудачной пробы, а не от первого размыкания
+    fake_time.now += 59
+    assert not breaker.allow()
+    fake_time.now += 1
+    assert breaker.allow()
+
+
+def test_success_resets_failure_count(fake_time):
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+
+
+class FailingSession:
+    def __init__(self):
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        raise requests.ConnectionError("connection refused")
+
+
+def test_transport_stops_calling_open_host(fake_time):
+    client = Transport(max_retries=0, failure_threshold=2, cooldown=60)
+    session = FailingSession()
+    client._sessions['example.com'] = session
+
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            client.get("https://example.com/api")
+    with pytest.raises(CircuitOpenError):
+        client.get("https://example.com/api")
+    assert session.calls == 2
+    assert client.stats()['example.com'] == {'state': 'open', 'failures': 2}
+
+    # Отдельный ключ автомата не затронут отказами хоста
+    with pytest.raises(requests.ConnectionError):
+        client.get("https://example.com/api", circuit='long-poll')
+    assert session.calls == 3
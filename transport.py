@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Общий HTTP-транспорт для всех исходящих запросов.
+
+На каждый хост — постоянная requests.Session с пулом keep-alive
+соединений, ограниченные повторы с джиттером и автомат (circuit breaker),
+который перестаёт обращаться к падающему хосту на время охлаждения.
+Автомат по умолчанию общий на хост; запросы с другим поведением (long
+polling) получают свой ключ circuit, чтобы их таймауты не отключали хост.
+Ответы можно записывать в журнал и воспроизводить из него (capture.py).
+"""
+
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from capture import ReplayResponse, capturable, request_key
+
+POOL_CONNECTIONS = 2         # Пулов на сессию (по схеме/хосту)
+POOL_MAXSIZE = 8             # Соединений в пуле на хост
+MAX_RETRIES = 2              # Повторов после первой попытки
+BACKOFF_BASE = 0.25          # Базовая задержка повтора (секунд)
+BACKOFF_MAX = 2.0            # Потолок задержки повтора (секунд)
+FAILURE_THRESHOLD = 3        # Неудачных вызовов подряд до размыкания
+COOLDOWN_SECONDS = 60        # Сколько хост пропускается после размыкания
+
+RETRY_STATUSES = {500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.RequestException):
+    """Хост временно отключён автоматом — запрос не отправлялся."""
+
+
+def _not_sent(error):
+    """Соединение не установилось — запрос точно не ушёл на сервер."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class CircuitBreaker:
+    """Автомат одного хоста: closed → open → half-open → closed."""
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        """Можно ли отправить запрос. В half-open пропускается одна пробная попытка."""
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class Transport:
+    """Сессии и автоматы по хостам."""
+
+    def __init__(self, max_retries=MAX_RETRIES, pool_maxsize=POOL_MAXSIZE,
+                 failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN_SECONDS):
+        self.max_retries = max_retries
+        self.pool_maxsize = pool_maxsize
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._sessions = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self.capture = None          # CaptureWriter: записывать ответы
+        self.replay = None           # ReplayLog: отвечать из журнала вместо сети
+
+    def session(self, host):
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS,
+                                      pool_maxsize=self.pool_maxsize,
+                                      max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._sessions[host] = session
+            return session
+
+    def breaker(self, key):
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker(self.failure_threshold, self.cooldown)
+                self._breakers[key] = breaker
+            return breaker
+
+    def request(self, method, url, retries=None, circuit=None, **kwargs):
+        """
+        Запрос через сессию хоста. Повторяет сетевые ошибки и статусы
+        RETRY_STATUSES; не-GET запросы повторяются только если соединение
+        не установилось, чтобы не отправить сообщение дважды. circuit —
+        ключ автомата (по умолчанию хост).
+        Возвращает последний ответ или выбрасывает последнюю ошибку.
+        """
+        if self.replay is not None:
+            return self._replay(method, url, kwargs.get('params'))
+
+        host = urlsplit(url).netloc
+        circuit = circuit or host
+        breaker = self.breaker(circuit)
+        if not breaker.allow():
+            raise CircuitOpenError(f"{circuit}: автомат разомкнут")
+
+        session = self.session(host)
+        retries = self.max_retries if retries is None else retries
+        idempotent = method.upper() == 'GET'
+        response = None
+        error = None
+
+        for attempt in range(retries + 1):
+            if attempt:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (attempt - 1)))
+                time.sleep(random.uniform(0, delay))
+            try:
+                response = session.request(method, url, **kwargs)
+                error = None
+            except requests.RequestException as e:
+                response, error = None, e
+                if not idempotent and not _not_sent(e):
+                    break
+                continue
+
+            # 429 — хост жив, паузу по retry_after выдерживает вызывающий код
+            if response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                self._capture(method, url, kwargs.get('params'), response)
+                return response
+            if not idempotent:
+                break
+
+        breaker.record_failure()
+        if error is not None:
+            raise error
+        return response
+
+    def _capture(self, method, url, params, response):
+        if self.capture is not None and method.upper() == 'GET' and capturable(url, params):
+            self.capture.record(request_key(url, params), response.status_code, response.content)
+
+    def _replay(self, method, url, params):
+        # Исходящие сообщения при воспроизведении никуда не уходят
+        if method.upper() != 'GET':
+            return ReplayResponse(200, b'{"ok": true}')
+        if not capturable(url, params):
+            # Такие ответы не записываются — в журнале их нет и не должно быть
+            raise requests.ConnectionError(f"{urlsplit(url).netloc}: не воспроизводится")
+        response = self.replay.respond(request_key(url, params))
+        if response is None:
+            raise requests.ConnectionError(f"{request_key(url, params)}: запись закончилась")
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """Состояние автоматов по ключам (хостам)."""
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {host: {'state': b.state, 'failures': b.failures} for host, b in breakers.items()}
+
+
+# Общий экземпляр для всего процесса
+transport = Transport()
+http_get = transport.get
+http_post = transport.post